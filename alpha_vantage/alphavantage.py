@@ -1,15 +1,44 @@
-import requests
 import os
 from functools import wraps
 import inspect
-# Pandas became an optional dependency, but we still want to track it
+import threading
+import warnings
+# Pandas became an optional dependency, but we still want to track it. Both
+# pandas and requests are only imported once they are needed, so importing
+# the wrapper stays cheap
 try:
-    import pandas
-    _PANDAS_FOUND = True
+    from importlib.util import find_spec
+    _PANDAS_FOUND = find_spec('pandas') is not None
 except ImportError:
-    _PANDAS_FOUND = False
+    # No find_spec (python 2), so we have to import pandas to find it
+    try:
+        import pandas
+        _PANDAS_FOUND = True
+    except ImportError:
+        _PANDAS_FOUND = False
 import csv
 
+from . import instrumentation
+from .jsonstream import TimeSeriesColumns, decode_stream
+# inspect.getargspec was removed in python 3.11, and python 2 has no
+# getfullargspec; both return the args and defaults the decorators use
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+# Bytes of the response decoded at a time by the streaming decode
+_STREAM_CHUNK_SIZE = 65536
+# Attempt of the call in progress in each thread, set by _retry so that the
+# quota store can count retries
+_attempt = threading.local()
+
+
+def _open_quota_store(quota):
+    """ Return the quota store a client counts into (see quota.open_store),
+    importing the store, and sqlite3 with it, only when one is used
+    """
+    if quota is None and not os.getenv('ALPHAVANTAGE_QUOTA_DB'):
+        return None
+    from .quota import open_store
+    return open_store(quota)
+
 
 class AlphaVantage(object):
     """ Base class where the decorators and base function for the other
@@ -22,7 +51,8 @@ class AlphaVantage(object):
         "https://www.alphavantage.co/digital_currency_list/"
 
     def __init__(self, key=None, retries=5, output_format='json',
-                 treat_info_as_error=True, indexing_type='date', proxy=None):
+                 treat_info_as_error=True, indexing_type='date', proxy=None,
+                 quota=None):
         """ Initialize the class
 
         Keyword Arguments:
@@ -37,6 +67,9 @@ class AlphaVantage(object):
             output_format is 'pandas'
             proxy: Dictionary mapping protocol or protocol and hostname to 
             the URL of the proxy.
+            quota: Path of a sqlite file (or a quota.QuotaStore) counting the
+            requests sent with the key, by function and outcome. Defaults to
+            the ALPHAVANTAGE_QUOTA_DB environment variable, if set.
         """
         if key is None:
             key = os.getenv('ALPHAVANTAGE_API_KEY')
@@ -60,6 +93,7 @@ class AlphaVantage(object):
         self._append_type = True
         self.indexing_type = indexing_type
         self.proxy = proxy or {}
+        self.quota = _open_quota_store(quota)
 
     def _retry(func):
         """ Decorator for retrying api calls (in case of errors from the api
@@ -71,11 +105,18 @@ class AlphaVantage(object):
         @wraps(func)
         def _retry_wrapper(self, *args, **kwargs):
             error_message = ""
-            for retry in range(self.retries + 1):
-                try:
-                    return func(self, *args, **kwargs)
-                except ValueError as err:
-                    error_message = str(err)
+            try:
+                for retry in range(self.retries + 1):
+                    _attempt.retry = retry
+                    try:
+                        if retry:
+                            with instrumentation.span('retry', attempt=retry):
+                                return func(self, *args, **kwargs)
+                        return func(self, *args, **kwargs)
+                    except ValueError as err:
+                        error_message = str(err)
+            finally:
+                _attempt.retry = 0
             raise ValueError(str(error_message))
         return _retry_wrapper
 
@@ -90,7 +131,7 @@ class AlphaVantage(object):
         """
 
         # Argument Handling
-        argspec = inspect.getargspec(func)
+        argspec = _getargspec(func)
         try:
             # Asumme most of the cases have a mixed between args and named
             # args
@@ -189,20 +230,25 @@ class AlphaVantage(object):
                 if output_format == 'json':
                     return data, meta_data
                 elif output_format == 'pandas':
-                    if isinstance(data, list):
-                        # If the call returns a list, then we will append them
-                        # in the resulting data frame. If in the future
-                        # alphavantage decides to do more with returning arrays
-                        # this might become buggy. For now will do the trick.
-                        data_array = []
-                        for val in data:
-                            data_array.append([v for _, v in val.items()])
-                        data_pandas = pandas.DataFrame(data_array, columns=[
-                            k for k, _ in data[0].items()])
-                    else:
-                        data_pandas = pandas.DataFrame.from_dict(data,
-                                                                 orient='index',
-                                                                 dtype=float)
+                    import pandas
+                    with instrumentation.span('decode', 'pandas',
+                                              rows=len(data)):
+                        if isinstance(data, TimeSeriesColumns):
+                            data_pandas = data.to_frame()
+                        elif isinstance(data, list):
+                            # If the call returns a list, then we will append them
+                            # in the resulting data frame. If in the future
+                            # alphavantage decides to do more with returning arrays
+                            # this might become buggy. For now will do the trick.
+                            data_array = []
+                            for val in data:
+                                data_array.append([v for _, v in val.items()])
+                            data_pandas = pandas.DataFrame(data_array, columns=[
+                                k for k, _ in data[0].items()])
+                        else:
+                            data_pandas = pandas.DataFrame.from_dict(data,
+                                                                     orient='index',
+                                                                     dtype=float)
                     data_pandas.index.name = 'date'
                     if 'integer' in self.indexing_type:
                         # Set Date as an actual column so a new numerical index
@@ -254,6 +300,27 @@ class AlphaVantage(object):
             value = AlphaVantage._ALPHA_VANTAGE_MATH_MAP.index(matype)
         return value
 
+    def _count_request(self, function, outcome):
+        """ Count a request sent to the api in the quota store, if any
+
+        Keyword Arguments:
+            function: The api function called
+            outcome: The counter of the request's outcome, eg. 'successes'
+        """
+        if self.quota is None:
+            return
+        import sqlite3
+
+        retries = 1 if getattr(_attempt, 'retry', 0) else 0
+        try:
+            self.quota.record(self.key, function, requests=1,
+                              retries=retries, **{outcome: 1})
+        except sqlite3.Error as err:
+            # Counting is best effort: the call itself went through
+            warnings.warn('Could not count the {} request in the quota '
+                          'store {}: {}'.format(function, self.quota.path,
+                                                err))
+
     @_retry
     def _handle_api_call(self, url):
         """ Handle the return call from the  api and return a data and meta_data
@@ -265,18 +332,74 @@ class AlphaVantage(object):
             meta_data_key:  The key for getting the meta data information out
             of the json object
         """
-        response = requests.get(url, proxies=self.proxy)
+        import requests
+        function = url.partition('function=')[2].partition('&')[0]
+        # Responses converted to pandas are decoded as they arrive, with
+        # their time series read straight into columns of floats
+        stream = 'pandas' in self.output_format.lower()
+        try:
+            with instrumentation.span('fetch', function) as fetch:
+                response = requests.get(url, proxies=self.proxy,
+                                        stream=stream)
+                if not stream:
+                    fetch.add(bytes=len(response.content))
+        except requests.exceptions.RequestException:
+            self._count_request(function, 'errors')
+            raise
         if 'json' in self.output_format.lower() or 'pandas' in \
                 self.output_format.lower():
-            json_response = response.json()
+            try:
+                with instrumentation.span('decode', function) as decode:
+                    if stream:
+                        json_response = decode_stream(_counted(
+                            response.iter_content(_STREAM_CHUNK_SIZE),
+                            decode))
+                    else:
+                        decode.add(bytes=len(response.content))
+                        json_response = response.json()
+            except (ValueError, requests.exceptions.RequestException):
+                self._count_request(function, 'errors')
+                raise
+            finally:
+                response.close()
+            self._count_request(function, _outcome(json_response))
             if "Error Message" in json_response:
                 raise ValueError(json_response["Error Message"])
             elif "Information" in json_response and self.treat_info_as_error:
                 raise ValueError(json_response["Information"])
             return json_response
         else:
+            if self.quota is not None:
+                # Errors and rate limit notes are json, even for csv calls
+                outcome = 'successes'
+                if response.text.lstrip().startswith('{'):
+                    try:
+                        outcome = _outcome(response.json())
+                    except ValueError:
+                        outcome = 'errors'
+                self._count_request(function, outcome)
             csv_response = csv.reader(response.text.splitlines())
             if not csv_response:
                 raise ValueError(
                     'Error getting data from the api, no return was given.')
             return csv_response
+
+
+def _outcome(json_response):
+    """ Return the quota counter of an api response: 'errors', 'rate_limited'
+    (the api answers calls over the limits with a note or information) or
+    'successes'
+    """
+    if "Error Message" in json_response:
+        return 'errors'
+    if "Note" in json_response or "Information" in json_response:
+        return 'rate_limited'
+    return 'successes'
+
+
+def _counted(chunks, span):
+    """ Yield the chunks of a response, counting their bytes in a span
+    """
+    for chunk in chunks:
+        span.add(bytes=len(chunk))
+        yield chunk
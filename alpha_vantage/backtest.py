@@ -1,82 +1,114 @@
-from run import initialize, sti_tickers
+import time
+from pprint import pprint
 
-def backtest_menu():
+from stitap_ta_screens import sti_stocks
+from stitap_backtest import backtest, load_backtest_prices, sessions_per_year
+
+# Settings of each strategy, with their types and default values
+strategy_settings = {"MACD":[("fast_span", int, 12), ("slow_span", int, 26), ("signal_span", int, 9)],
+					 "RSI":[("timeframe", int, 14), ("overbought_level", float, 70), ("oversold_level", float, 30)],
+					 "STOCHRSI":[("timeframe", int, 14), ("overbought_level", float, 0.8), ("oversold_level", float, 0.2)]}
+
+def _select(prompt, options):
 	"""
-	Displays menu for backtests.
+	Displays numbered options and returns the one selected.
 	Requires user input.
 	"""
 
-	timeframe_input_dict = {
-							1:"daily",
-							2:"weekly",
-							3:"monthly"
-							}
-
-	print("----------STITAP TECHNICAL ANALYSIS BACKTEST----------", end = "\n"*3)
+	print(prompt, end = "\n"*3)
 	time.sleep(0.1)
 
-	print("Please enter your desired timeframe for backtesting (eg. type 1 for daily timeframe) :", end = "\n"*3)
-	time.sleep(0.1)
-	
 	while True:
 
-		timeframe = input("""
-						1 - daily
-						2 - weekly
-						3 - monthly
-						""")
+		selected = input("\n".join(f"{number} - {option}" for number, option in options.items()) + "\n\n")
 
-		if int(timeframe) in timeframe_input_dict:
+		if selected.isdigit() and int(selected) in options:
 			time.sleep(0.1)
 			print("\n"*3)
-			print(f"{timeframe_input_dict[timeframe]} TIMEFRAME SELECTED", end = "\n"*3)
+			print(f"{options[int(selected)].upper()} SELECTED", end = "\n"*3)
 			time.sleep(0.1)
-			break
+			return options[int(selected)]
 
 		else:
 			print("\n"*3)
 			print("Invalid input. Please try again.", end = "\n"*3)
 
-	initialize(backtest = timeframe_input_dict[timeframe])
-	backtest_plot_menu()
-
-def backtest_plot_menu():
+def _input_setting(name, input_type, default):
 	"""
-	Displays menu for backtest actions.
+	Returns a setting entered by the user, or its default value if nothing is entered.
 	Requires user input.
-	Currently only historical stock price plots are supported.
 	"""
 
-	company_ticker_dict = {
-						1:"CityDev", 2:"DBS", 3:"UOL", 4:"SingTel", 5:"UOB",
-						6:"Keppel Corp", 7:"CapitaLand", 8:"OCBC Bank", 9:"Genting Sing", 10:"Venture",
-						11:"CapitaMall Trust", 12:"YZJ Shipbldg SGD", 13:"CapitaCom Trust", 14:"Ascendas Reit", 15:"ComfortDelGro",
-						16:"SIA", 17:"Jardine C&C", 18:"SPH", 19:"SGX", 20:"ThaiBev",
-						21:"ST Engineering", 22:"Sembcorp Ind", 23:"Wilmar Intl", 24:"StarHub", 25:"SATS",
-						26:"HongkongLand USD", 27:"JSH USD", 28:"JMH USD", 29:"HPH Trust USD", 30:"Golden Agri-Res"
-						}
+	while True:
 
-	print("Please enter your desired stock for backtesting (eg. type 1 for CityDev stock) :", end = "\n"*3)
-	time.sleep(0.1)
+		setting = input(f"{name} (default {default}): ")
 
-	while True:
+		if setting == "":
+			return default
 
-		company_ticker = input()
+		try:
+			return input_type(setting)
 
-		if company_ticker in company_ticker_dict:
-			time.sleep(0.1)
+		except ValueError:
 			print("\n"*3)
-			print(f"{company_ticker_dict[company_ticker]} SELECTED", end = "\n"*3)
-			time.sleep(0.1)
-			print(f"PLOTTING PRICE CHART FOR {company_ticker_dict[company_ticker]}:", end = "\n"*3)
-			break
+			print(f"Supported value: {input_type.__name__}. Please try again.", end = "\n"*3)
 
-		else:
-			print("\n"*3)
-			print("Invalid input. Please try again.", end = "\n"*3)
+def backtest_menu():
+	"""
+	Displays menu for backtests.
+	Requires user input.
+	"""
+
+	print("----------STITAP TECHNICAL ANALYSIS BACKTEST----------", end = "\n"*3)
+	time.sleep(0.1)
+
+	timeframe = _select("Please enter your desired timeframe for backtesting (eg. type 1 for daily timeframe) :",
+						{1:"daily", 2:"weekly", 3:"monthly"})
+
+	if input("Fetch the full history of the 30 STI stocks from Alpha Vantage first? (y/n)\n\n").lower() == "y":
+		from run import BacktestInitializer
+
+		BacktestInitializer(timeframe).initialize()
+
+	dates, prices, stock_names = load_backtest_prices(sti_stocks, timeframe=timeframe)
+	print(f"LOADED: {len(stock_names)} STI STOCKS, {len(dates)} SESSIONS ({dates[0]:%Y-%m-%d} TO {dates[-1]:%Y-%m-%d})", end = "\n"*3)
+
+	backtest_strategy_menu(dates, prices, stock_names, timeframe)
+
+def backtest_strategy_menu(dates, prices, stock_names, timeframe):
+	"""
+	Displays menu for backtest strategies, and runs the strategy selected on all stocks.
+	Requires user input.
+	"""
+
+	strategy = _select("Please enter your desired strategy for backtesting (eg. type 1 for MACD) :",
+					   {1:"MACD", 2:"RSI", 3:"STOCHRSI"})
+
+	print("Please enter your settings (press enter for the default value) :", end = "\n"*3)
+	settings = {name: _input_setting(name, input_type, default) for name, input_type, default in strategy_settings[strategy]}
+	fees_bps = _input_setting("fees_bps", float, 10)
+	slippage_bps = _input_setting("slippage_bps", float, 5)
+
+	start = time.perf_counter()
+	result = backtest(prices, strategy, fees_bps=fees_bps, slippage_bps=slippage_bps, stock_names=stock_names,
+					  dates=dates, periods_per_year=sessions_per_year[timeframe], **settings)
+	elapsed = time.perf_counter() - start
+
+	print("\n"*3)
+	print(f"-----{strategy} BACKTEST RESULTS ({elapsed:.3f}s)-----", end = "\n"*3)
+	time.sleep(0.1)
+	print("-----STOCKS-----", end = "\n"*3)
+	print(result.stock_summary().sort_values("total_return_pct", ascending = False))
+	print("\n"*2)
+	print("-----PORTFOLIO (EQUAL ALLOCATION)-----", end = "\n"*3)
+	pprint(result.portfolio_summary())
+	print("-"*20, end = "\n"*3)
+
+	if input("Backtest another strategy? (y/n)\n\n").lower() == "y":
+		backtest_strategy_menu(dates, prices, stock_names, timeframe)
 
 
 if __name__ == "__main__":
 	backtest_menu()
-	
-	time.sleep(10000)
\ No newline at end of file
+
+	time.sleep(10000)
@@ -0,0 +1,302 @@
+""" Per-stage timing and resource instrumentation.
+
+Code to measure is wrapped in spans, named after its stage (eg. 'fetch',
+'retry', 'decode', 'store', 'wrangle', 'combine', 'prepare' or 'screen')
+and an optional low-cardinality detail (eg. the api function or the screen's
+class). Each span records its wall time, the CPU time of its thread, and the
+bytes and rows it processed; spans are aggregated per stage and detail, and
+exported as a json run report or a Prometheus textfile (for node_exporter's
+textfile collector).
+
+Instrumentation is disabled by default, and span() then returns a shared
+no-op span, so instrumented code only pays for a function call:
+
+    from alpha_vantage import instrumentation
+
+    instrumentation.enable(report_path='run.json',
+                           prometheus_path='alpha_vantage.prom')
+    with instrumentation.span('store', rows=len(data)):
+        data.to_csv(path)
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# CPU time of the process (time.clock on Python 2, where it is the CPU
+# time on Unix), CPU time of the calling thread where available, and a wall
+# clock for durations
+_process_time = getattr(time, 'process_time', None) or time.clock
+_thread_time = getattr(time, 'thread_time', _process_time)
+_perf_counter = getattr(time, 'perf_counter', time.time)
+# Replaces a file atomically (os.rename does on Unix, but not over an
+# existing file on Windows)
+_replace = getattr(os, 'replace', os.rename)
+
+_recorder = None
+
+
+class _NoopSpan(object):
+    """ Span returned while instrumentation is disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, bytes=0, rows=0):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span(object):
+    """ A timed stage, used as a context manager
+    """
+    __slots__ = ('_recorder', 'stage', 'detail', 'attributes', 'bytes',
+                 'rows', 'parent', 'started', '_wall', '_cpu')
+
+    def __init__(self, recorder, stage, detail, attributes, bytes=0, rows=0):
+        self._recorder = recorder
+        self.stage = stage
+        self.detail = detail
+        self.attributes = attributes
+        self.bytes = bytes
+        self.rows = rows
+        self.parent = None
+
+    def add(self, bytes=0, rows=0):
+        """ Count bytes transferred and rows processed by the span
+
+        Keyword Arguments:
+            bytes: Number of bytes (default 0)
+            rows: Number of rows (default 0)
+        """
+        self.bytes += bytes
+        self.rows += rows
+
+    def __enter__(self):
+        stack = self._recorder._stack()
+        if stack:
+            self.parent = stack[-1].stage
+        stack.append(self)
+        self.started = time.time()
+        self._cpu = _thread_time()
+        self._wall = _perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = _perf_counter() - self._wall
+        cpu = _thread_time() - self._cpu
+        self._recorder._stack().pop()
+        self._recorder._finish(self, wall, cpu, exc_type is not None)
+        return False
+
+
+class Recorder(object):
+    """ Aggregates the finished spans, and keeps the most recent ones
+    """
+
+    def __init__(self, max_spans=10000, report_path=None,
+                 prometheus_path=None):
+        """
+        Keyword Arguments:
+            max_spans: Number of most recent spans kept for the run report,
+                besides the aggregates (default 10000)
+            report_path: File the json run report is written to by
+                write_reports() (default None)
+            prometheus_path: File the Prometheus textfile is written to by
+                write_reports() (default None)
+        """
+        self.report_path = report_path
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self._cpu = _process_time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self._spans = deque(maxlen=max_spans)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _finish(self, span, wall, cpu, error):
+        record = {'stage': span.stage, 'detail': span.detail,
+                  'parent': span.parent, 'started': span.started,
+                  'wall_seconds': wall, 'cpu_seconds': cpu,
+                  'bytes': span.bytes, 'rows': span.rows, 'error': error}
+        if span.attributes:
+            record['attributes'] = span.attributes
+        with self._lock:
+            stage = self._stages.get((span.stage, span.detail))
+            if stage is None:
+                stage = self._stages[(span.stage, span.detail)] = {
+                    'stage': span.stage, 'detail': span.detail, 'calls': 0,
+                    'errors': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                    'max_wall_seconds': 0.0, 'bytes': 0, 'rows': 0}
+            stage['calls'] += 1
+            stage['errors'] += error
+            stage['wall_seconds'] += wall
+            stage['cpu_seconds'] += cpu
+            stage['max_wall_seconds'] = max(stage['max_wall_seconds'], wall)
+            stage['bytes'] += span.bytes
+            stage['rows'] += span.rows
+            self._spans.append(record)
+
+    def stages(self):
+        """ Return the aggregates of every stage and detail, in the order
+        they were first finished
+        """
+        with self._lock:
+            return [dict(stage) for stage in self._stages.values()]
+
+    def report(self):
+        """ Return the run report: the run's wall and CPU time, its peak
+        resident memory (where the resource module is available), the
+        aggregates of every stage and the most recent spans
+        """
+        run = {'started': self.started,
+               'wall_seconds': time.time() - self.started,
+               'cpu_seconds': _process_time() - self._cpu,
+               'max_rss_bytes': _max_rss_bytes()}
+        with self._lock:
+            spans = list(self._spans)
+        return {'run': run, 'stages': self.stages(), 'spans': spans}
+
+    def prometheus(self, prefix='alpha_vantage'):
+        """ Return the aggregates in the Prometheus text exposition format
+        """
+        metrics = [('calls', 'Number of finished spans'),
+                   ('errors', 'Number of spans which raised'),
+                   ('wall_seconds', 'Wall time spent'),
+                   ('cpu_seconds', 'CPU time spent'),
+                   ('bytes', 'Bytes transferred'),
+                   ('rows', 'Rows processed')]
+        stages = self.stages()
+        lines = []
+        for key, description in metrics:
+            metric = '{}_stage_{}_total'.format(prefix, key)
+            lines.append('# HELP {} {} in each stage'.format(metric,
+                                                            description))
+            lines.append('# TYPE {} counter'.format(metric))
+            for stage in stages:
+                lines.append('{}{{stage="{}",detail="{}"}} {}'.format(
+                    metric, _label(stage['stage']),
+                    _label(stage['detail'] or ''), stage[key]))
+        return '\n'.join(lines) + '\n'
+
+
+def enable(max_spans=10000, report_path=None, prometheus_path=None):
+    """ Start recording spans, and return the recorder
+
+    Keyword Arguments:
+        max_spans: Number of most recent spans kept for the run report
+            (default 10000)
+        report_path: File the json run report is written to by
+            write_reports() and at exit (default None)
+        prometheus_path: File the Prometheus textfile is written to by
+            write_reports() and at exit (default None)
+    """
+    global _recorder
+    _recorder = Recorder(max_spans=max_spans, report_path=report_path,
+                         prometheus_path=prometheus_path)
+    if report_path or prometheus_path:
+        atexit.register(write_reports)
+    return _recorder
+
+
+def disable():
+    """ Stop recording spans
+    """
+    global _recorder
+    _recorder = None
+    # atexit.unregister() is Python 3 only; write_reports() does nothing
+    # once disabled anyway
+    if hasattr(atexit, 'unregister'):
+        atexit.unregister(write_reports)
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def span(stage, detail=None, bytes=0, rows=0, **attributes):
+    """ Return a span timing a stage, to be used as a context manager (a
+    shared no-op span while instrumentation is disabled)
+
+    Positional Arguments:
+        stage: Name of the stage, eg. 'fetch'
+
+    Keyword Arguments:
+        detail: Low-cardinality detail the stage is aggregated by, eg. the
+            api function (default None)
+        bytes: Bytes transferred, if already known (default 0)
+        rows: Rows processed, if already known (default 0)
+        attributes: Other values kept with the span (not aggregated), eg.
+            symbol='MSFT'
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _NOOP_SPAN
+    return Span(recorder, stage, detail, attributes, bytes, rows)
+
+
+def report():
+    """ Return the run report of the recorder (None while disabled)
+    """
+    return None if _recorder is None else _recorder.report()
+
+
+def write_json(path):
+    """ Write the json run report to a file
+    """
+    _write_atomically(path, json.dumps(_recorder.report(), indent=2))
+
+
+def write_prometheus(path, prefix='alpha_vantage'):
+    """ Write the aggregates as a Prometheus textfile (replaced atomically,
+    as node_exporter's textfile collector requires)
+    """
+    _write_atomically(path, _recorder.prometheus(prefix))
+
+
+def write_reports():
+    """ Write the reports to the paths given to enable()
+    """
+    if _recorder is None:
+        return
+    if _recorder.report_path:
+        write_json(_recorder.report_path)
+    if _recorder.prometheus_path:
+        write_prometheus(_recorder.prometheus_path)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if os.uname()[0] == 'Darwin' else max_rss * 1024
+
+
+def _write_atomically(path, text):
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'w') as report_file:
+        report_file.write(text)
+    _replace(temporary_path, path)
@@ -0,0 +1,262 @@
+""" Streaming decode of api responses into typed columns.
+
+A full history (outputsize=full, or the multi-market digital currency
+series) is one large json object of dates to objects of numeric strings.
+Decoded with json.loads, every value is first kept as a string in a nested
+dictionary, which the pandas conversion then reads again into floats.
+
+decode_stream() parses the response as it arrives instead: the small values
+(meta data, quotes, messages) are decoded as usual, while each time series
+(an object whose values are objects) is read one entry at a time, with its
+values converted straight into arrays of doubles. Only one chunk of the
+response and the arrays are held at a time.
+"""
+import codecs
+import json
+import re
+from array import array
+from itertools import chain
+from json.decoder import scanstring
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# The start of an object, up to the first character of its first value
+_FIRST_VALUE = re.compile(r'\{[ \t\n\r]*"(?:[^"\\]|\\.)*"'
+                          r'[ \t\n\r]*:[ \t\n\r]*(.)', re.S)
+_DECODER = json.JSONDecoder()
+_NAN = float('nan')
+
+
+class TimeSeriesColumns(object):
+    """ A time series decoded into columns: its keys (eg. dates, in the
+    order of the response), the names of its fields and an array of doubles
+    per field (NaN where an entry lacks the field)
+    """
+
+    def __init__(self):
+        self.index = []
+        self.columns = []
+        self.values = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, key, entry):
+        """ Add an entry, eg. ('2018-07-18', {'1. open': '98.1300', ...})
+        """
+        if not isinstance(entry, dict):
+            raise ValueError('Entry {} of the time series is not an '
+                             'object'.format(key))
+        values = self.values
+        n_rows = len(self.index)
+        for name, value in entry.items():
+            column = values.get(name)
+            if column is None:
+                column = values[name] = array('d', [_NAN]) * n_rows
+                self.columns.append(name)
+            elif len(column) != n_rows:
+                # A field missing from the previous entries
+                column.extend([_NAN] * (n_rows - len(column)))
+            column.append(float(value))
+        self.index.append(key)
+
+    def extend(self, entries):
+        """ Add the entries of a decoded object, eg. {'2018-07-18':
+        {'1. open': '98.1300', ...}, ...}
+        """
+        rows = list(entries.values())
+        if self.columns:
+            fields = tuple(self.columns)
+            if all(map(fields.__eq__, map(tuple, rows))) and \
+                    all(isinstance(row, dict) for row in rows):
+                # Every entry has the fields of the previous ones, in order
+                self._pad()
+                flat = array('d', map(float, chain.from_iterable(
+                    map(dict.values, rows))))
+                step = len(self.columns)
+                for offset, name in enumerate(self.columns):
+                    self.values[name].extend(flat[offset::step])
+                self.index.extend(entries)
+                return
+        for key, entry in entries.items():
+            self.append(key, entry)
+
+    def _pad(self):
+        n_rows = len(self.index)
+        for column in self.values.values():
+            if len(column) != n_rows:
+                column.extend([_NAN] * (n_rows - len(column)))
+
+    def to_frame(self):
+        """ Return the columns as a pandas dataframe of floats indexed by the
+        keys, as pandas.DataFrame.from_dict(data, orient='index',
+        dtype=float) returns the decoded object
+        """
+        import numpy
+        import pandas
+
+        self._pad()
+        return pandas.DataFrame(
+            {name: numpy.frombuffer(self.values[name], dtype=float)
+             for name in self.columns},
+            index=pandas.Index(self.index), columns=self.columns)
+
+
+class _Reader(object):
+    """ Text of a response read chunk by chunk, with the position parsed up
+    to
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.position = 0
+        self.bytes = 0
+        self.exhausted = False
+
+    def read(self):
+        """ Append the next chunk to the text (dropping what was parsed),
+        returning False at the end of the response
+        """
+        if self.exhausted:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            text = self._decoder.decode(b'', final=True)
+        else:
+            self.bytes += len(chunk)
+            text = self._decoder.decode(chunk)
+        self.text = self.text[self.position:] + text
+        self.position = 0
+        return True
+
+    def skip_whitespace(self):
+        """ Move past whitespace and return the next character ('' at the end
+        of the response)
+        """
+        while True:
+            self.position = _WHITESPACE.match(self.text,
+                                              self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.read():
+                return ''
+
+    def expect(self, characters):
+        character = self.skip_whitespace()
+        if not character or character not in characters:
+            raise ValueError('Expecting one of {!r} within the first {} '
+                             'bytes of the response, got {!r}'.format(
+                                 characters, self.bytes, character))
+        self.position += 1
+        return character
+
+    def string(self):
+        self.expect('"')
+        while True:
+            try:
+                value, self.position = scanstring(self.text, self.position)
+                return value
+            except ValueError:
+                if not self.read():
+                    raise
+
+    def value(self):
+        """ Decode the next value, reading until it is complete
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                value, self.position = _DECODER.raw_decode(self.text,
+                                                           self.position)
+                return value
+            except ValueError:
+                # Incomplete (or invalid, once the response is read): read
+                # at least as much again before decoding from the start
+                remaining = len(self.text) - self.position
+                target = max(2 * remaining, remaining + 1)
+                while len(self.text) - self.position < target:
+                    if not self.read():
+                        break
+                else:
+                    continue
+                value, self.position = _DECODER.raw_decode(self.text,
+                                                           self.position)
+                return value
+
+    def starts_time_series(self):
+        """ Return whether the next value is an object whose first value is
+        an object (the entries of a time series)
+        """
+        while True:
+            match = _FIRST_VALUE.match(self.text, self.position)
+            if match is not None:
+                return match.group(1) == '{'
+            if len(self.text) - self.position > 4096 or not self.read():
+                return False
+
+
+def decode_stream(chunks):
+    """ Decode a json api response from an iterable of bytes chunks (eg.
+    response.iter_content()), returning the same object as json.loads
+    except that its time series are TimeSeriesColumns
+
+    Only the values of the top level object are streamed; any other
+    document is decoded as a whole.
+
+    Positional Arguments:
+        chunks: The response's bytes, in chunks
+    """
+    reader = _Reader(chunks)
+    if reader.skip_whitespace() != '{':
+        return reader.value()
+    reader.position += 1
+    decoded = {}
+    if reader.skip_whitespace() == '}':
+        reader.position += 1
+        return decoded
+    while True:
+        key = reader.string()
+        reader.expect(':')
+        reader.skip_whitespace()
+        if reader.starts_time_series():
+            decoded[key] = _time_series(reader)
+        else:
+            decoded[key] = reader.value()
+        if reader.expect(',}') == '}':
+            break
+    if reader.skip_whitespace():
+        raise ValueError('Extra data at the end of the response')
+    return decoded
+
+
+def _time_series(reader):
+    series = TimeSeriesColumns()
+    reader.expect('{')
+    if reader.skip_whitespace() == '}':
+        reader.position += 1
+        return series
+    failed = None
+    while True:
+        # The entries read so far, up to the last one followed by a comma,
+        # are decoded at once with the json module, then the next one (which
+        # may need more of the response) on its own
+        end = reader.text.rfind('},', reader.position) + 1
+        if end > reader.position and end != failed:
+            try:
+                entries = json.loads('{' + reader.text[reader.position:end] +
+                                     '}')
+            except ValueError:
+                # eg. a string holding "},", so the entries are read one at
+                # a time until the next chunk
+                failed = end
+            else:
+                series.extend(entries)
+                reader.position = end + 1
+        key = reader.string()
+        reader.expect(':')
+        series.append(key, reader.value())
+        if reader.expect(',}') == '}':
+            series._pad()
+            return series
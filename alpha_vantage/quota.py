@@ -0,0 +1,309 @@
+""" Api quota accounting.
+
+Alpha Vantage limits the calls of each api key per minute and per day, and
+every request counts against them: retries, technical indicators and the
+full histories behind weekly and monthly data included. A QuotaStore keeps
+per-key, per-function counters of what was spent in a small sqlite file:
+
+    requests      requests sent to the api
+    successes     requests answered with data
+    retries       requests which retried a failed one
+    rate_limited  requests answered with a "Note" or "Information" message
+                  (the api's rate limit replies) instead of data
+    errors        requests answered with an "Error Message", or which failed
+    cache_hits    calls answered from a local cache, which spent no quota
+
+Clients count into one when given its path (or the ALPHAVANTAGE_QUOTA_DB
+environment variable is set):
+
+    ts = TimeSeries(key='...', quota='quota.sqlite')
+
+and the counters are queried with QuotaStore.usage() or reported with
+
+    python -m alpha_vantage.quota quota.sqlite --by function --days 7
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+COUNTERS = ['requests', 'successes', 'retries', 'rate_limited', 'errors',
+            'cache_hits']
+GROUPS = ['key', 'function', 'day']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    key TEXT NOT NULL,
+    function TEXT NOT NULL,
+    day TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, function, day)
+);
+CREATE TABLE IF NOT EXISTS minutes (
+    key TEXT NOT NULL,
+    minute TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, minute)
+);
+"""
+
+
+def key_label(key):
+    """ Return the label an api key is stored under: its last 4 characters,
+    so that the store does not hold usable keys
+    """
+    return '...' + key[-4:]
+
+
+class QuotaStore(object):
+    """ Per-key, per-function api usage counters, kept in a sqlite file
+
+    Counts are added in one short transaction each, so several processes
+    (eg. the screener and a backtest fetching data) can share a file.
+    """
+
+    def __init__(self, path, minute_retention_days=7):
+        """
+        Positional Arguments:
+            path: sqlite file the counters are kept in (created if missing)
+
+        Keyword Arguments:
+            minute_retention_days: Days the per-minute request counts behind
+                peak_minutes() are kept for (default 7)
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        oldest = _minute(time.time() - minute_retention_days * 86400)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executescript(_SCHEMA)
+                connection.execute('DELETE FROM minutes WHERE minute < ?',
+                                   (oldest,))
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, key, function, timestamp=None, **counts):
+        """ Add to the counters of an api key and function
+
+        Positional Arguments:
+            key: Alpha Vantage api key (stored as key_label(key))
+            function: Alpha Vantage function, eg. 'TIME_SERIES_DAILY'
+
+        Keyword Arguments:
+            timestamp: Unix time of the call (default now)
+            counts: Amounts to add to the COUNTERS, eg. requests=1,
+                successes=1
+        """
+        unknown = set(counts) - set(COUNTERS)
+        if unknown:
+            raise ValueError('Counters {} are not supported, use {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(COUNTERS)))
+        if timestamp is None:
+            timestamp = time.time()
+        label = key_label(key)
+        values = [counts.get(counter, 0) for counter in COUNTERS]
+        connection = self._connect()
+        try:
+            # An insert of the row (if missing) then an update, rather than
+            # an upsert, which needs SQLite 3.24
+            with connection:
+                day = _day(timestamp)
+                connection.execute(
+                    'INSERT OR IGNORE INTO usage (key, function, day) '
+                    'VALUES (?, ?, ?)', (label, function, day))
+                connection.execute(
+                    'UPDATE usage SET {} WHERE key = ? AND function = ? AND '
+                    'day = ?'.format(', '.join('{0} = {0} + ?'.format(counter)
+                                               for counter in COUNTERS)),
+                    values + [label, function, day])
+                if counts.get('requests'):
+                    minute = _minute(timestamp)
+                    connection.execute(
+                        'INSERT OR IGNORE INTO minutes (key, minute) '
+                        'VALUES (?, ?)', (label, minute))
+                    connection.execute(
+                        'UPDATE minutes SET requests = requests + ? '
+                        'WHERE key = ? AND minute = ?',
+                        (counts['requests'], label, minute))
+        finally:
+            connection.close()
+
+    def usage(self, by=('key', 'function'), key=None, function=None,
+              since=None, until=None):
+        """ Return the counters summed by groups, most requests first, as a
+        list of dictionaries with the group columns and the COUNTERS
+
+        Keyword Arguments:
+            by: Columns to group by, any of GROUPS (default ('key',
+                'function'))
+            key: Only count this api key (default None, all keys)
+            function: Only count this function (default None, all)
+            since: First day counted, 'YYYY-MM-DD' (default None)
+            until: Last day counted, 'YYYY-MM-DD' (default None)
+        """
+        by = list(by)
+        unknown = set(by) - set(GROUPS)
+        if unknown:
+            raise ValueError('Groups {} are not supported, use {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(GROUPS)))
+        conditions, parameters = _conditions(key=key, function=function,
+                                             since=since, until=until)
+        query = 'SELECT {} FROM usage{}{} ORDER BY requests DESC{}'.format(
+            ', '.join(by + ['SUM({0}) AS {0}'.format(counter)
+                            for counter in COUNTERS]),
+            conditions,
+            ' GROUP BY ' + ', '.join(by) if by else '',
+            ''.join(', ' + column for column in by))
+        connection = self._connect()
+        try:
+            rows = connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+        columns = by + COUNTERS
+        return [dict(zip(columns, row)) for row in rows
+                if row[len(by)] is not None]
+
+    def peak_minutes(self, key=None, since=None, n=5):
+        """ Return the n minutes with the most requests (of one api key, or
+        of each), as a list of dictionaries of key, minute and requests
+
+        Keyword Arguments:
+            key: Only count this api key (default None, all keys)
+            since: First day counted, 'YYYY-MM-DD' (default None)
+            n: Number of minutes (default 5)
+        """
+        conditions, parameters = _conditions(key=key, minute=since)
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT key, minute, requests FROM minutes{} '
+                'ORDER BY requests DESC, minute DESC LIMIT ?'.format(
+                    conditions), parameters + [n]).fetchall()
+        finally:
+            connection.close()
+        return [dict(zip(['key', 'minute', 'requests'], row)) for row in rows]
+
+
+def open_store(quota):
+    """ Return the QuotaStore a client counts into: quota itself, one on its
+    path, or one on the ALPHAVANTAGE_QUOTA_DB environment variable's path
+    when quota is None (None if that is not set either)
+    """
+    if quota is None:
+        quota = os.getenv('ALPHAVANTAGE_QUOTA_DB') or None
+    if quota is None or isinstance(quota, QuotaStore):
+        return quota
+    return QuotaStore(quota)
+
+
+def _day(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+
+
+def _minute(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def _conditions(key=None, function=None, since=None, until=None,
+                minute=None):
+    conditions, parameters = [], []
+    if key is not None:
+        conditions.append('key = ?')
+        parameters.append(key_label(key))
+    if function is not None:
+        conditions.append('function = ?')
+        parameters.append(function)
+    if since is not None:
+        conditions.append('day >= ?')
+        parameters.append(since)
+    if until is not None:
+        conditions.append('day <= ?')
+        parameters.append(until)
+    if minute is not None:
+        conditions.append('minute >= ?')
+        parameters.append(minute)
+    if not conditions:
+        return '', parameters
+    return ' WHERE ' + ' AND '.join(conditions), parameters
+
+
+def format_report(rows, by, per_day_limit=None):
+    """ Return the rows of QuotaStore.usage() as a text table, with the share
+    of a daily limit each group's requests used when it is given
+    """
+    columns = list(by) + COUNTERS
+    table = [columns + (['limit_used'] if per_day_limit else [])]
+    for row in rows:
+        line = [str(row[column]) for column in columns]
+        if per_day_limit:
+            line.append('{:.0%}'.format(row['requests'] / per_day_limit))
+        table.append(line)
+    widths = [max(len(line[index]) for line in table)
+              for index in range(len(table[0]))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in
+                               zip(line, widths)).rstrip()
+                     for line in table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Reports the api quota spent, from a quota store')
+    parser.add_argument('path', nargs='?',
+                        default=os.getenv('ALPHAVANTAGE_QUOTA_DB'),
+                        help='sqlite file of the counters (default the '
+                             'ALPHAVANTAGE_QUOTA_DB environment variable)')
+    parser.add_argument('--by', default='key,function',
+                        help='comma separated groups among {} (default '
+                             'key,function)'.format(','.join(GROUPS)))
+    parser.add_argument('--days', type=int, default=None,
+                        help='only count the last days, today included '
+                             '(default all)')
+    parser.add_argument('--key', default=None, help='only count this api key')
+    parser.add_argument('--function', default=None,
+                        help='only count this function, eg. '
+                             'TIME_SERIES_DAILY_ADJUSTED')
+    parser.add_argument('--per-day-limit', type=int, default=None,
+                        help="requests per day of the key's plan, to show "
+                             "the share each group used (use with --by day)")
+    parser.add_argument('--peak-minutes', type=int, default=0,
+                        help='also list the minutes with the most requests')
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error('the path of the quota store is required')
+    if not os.path.exists(args.path):
+        parser.error('{} does not exist'.format(args.path))
+    store = QuotaStore(args.path)
+    since = None
+    if args.days is not None:
+        since = (datetime.now() - timedelta(days=args.days - 1)).strftime(
+            '%Y-%m-%d')
+    by = args.by.split(',') if args.by else []
+    try:
+        rows = store.usage(by=by, key=args.key, function=args.function,
+                           since=since)
+    except ValueError as err:
+        parser.error(str(err))
+    print(format_report(rows, by, args.per_day_limit))
+    if args.peak_minutes:
+        print('')
+        for peak in store.peak_minutes(key=args.key, since=since,
+                                       n=args.peak_minutes):
+            print('{key}  {minute}  {requests}'.format(**peak))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
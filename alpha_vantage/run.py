@@ -1,22 +1,22 @@
 from abc import ABC, abstractmethod
+import os
 import time
-from datetime import datetime
 import json
 import decimal
 from pprint import pprint
 
-import pandas as pd
-import numpy as np
-
 from alpha_vantage.timeseries import TimeSeries
 from alpha_vantage.techindicators import TechIndicators
+from alpha_vantage.foreignexchange import ForeignExchange
+from alpha_vantage import instrumentation
 from stitap_screens import TopPricePctChangeScreen, TopVolumePctChangeScreen
 from stitap_ta_menu import TechnicalAnalysisMenu
 from stitap_ta_screens import PrepareTechnicalAnalysis, MACDScreener, RSIScreener, StochRSIScreener
-
-
-sg_public_holidays_dates = ["2018-01-01", "2018-02-16", "2018-03-30", "2018-05-01", "2018-05-29",
-					  		"2018-06-15", "2018-08-09", "2018-08-22", "2018-11-06", "2018-12-25"]
+from stitap_loader import load_stock_csvs, read_stock_csv
+from stitap_resample import resample_daily, resample_aggregations, resample_frequencies
+from stitap_returns import ReturnEngine, parse_periods, pct_change_column
+from stitap_fx import FXRates
+from stitap_adjust import daily_columns, extend_history
 
 sti_stocks = {"CityDev":"C09.SI", "DBS":"D05.SI", "UOL":"U14.SI", "SingTel":"Z74.SI", "UOB":"U11.SI",
 				"Keppel Corp":"BN4.SI", "CapitaLand":"C31.SI", "OCBC Bank":"O39.SI", "Genting Sing":"G13.SI", "Venture":"V03.SI",
@@ -28,7 +28,12 @@ sti_stocks = {"CityDev":"C09.SI", "DBS":"D05.SI", "UOL":"U14.SI", "SingTel":"Z74
 
 class Initializer(ABC):
 	"""Abstract base class for initializing the program
+
+	Only daily data is fetched from the API; weekly and monthly data are derived from it
 	"""
+	# Directory the data is stored in, with one folder per timeframe
+	_data_directory = None
+
 	def __init__(self, timeframe="daily"):
 		"""Initializes the class by creating a new TimeSeries object 
 
@@ -66,7 +71,7 @@ class Initializer(ABC):
 
 	@abstractmethod		
 	def _fetch_store(self, stock_name_no_spaces, stock_ticker, timeframe="daily"):
-		"""Fetches and stores a stock's data
+		"""Fetches and stores a stock's daily data
 
 		Positional Arguments:
 			stock_name_no_spaces: stock's name (without spaces)
@@ -77,6 +82,43 @@ class Initializer(ABC):
 		"""
 		pass
 
+	def _fetch_full_history(self, stock_name_no_spaces, stock_ticker, sessions=0):
+		"""Returns a stock's full daily history (most recent date on top)
+
+		When the stock's full history is already stored, only the last 100 trading sessions are fetched and appended to
+		it, with the adjusted closes of the whole history rebuilt from the closes, dividends and splits (see
+		stitap_adjust). The full history is fetched when nothing is stored, the stored history is shorter than
+		sessions, or the recent sessions do not line up with the stored ones
+
+		Positional Arguments:
+			stock_name_no_spaces: stock's name (without spaces)
+			stock_ticker: stock's ticker
+
+		Keyword Arguments:
+			sessions: number of sessions the stored history needs to be extended rather than fetched again (default 0)
+		"""
+		stored_path = f"{self._data_directory}/daily/{stock_name_no_spaces}.csv"
+		if os.path.exists(stored_path):
+			stored = read_stock_csv(stored_path, daily_columns)
+			if len(stored) >= sessions:
+				recent, _ = self._ts.get_daily_adjusted(symbol=stock_ticker, outputsize="compact")
+				data = extend_history(stored, recent)
+				if data is not None:
+					return data
+		data, _ = self._ts.get_daily_adjusted(symbol=stock_ticker, outputsize="full")
+		return data
+
+	def _resample_store(self):
+		"""Derives weekly and monthly data from the stored daily data of all stocks, and stores them
+		"""
+		print("RESAMPLING: DAILY DATA TO WEEKLY AND MONTHLY DATA", end="\n"*2)
+		sti_stocks_daily, _ = load_stock_csvs(sti_stocks, f"{self._data_directory}/daily", list(resample_aggregations))
+		for timeframe in resample_frequencies:
+			for stock_name, data in resample_daily(sti_stocks_daily, timeframe).items():
+				stock_name_no_spaces = stock_name.replace(" ", "_")
+				with instrumentation.span("store", timeframe, rows=len(data)):
+					data.to_csv(f"{self._data_directory}/{timeframe}/{stock_name_no_spaces}.csv", mode="w")
+
 	def _end(self):
 		"""Prints the end of the initializing process
 		"""
@@ -88,17 +130,37 @@ class Initializer(ABC):
 		"""
 		self._start()
 		self._loop()
+		self._resample_store()
 		self._end()
 
 
 class ScreenInitializer(Initializer):
-	def __init__(self, timeframe="daily"):
+	_data_directory = "sti_stock_data/original_data"
+	# Number of sessions of a compact daily fetch
+	compact_sessions = 100
+
+	def __init__(self, timeframe="daily", sessions=compact_sessions):
 		"""Initializes the screener
 
 		Keyword Arguments:
 			timeframe: timeframe for screener. Supported values are "daily", "weekly" and "monthly" (default "daily")
+			sessions: number of daily sessions the screens need, eg. 251 for a 250 session percentage change (default
+				100, the sessions of a compact fetch)
 		"""
 		super().__init__(timeframe)
+		self._sessions = sessions
+
+	def has_session(self, date):
+		"""Returns whether SGX traded on a date, from DBS's latest bars (one API call, and DBS is rarely suspended), so the
+		screen service skips refreshing on public holidays stitap_calendar does not know
+
+		Positional Arguments:
+			date: date of an SGX close
+		"""
+		import pandas as pd
+
+		data, _ = self._ts.get_daily_adjusted(symbol=sti_stocks["DBS"], outputsize="compact")
+		return bool((pd.to_datetime(data.index).date == date).any())
 
 	def _fetch_store(self, stock_name_no_spaces, stock_ticker, timeframe="daily"):
 		"""Fetches and stores a stock's data
@@ -110,20 +172,23 @@ class ScreenInitializer(Initializer):
 		Keyword Arguments:
 			timeframe: timeframe for screener. Supported values are "daily", "weekly" and "monthly" (default "daily")
 		"""
-		if timeframe == "daily":
-			data, _ = self._ts.get_daily_adjusted(symbol=stock_ticker)
-		elif timeframe == "weekly":
-			data, _ = self._ts.get_weekly_adjusted(symbol=stock_ticker)
-		elif timeframe == "monthly":
-			data, _ = self._ts.get_monthly_adjusted(symbol=stock_ticker)
+		# Weekly and monthly screens, and periods longer than a compact fetch, need more than the last 100 trading
+		# sessions: the full history is fetched once, then extended with compact fetches
+		if timeframe == "daily" and self._sessions <= self.compact_sessions:
+			data, _ = self._ts.get_daily_adjusted(symbol=stock_ticker, outputsize="compact")
+		else:
+			data = self._fetch_full_history(stock_name_no_spaces, stock_ticker, sessions=self._sessions)
 
 		# Sorts the data dataframe in order of recency (latest date on top)
 		data.sort_index(ascending=False, inplace=True)
 		# Stores the data dataframe as csv in sti_stock_data/original_data
-		data.to_csv(f"sti_stock_data/original_data/{timeframe}/{stock_name_no_spaces}.csv", mode="w")
+		with instrumentation.span("store", "daily", rows=len(data)):
+			data.to_csv(f"{self._data_directory}/daily/{stock_name_no_spaces}.csv", mode="w")
 
 
 class BacktestInitializer(Initializer):
+	_data_directory = "sti_stock_data/backtest_data"
+
 	def __init__(self, timeframe="daily"):
 		"""Initializes the backtest
 
@@ -142,127 +207,141 @@ class BacktestInitializer(Initializer):
 		Keyword Arguments:
 			timeframe: timeframe for screener. Supported values are "daily", "weekly" and "monthly" (default "daily")
 		"""
-		if timeframe == "daily":
-			data, _ = self._ts.get_daily_adjusted(symbol=stock_ticker, outputsize="full")
-		elif timeframe == "weekly":
-			data, _ = self._ts.get_weekly_adjusted(symbol=stock_ticker)
-		elif timeframe == "monthly":
-			data, _ = self._ts.get_monthly_adjusted(symbol=stock_ticker)
+		data = self._fetch_full_history(stock_name_no_spaces, stock_ticker)
 
 		# Sorts the data dataframe in order of recency (latest date on top)
 		data.sort_index(ascending=False, inplace=True)
 		# Stores the data dataframe as csv in sti_stock_data/backtest_data
-		data.to_csv(f"sti_stock_data/backtest_data/{timeframe}/{stock_name_no_spaces}.csv", mode = "w")
+		with instrumentation.span("store", "daily", rows=len(data)):
+			data.to_csv(f"{self._data_directory}/daily/{stock_name_no_spaces}.csv", mode = "w")
 
 
 class Wrangler():
 	"""Wrangles data for screener
 	"""
-	def __init__(self):
+	def __init__(self, timeframes=["daily", "weekly", "monthly"]):
 		"""Initializes the wrangler
-		"""
-		pass
 
-	def _df_pct_change(self, df, result_columns, input_columns, periods):
-				"""Calculates percentage change for each period in each input column of df, appending each result column in df
-
-				Positional Arguments:
-					df: pandas dataframe
-					result_columns: list of result column names (in strings)
-					input_columns: list of input column names (in strings)
-					periods: list of periods (in integers)
-				"""
-				index = 0
-				for input_column in input_columns:
-					for period in periods:
-						df[result_columns[index]] = df[input_column].pct_change(periods=period) * 100
-						index += 1
+		Keyword Arguments:
+			timeframes: timeframes of the percentage changes, named ("daily", "weekly", "monthly") or in sessions (default ["daily", "weekly", "monthly"])
+		"""
+		self._timeframes = timeframes
 
 	def wrangle_data(self):
 		"""Wrangles data
 		"""
-		print("WRANGLING AND SAVING DATA:", end="\n"*3)
+		import pandas as pd
 
-		# Converts public holidays from strings to datetime objects
-		sg_public_holidays_datetimes = [datetime.strptime(sg_public_holiday_date, "%Y-%m-%d") for sg_public_holiday_date in sg_public_holidays_dates]
+		print("WRANGLING AND SAVING DATA:", end="\n"*3)
 
-		for stock_name, stock_ticker in sti_stocks.items():
-			time.sleep(0.1)
-			stock_name_no_spaces = stock_name.replace(" ", "_")
-			print (f"WRANGLING AND SAVING DATA: {stock_name} {stock_ticker}", end="\n"*2)
-			# Load stock's csv file with date as index
-			df_original = pd.read_csv(f"sti_stock_data/original_data/daily/{stock_name_no_spaces}.csv", index_col=["date"])
-			# Get stock's adjusted close and volume (previous 100 trading sessions)
-			adjusted_close = df_original[["5. adjusted close", "6. volume"]]
-			# Change column names
-			adjusted_close.columns = ["adjusted_close", "volume"]	
-
-			# Note:Please refer to sg_public_holidays list at the top of the file for Singapore's public holidays
-			# Note:The date index currently excludes weekends and public holidays
-			# Includes Singapore's public holidays in the date index, if they fall on a weekday
-
-			# Check whether each public holiday falls within the previous 100 trading sessions' date range
-			# Get start and end dates as datetime objects for the previous 100 trading sessions
-			end_date = adjusted_close.index.values[0]
-			end_date = datetime.strptime(end_date, "%Y-%m-%d")
-			start_date = adjusted_close.index.values[-1]			
-			start_date = datetime.strptime(start_date, "%Y-%m-%d")
-
-			# Check whether each public holiday falls within date range
-			for sg_public_holidays_datetime in sg_public_holidays_datetimes:
-				# If public holiday falls within range, add public holiday to date index
-				if start_date < sg_public_holidays_datetime < end_date:
-					adjusted_close.loc[sg_public_holidays_datetime.strftime("%Y-%m-%d")] = np.nan
-
-			# Sort stock's adjusted close series (most recent date on top)
-			adjusted_close.sort_values(by="date", ascending=False, inplace=True)
-			# Backward fill the NaN values with previous day's adjusted close price
-			adjusted_close.fillna(method="bfill", inplace=True)
-
-			# Calculates percentage change for each period for both price and volume
-			self._df_pct_change(df=adjusted_close,
-								result_columns=["price_daily_pct_change", "price_weekly_pct_change", "price_monthly_pct_change",
-								"volume_daily_pct_change", "volume_weekly_pct_change", "volume_monthly_pct_change"],
-								input_columns=["adjusted_close", "volume"],
-								periods=[-1, -5, -20])
-
-			# Stores adjusted_close series as csv file in sti_stock_data/wrangled_data
-			adjusted_close.to_csv(f"sti_stock_data/wrangled_data/{stock_name_no_spaces}_wrangled.csv", mode="w")
-
-			print(f"WRANGLED DATA AND SAVED: {stock_name}", end="\n"*2)
+		with instrumentation.span("wrangle") as wrangle_span:
+			# Note:Please refer to sg_public_holidays_dates in stitap_calendar for Singapore's public holidays
+			# Note:The prepared data includes Singapore's public holidays on weekdays, filled with the previous day's values
+			prepared = PrepareTechnicalAnalysis.instance(refresh=True)
+			engine = ReturnEngine.from_prepared_data(prepared)
+			adjusted_close_panel, volume_panel = prepared.adjusted_close_panel, prepared.volume_panel
+
+			# Calculates percentage change for each timeframe for both price and volume, for all stocks at once
+			pct_change_histories = {pct_change_column(attribute, timeframe): engine.pct_change_history(timeframe, attribute=attribute)
+									for attribute in ["price", "volume"] for timeframe in self._timeframes}
+			for timeframe in self._timeframes:
+				if engine.period(timeframe) >= engine.n_sessions:
+					print(f"TOO FEW SESSIONS: {engine.n_sessions} STORED, {str(timeframe).upper()} "
+						  f"PERCENTAGE CHANGES NEED {engine.period(timeframe) + 1}, THEIR SCREENS WILL BE EMPTY", end="\n"*2)
+
+			for column, (stock_name, dates) in enumerate(engine.sti_stocks_dates.items()):
+				stock_name_no_spaces = stock_name.replace(" ", "_")
+				rows = slice(len(adjusted_close_panel) - len(dates), None)
+				adjusted_close = pd.DataFrame({"adjusted_close": adjusted_close_panel.values[rows, column],
+											   "volume": volume_panel.values[rows, column]},
+											  index=dates.strftime("%Y-%m-%d").rename("date"))
+				for result_column, pct_change_history in pct_change_histories.items():
+					adjusted_close[result_column] = pct_change_history[rows, column]
+
+				# Sort stock's adjusted close series (most recent date on top)
+				adjusted_close.sort_index(ascending=False, inplace=True)
+				# Stores adjusted_close series as csv file in sti_stock_data/wrangled_data
+				with instrumentation.span("store", "wrangled", rows=len(adjusted_close)):
+					adjusted_close.to_csv(f"sti_stock_data/wrangled_data/{stock_name_no_spaces}_wrangled.csv", mode="w")
+				wrangle_span.add(rows=len(adjusted_close))
+
+				print(f"WRANGLED DATA AND SAVED: {stock_name}", end="\n"*2)
 		
-		print("PREPARED: ALL 30 STI STOCK DATA WRANGLED AND RESULTS SAVED", end="\n"*2)
+		print(f"PREPARED: ALL {len(engine.stock_names)} STI STOCK DATA WRANGLED AND RESULTS SAVED", end="\n"*2)
 		print("-"*20, end="\n"*2)
 
 	def combine_data(self):
 		"""Combines data
 		"""
+		import pandas as pd
+
 		print("COMBINING DATA:", end="\n"*2)
 
-		price_volume_pct_change = pd.DataFrame()
+		with instrumentation.span("combine") as combine_span:
+			price_volume_pct_change = pd.DataFrame()
 
-		for stock_name, stock_ticker in sti_stocks.items():
-			stock_name_no_spaces = stock_name.replace(" ", "_")
-			df_wrangled = pd.read_csv(f"sti_stock_data/wrangled_data/{stock_name_no_spaces}_wrangled.csv", nrows=1)
-			df_wrangled["stock_name_no_spaces"] = stock_name_no_spaces
-			price_volume_pct_change = pd.concat([price_volume_pct_change, df_wrangled])
+			# Quarantined stocks (see stitap_validate) are left out, rather than combined from their last wrangled data
+			for stock_name in PrepareTechnicalAnalysis.instance().sti_stocks_adjusted_close:
+				stock_name_no_spaces = stock_name.replace(" ", "_")
+				df_wrangled = pd.read_csv(f"sti_stock_data/wrangled_data/{stock_name_no_spaces}_wrangled.csv", nrows=1)
+				df_wrangled["stock_name_no_spaces"] = stock_name_no_spaces
+				price_volume_pct_change = pd.concat([price_volume_pct_change, df_wrangled])
 
-		price_volume_pct_change.to_csv("sti_stock_data/combined_data/combined_data.csv", mode="w")
+			combine_span.add(rows=len(price_volume_pct_change))
+			price_volume_pct_change.to_csv("sti_stock_data/combined_data/combined_data.csv", mode="w")
 		
 		print("COMBINED: ALL WRANGLED DATA COMBINED AND RESULTS SAVED", end="\n"*2)
 		print("-"*20, end="\n"*2)
 
 
 if __name__ == "__main__":
-	initializer = ScreenInitializer()
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Screens the 30 STI stocks")
+	parser.add_argument("--periods", type=parse_periods, default=None,
+						help="comma separated periods (in sessions) of the percentage change screens, eg. 1,5,20,60,250; periods longer than 99 sessions fetch each stock's full history once (default daily, weekly and monthly)")
+	parser.add_argument("--serve", action="store_true",
+						help="keep the data in memory and answer screens over HTTP, refreshing it after every SGX close")
+	parser.add_argument("--port", type=int, default=8765, help="port of the screen service (default 8765)")
+	parser.add_argument("--no-fx", action="store_true",
+						help="keep the USD quoted stocks' prices as quoted, instead of converted into SGD at the current rate (saves one API call per currency)")
+	parser.add_argument("--no-quarantine", action="store_true",
+						help="screen the stocks whose data fails the quality checks (gaps, duplicate dates, bad prices, stale data) instead of leaving them out")
+	parser.add_argument("--report", default=None,
+						help="json file to write the time, CPU time, bytes and rows of each stage to (fetch, decode, store, wrangle, combine, prepare, screen)")
+	parser.add_argument("--prometheus", default=None,
+						help="Prometheus textfile to write the same per stage metrics to, eg. for node_exporter's textfile collector")
+	args = parser.parse_args()
+	if args.report or args.prometheus:
+		instrumentation.enable(report_path=args.report, prometheus_path=args.prometheus)
+	timeframes = args.periods or ["daily", "weekly", "monthly"]
+
+	# A percentage change over n sessions needs n + 1 of them
+	initializer = ScreenInitializer(sessions=max(ScreenInitializer.compact_sessions,
+												 max(ReturnEngine.period(timeframe) for timeframe in timeframes) + 1))
+	if not args.no_fx:
+		PrepareTechnicalAnalysis.fx_rates = FXRates(ForeignExchange(key=initializer._ts.key))
+	PrepareTechnicalAnalysis.quarantine = not args.no_quarantine
+	wrangler = Wrangler(timeframes=timeframes)
+	if args.serve:
+		from stitap_daemon import serve
+
+		def refresh_data():
+			initializer.initialize()
+			wrangler.wrangle_data()
+			wrangler.combine_data()
+			instrumentation.write_reports()
+
+		serve(port=args.port, refresh_data=refresh_data, has_session=initializer.has_session)
+		raise SystemExit
 	initializer.initialize()
-	wrangler = Wrangler()
 	wrangler.wrangle_data()
 	wrangler.combine_data()
-	top_price_pct_change_screen = TopPricePctChangeScreen(timeframe="daily", n=5)
-	top_volume_pct_change_screen = TopVolumePctChangeScreen(timeframe="daily", n=5)
+	top_price_pct_change_screen = TopPricePctChangeScreen(timeframe=timeframes[0], n=5, timeframes=timeframes)
+	top_volume_pct_change_screen = TopVolumePctChangeScreen(timeframe=timeframes[0], n=5, timeframes=timeframes)
 	top_price_pct_change_screen.run()
 	top_volume_pct_change_screen.run()
+	instrumentation.write_reports()
 	ta_menu = TechnicalAnalysisMenu()
 	ta_menu.run()
 	time.sleep(10000)
\ No newline at end of file
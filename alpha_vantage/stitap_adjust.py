@@ -0,0 +1,128 @@
+"""Adjusted closes reconstructed locally from the raw closes and the corporate action columns of the stored data
+
+Alpha Vantage's "5. adjusted close" is back-adjusted: every close is multiplied by the adjustment factors of all later
+sessions, a dividend d going ex after a close c contributing (1 - d / c) and a split contributing 1 / its coefficient.
+A new dividend or split therefore changes every earlier adjusted close, and reading them from the api means fetching
+the full history again. Since the stored files keep "4. close", "7. dividend amount" and "8. split coefficient",
+the adjusted closes are rebuilt here with one backward cumulative product instead, so that only the newest sessions
+need fetching (extend_history), and total return series come from the same factors.
+"""
+import numpy as np
+
+# Columns of Alpha Vantage's daily adjusted series, as stored by the initializers
+daily_columns = ["1. open", "2. high", "3. low", "4. close", "5. adjusted close", "6. volume", "7. dividend amount",
+				 "8. split coefficient"]
+
+
+def adjustment_factors(close, dividend, split_coefficient):
+	"""Returns each session's adjustment factor: (1 - dividend / previous close) / split coefficient, or 1 where it is
+	undefined (eg. the first session, or before a stock listed)
+
+	Positional Arguments:
+		close: raw closes (least recent session first), one column per stock for 2d arrays
+		dividend: dividend amounts going ex on each session, shaped like close
+		split_coefficient: split coefficients of each session (1 without a split), shaped like close
+	"""
+	close = np.asarray(close, dtype=float)
+	previous_close = np.empty_like(close)
+	previous_close[:1] = np.nan
+	previous_close[1:] = close[:-1]
+	with np.errstate(divide="ignore", invalid="ignore"):
+		dividend_factors = 1 - np.asarray(dividend, dtype=float) / previous_close
+		# No previous close (first session, listing, missing data): no dividend to adjust for
+		dividend_factors[~np.isfinite(dividend_factors)] = 1.0
+		factors = dividend_factors / np.asarray(split_coefficient, dtype=float)
+	factors[~np.isfinite(factors)] = 1.0
+	return factors
+
+
+def later_adjustments(factors):
+	"""Returns the product of the adjustment factors of every later session, for each session (a backward cumulative
+	product, 1 for the most recent session)
+
+	Positional Arguments:
+		factors: adjustment factors (least recent session first), as returned by adjustment_factors()
+	"""
+	later = np.ones_like(factors)
+	later[:-1] = np.cumprod(factors[:0:-1], axis=0)[::-1]
+	return later
+
+
+def adjusted_close(close, dividend, split_coefficient):
+	"""Returns the back-adjusted closes, as Alpha Vantage's "5. adjusted close"
+
+	Positional Arguments:
+		close: raw closes (least recent session first), one column per stock for 2d arrays
+		dividend: dividend amounts going ex on each session, shaped like close
+		split_coefficient: split coefficients of each session (1 without a split), shaped like close
+	"""
+	return np.asarray(close, dtype=float) * later_adjustments(adjustment_factors(close, dividend, split_coefficient))
+
+
+def total_return_index(close, dividend, split_coefficient, base=1.0):
+	"""Returns the value of base invested at each stock's first close, with dividends reinvested on their ex-dates
+
+	Positional Arguments:
+		close: raw closes (least recent session first), one column per stock for 2d arrays
+		dividend: dividend amounts going ex on each session, shaped like close
+		split_coefficient: split coefficients of each session (1 without a split), shaped like close
+
+	Keyword Arguments:
+		base: value invested (default 1.0)
+	"""
+	adjusted = adjusted_close(close, dividend, split_coefficient)
+	# Each stock's first adjusted close (stocks may list part way through)
+	first = np.argmax(np.isfinite(adjusted), axis=0)
+	return base * adjusted / np.take_along_axis(adjusted, np.expand_dims(first, 0), axis=0)[0]
+
+
+def adjust_bars(bars, decimals=4):
+	"""Returns a copy of a stock's daily bars with "5. adjusted close" rebuilt from its other columns
+
+	Positional Arguments:
+		bars: dataframe in the layout of Alpha Vantage's daily adjusted series, in either date order
+
+	Keyword Arguments:
+		decimals: decimals the adjusted closes are rounded to, as Alpha Vantage's (default 4)
+	"""
+	bars = bars.copy()
+	chronological = bars.index.argsort(kind="stable")
+	adjusted = np.empty(len(bars))
+	adjusted[chronological] = adjusted_close(bars["4. close"].to_numpy(float)[chronological],
+											 bars["7. dividend amount"].to_numpy(float)[chronological],
+											 bars["8. split coefficient"].to_numpy(float)[chronological])
+	bars["5. adjusted close"] = adjusted.round(decimals)
+	return bars
+
+
+def extend_history(stored, recent, rtol=1e-6):
+	"""Returns a stock's stored daily bars extended with recently fetched ones (eg. the last 100 sessions), with the
+	adjusted closes of the whole history rebuilt, most recent date on top
+
+	Returns None when the recent bars do not overlap the stored ones, or their overlapping closes and corporate
+	actions disagree (eg. the history was revised), as the full history then needs fetching
+
+	Positional Arguments:
+		stored: dataframe of stored bars in the layout of Alpha Vantage's daily adjusted series, indexed by date
+		recent: dataframe of recently fetched bars in the same layout
+
+	Keyword Arguments:
+		rtol: relative tolerance of the comparison of the overlapping bars (default 1e-6)
+	"""
+	import pandas as pd
+
+	stored = stored.copy()
+	recent = recent.copy()
+	stored.index = pd.to_datetime(stored.index)
+	recent.index = pd.to_datetime(recent.index)
+	overlap = stored.index.intersection(recent.index)
+	if stored.empty or recent.empty or overlap.empty or recent.index.min() > stored.index.max():
+		return None
+	checked = ["4. close", "7. dividend amount", "8. split coefficient"]
+	if not np.allclose(stored.loc[overlap, checked].to_numpy(float), recent.loc[overlap, checked].to_numpy(float),
+					   rtol=rtol, equal_nan=True):
+		return None
+	bars = pd.concat([stored[~stored.index.isin(recent.index)], recent])[daily_columns]
+	bars.sort_index(ascending=False, inplace=True)
+	bars.index.name = "date"
+	return adjust_bars(bars)
@@ -0,0 +1,294 @@
+"""Vectorized backtests of the technical analysis screens over the backtest data
+
+Signals, positions and returns are (sessions x stocks) numpy arrays, so every stock is simulated at once. A position
+is decided on a session's close and earns the returns of the following sessions; fees and slippage are charged on
+the session it changes.
+"""
+import numpy as np
+
+from stitap_ta_indicators import ema, crossovers, rsi, stoch_rsi
+
+# Number of sessions in a year for each timeframe
+sessions_per_year = {"daily":252, "weekly":52, "monthly":12}
+
+
+def _cached(cache, key, compute):
+	"""Returns cache[key], computing it first if needed (or just computes it if cache is None)
+
+	Positional Arguments:
+		cache: dictionary of intermediate results shared by backtests of the same prices, or None
+		key: key of the intermediate result, eg. ("rsi", 14)
+		compute: function computing the intermediate result
+	"""
+	if cache is None:
+		return compute()
+	if key not in cache:
+		cache[key] = compute()
+	return cache[key]
+
+
+def macd_signals(prices, fast_span=12, slow_span=26, signal_span=9, cache=None):
+	"""Enters on bullish MACD signal line crossovers and exits on bearish ones, as in MACDScreener
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+
+	Keyword Arguments:
+		fast_span: span of the fast EMA (default 12)
+		slow_span: span of the slow EMA (default 26)
+		signal_span: span of the EMA of the MACD line (default 9)
+		cache: dictionary of intermediate results of the same prices, eg. EMAs of each span (default None)
+	"""
+	macd_line = (_cached(cache, ("ema", fast_span), lambda: ema(prices, fast_span))
+				 - _cached(cache, ("ema", slow_span), lambda: ema(prices, slow_span)))
+	return crossovers(macd_line, ema(macd_line, signal_span))
+
+
+def rsi_signals(prices, timeframe=14, overbought_level=70, oversold_level=30, cache=None):
+	"""Enters when the RSI is oversold and exits when it is overbought, as in RSIScreener
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+
+	Keyword Arguments:
+		timeframe: RSI timeframe (in days) (default 14)
+		overbought_level: overbought level (default 70)
+		oversold_level: oversold level (default 30)
+		cache: dictionary of intermediate results of the same prices, eg. RSI of each timeframe (default None)
+	"""
+	rsi_values = _cached(cache, ("rsi", timeframe), lambda: rsi(prices, timeframe))
+	return rsi_values <= oversold_level, rsi_values >= overbought_level
+
+
+def stoch_rsi_signals(prices, timeframe=14, overbought_level=0.8, oversold_level=0.2, cache=None):
+	"""Enters when the StochRSI is oversold and exits when it is overbought, as in StochRSIScreener
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+
+	Keyword Arguments:
+		timeframe: StochRSI timeframe (in days) (default 14)
+		overbought_level: overbought level (default 0.8)
+		oversold_level: oversold level (default 0.2)
+		cache: dictionary of intermediate results of the same prices, eg. StochRSI of each timeframe (default None)
+	"""
+	stoch_rsi_values = _cached(cache, ("stoch_rsi", timeframe), lambda: stoch_rsi(prices, timeframe))
+	return stoch_rsi_values <= oversold_level, stoch_rsi_values >= overbought_level
+
+
+# Signal functions of the strategies, returning boolean entry and exit panels
+signal_strategies = {"MACD":macd_signals, "RSI":rsi_signals, "STOCHRSI":stoch_rsi_signals}
+
+
+def positions_from_signals(entries, exits):
+	"""Returns long only positions (sessions x stocks): 1 from an entry until the next exit, otherwise 0
+
+	An entry and an exit on the same session leave the position unchanged
+
+	Positional Arguments:
+		entries: boolean panel of entry signals
+		exits: boolean panel of exit signals
+	"""
+	rows = np.arange(entries.shape[0], dtype=np.int32)[:, None]
+	# A stock is held when its last entry is more recent than its last exit
+	last_entry = np.maximum.accumulate(np.where(entries & ~exits, rows, -1), axis=0)
+	last_exit = np.maximum.accumulate(np.where(exits & ~entries, rows, -1), axis=0)
+	return (last_entry > last_exit).astype(np.float64)
+
+
+def max_drawdowns(returns):
+	"""Returns the maximum drawdown (as a negative fraction) of each column of a returns array
+
+	Positional Arguments:
+		returns: array of returns (sessions x columns, or sessions)
+	"""
+	equity = np.cumprod(1 + returns, axis=0)
+	peaks = np.maximum.accumulate(np.maximum(equity, 1), axis=0)
+	return (equity / peaks - 1).min(axis=0)
+
+
+def trade_returns(positions, returns, trades):
+	"""Returns the compounded return of every trade, net of fees and slippage, and the column each trade is in
+
+	A trade runs from its entry session to its exit session; trades still open are valued at the last session.
+	Trades are ordered by column, then by entry session
+
+	Positional Arguments:
+		positions: positions decided on each session (sessions x columns)
+		returns: returns after fees and slippage (sessions x columns)
+		trades: boolean panel which is True on the sessions a position is entered
+	"""
+	held = np.zeros_like(positions)
+	held[1:] = positions[:-1]
+	active = (positions > 0) | (held > 0)
+	trades_per_column = trades.sum(axis=0)
+	first_trade = np.concatenate([[0], np.cumsum(trades_per_column)[:-1]])
+	trade_ids = (np.cumsum(trades, axis=0) - 1 + first_trade)[active]
+	log_growths = np.bincount(trade_ids, weights=np.log1p(returns[active]), minlength=int(trades_per_column.sum()))
+	return np.expm1(log_growths), np.repeat(np.arange(positions.shape[1]), trades_per_column)
+
+
+class BacktestResult:
+	"""Positions and returns of a backtest, with summaries for each stock and for the portfolio
+
+	The portfolio allocates an equal, fixed share of its capital to each stock, so its return is the mean of the stocks' returns
+	"""
+	def __init__(self, positions, returns, trades, stock_names, dates=None, periods_per_year=252):
+		"""
+		Positional Arguments:
+			positions: positions decided on each session (sessions x stocks)
+			returns: returns after fees and slippage (sessions x stocks)
+			trades: boolean panel which is True on the sessions a position is entered
+			stock_names: list of stock names
+
+		Keyword Arguments:
+			dates: DatetimeIndex of the sessions (default None)
+			periods_per_year: number of sessions in a year (default 252)
+		"""
+		self._positions = positions
+		self._returns = returns
+		self._trades = trades
+		self._stock_names = stock_names
+		self._dates = dates
+		self._periods_per_year = periods_per_year
+		self._portfolio_returns = None
+
+	@property
+	def positions(self):
+		return self._positions
+
+	@property
+	def returns(self):
+		return self._returns
+
+	@property
+	def trades(self):
+		return self._trades
+
+	@property
+	def portfolio_returns(self):
+		if self._portfolio_returns is None:
+			self._portfolio_returns = self._returns.mean(axis=1)
+		return self._portfolio_returns
+
+	@property
+	def equity(self):
+		"""Growth of 1 unit of capital invested in the portfolio, after every session"""
+		return np.cumprod(1 + self.portfolio_returns)
+
+	def trade_returns(self):
+		"""Returns the compounded return of every trade (see trade_returns()) and the stock name of each trade
+		"""
+		returns, columns = trade_returns(self._positions, self._returns, self._trades)
+		return returns, [self._stock_names[column] for column in columns]
+
+	def stock_summary(self):
+		"""Returns each stock's total return, number of trades, exposure and maximum drawdown as a dataframe
+		"""
+		import pandas as pd
+
+		return pd.DataFrame({"total_return_pct": (np.prod(1 + self._returns, axis=0) - 1) * 100,
+							 "trades": self._trades.sum(axis=0),
+							 "exposure_pct": self._positions.mean(axis=0) * 100,
+							 "max_drawdown_pct": max_drawdowns(self._returns) * 100},
+							index=pd.Index(self._stock_names, name="stock_name"))
+
+	def portfolio_summary(self, sessions=slice(None)):
+		"""Returns the portfolio's total and annualised returns, volatility, Sharpe ratio (without a risk free rate) and maximum drawdown
+
+		Keyword Arguments:
+			sessions: slice of the sessions to summarize, eg. a walk-forward test window (default all sessions)
+		"""
+		portfolio_returns = self.portfolio_returns[sessions]
+		n_years = len(portfolio_returns) / self._periods_per_year
+		total_return = np.prod(1 + portfolio_returns) - 1
+		volatility = portfolio_returns.std() * np.sqrt(self._periods_per_year)
+		mean_return = portfolio_returns.mean() * self._periods_per_year
+		return {"total_return_pct": float(total_return * 100),
+				"annualised_return_pct": float(((1 + total_return) ** (1 / n_years) - 1) * 100) if n_years > 0 else np.nan,
+				"annualised_volatility_pct": float(volatility * 100),
+				"sharpe_ratio": float(mean_return / volatility) if volatility > 0 else np.nan,
+				"max_drawdown_pct": float(max_drawdowns(portfolio_returns) * 100),
+				"trades": int(self._trades[sessions].sum())}
+
+
+def asset_returns(prices):
+	"""Returns the returns of every stock on every session, with 0 where a stock has no price
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+	"""
+	returns = np.zeros(prices.shape)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		returns[1:] = prices[1:] / prices[:-1] - 1
+	returns[~np.isfinite(returns)] = 0
+	return returns
+
+
+def run_backtest(prices, entries, exits, fees_bps=10, slippage_bps=5, stock_names=None, dates=None, periods_per_year=252, cache=None):
+	"""Simulates long only positions of every stock from entry and exit signals
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		entries: boolean panel of entry signals
+		exits: boolean panel of exit signals
+
+	Keyword Arguments:
+		fees_bps: fees per trade, in basis points of the traded value (default 10)
+		slippage_bps: slippage per trade, in basis points of the traded value (default 5)
+		stock_names: list of stock names (default None, numbered columns)
+		dates: DatetimeIndex of the sessions (default None)
+		periods_per_year: number of sessions in a year (default 252)
+		cache: dictionary of intermediate results shared by backtests of the same prices (default None)
+	"""
+	positions = positions_from_signals(entries, exits)
+	changes = np.diff(positions, axis=0, prepend=0)
+	returns = np.zeros(positions.shape)
+	np.multiply(positions[:-1], _cached(cache, "asset_returns", lambda: asset_returns(prices))[1:], out=returns[1:])
+	returns -= np.abs(changes) * ((fees_bps + slippage_bps) / 10000)
+	trades = changes > 0
+	if stock_names is None:
+		stock_names = list(range(prices.shape[1]))
+	return BacktestResult(positions, returns, trades, stock_names, dates=dates, periods_per_year=periods_per_year)
+
+
+def backtest(prices, strategy, fees_bps=10, slippage_bps=5, stock_names=None, dates=None, periods_per_year=252, cache=None, **settings):
+	"""Backtests a strategy in signal_strategies over a price panel
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		strategy: "MACD", "RSI" or "STOCHRSI"
+
+	Keyword Arguments:
+		fees_bps, slippage_bps, stock_names, dates, periods_per_year: see run_backtest
+		cache: dictionary of intermediate results shared by backtests of the same prices (default None)
+		settings: settings of the strategy's signal function, eg. timeframe=14
+	"""
+	if strategy not in signal_strategies:
+		raise ValueError(f"Strategy {strategy} is not supported, only {', '.join(signal_strategies)} are")
+	entries, exits = signal_strategies[strategy](prices, cache=cache, **settings)
+	return run_backtest(prices, entries, exits, fees_bps=fees_bps, slippage_bps=slippage_bps,
+						stock_names=stock_names, dates=dates, periods_per_year=periods_per_year, cache=cache)
+
+
+def load_backtest_prices(stock_names, timeframe="daily", directory="sti_stock_data/backtest_data", max_workers=8):
+	"""Loads the adjusted closes of the backtest data as a price panel aligned on dates
+
+	Returns the DatetimeIndex of the sessions, the price panel (sessions x stocks) and the list of stock names. Stocks
+	are NaN before their first session, and missing sessions afterwards take the previous session's price
+
+	Positional Arguments:
+		stock_names: iterable of stock names (with spaces, eg. "Keppel Corp")
+
+	Keyword Arguments:
+		timeframe: "daily", "weekly" or "monthly" (default "daily")
+		directory: directory of the backtest data, with one folder per timeframe (default "sti_stock_data/backtest_data")
+		max_workers: number of threads reading files (default 8)
+	"""
+	import pandas as pd
+	from stitap_loader import load_stock_csvs
+
+	sti_stocks_original, _ = load_stock_csvs(stock_names, f"{directory}/{timeframe}", ["5. adjusted close"], max_workers=max_workers)
+	panel = pd.concat({stock_name: df["5. adjusted close"] for stock_name, df in sti_stocks_original.items()}, axis=1).sort_index()
+	panel = panel.ffill()
+	return panel.index, panel.to_numpy(), list(panel.columns)
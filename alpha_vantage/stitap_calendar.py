@@ -0,0 +1,59 @@
+from datetime import datetime, time, timedelta, timezone
+
+sg_public_holidays_dates = ["2018-01-01", "2018-02-16", "2018-03-30", "2018-05-01", "2018-05-29",
+                              "2018-06-15", "2018-08-09", "2018-08-22", "2018-11-06", "2018-12-25"]
+
+# Singapore has been on UTC+8 all year round since 1982, and SGX's securities market closes at 5pm
+sgx_timezone = timezone(timedelta(hours=8), "SGT")
+sgx_close_time = time(17, 0)
+
+
+def sgx_holidays():
+	"""Returns Singapore's public holidays as a DatetimeIndex
+	"""
+	import pandas as pd
+
+	return pd.to_datetime(sg_public_holidays_dates, format="%Y-%m-%d")
+
+
+def is_sgx_trading_day(dates):
+	"""Returns a boolean array which is True for the dates SGX trades on (weekdays which are not public holidays)
+
+	Positional Arguments:
+		dates: DatetimeIndex
+	"""
+	return (dates.dayofweek < 5) & ~dates.normalize().isin(sgx_holidays())
+
+
+def sgx_trading_days(start_date, end_date):
+	"""Returns the SGX trading days between two dates (inclusive) as a DatetimeIndex
+
+	Positional Arguments:
+		start_date: first date (string "YYYY-MM-DD" or datetime)
+		end_date: last date (string "YYYY-MM-DD" or datetime)
+	"""
+	import pandas as pd
+
+	weekdays = pd.bdate_range(start_date, end_date)
+	return weekdays[~weekdays.isin(sgx_holidays())]
+
+
+def next_sgx_close(now=None, delay=timedelta(minutes=30)):
+	"""Returns the first SGX close (plus a delay) after a time, skipping weekends and public holidays, as a datetime in SGT
+
+	Only the public holidays in sg_public_holidays_dates (those of 2018) are known, so a close is returned for the
+	public holidays of other years (the screen service checks for a session before refreshing, see stitap_daemon)
+
+	Keyword Arguments:
+		now: timezone aware datetime (default None, the current time)
+		delay: time after the close, eg. for the day's data to be published (default 30 minutes)
+	"""
+	import pandas as pd
+
+	now = datetime.now(sgx_timezone) if now is None else now.astimezone(sgx_timezone)
+	day = now.date()
+	while True:
+		close = datetime.combine(day, sgx_close_time, tzinfo=sgx_timezone) + delay
+		if close > now and is_sgx_trading_day(pd.DatetimeIndex([day]))[0]:
+			return close
+		day += timedelta(days=1)
@@ -0,0 +1,301 @@
+"""Rolling correlation and covariance matrices of daily returns, updated incrementally, and clustering of co-moving stocks
+
+RollingCorrelation keeps the returns of the last window sessions in a ring buffer, and running sums of their pairwise
+products. Each new session adds its outer products to the sums and takes away those of the session leaving the window,
+so an update costs O(N^2) for N stocks whatever the window's length. Like pandas' DataFrame.corr(), each pair of stocks
+only counts the sessions on which both have a return, so stocks listed part way through the window are handled.
+"""
+from importlib.util import find_spec
+
+import numpy as np
+
+_SCIPY_FOUND = find_spec("scipy") is not None
+
+
+class RollingCorrelation:
+	"""Correlation and covariance matrices of the daily returns of the last window sessions
+	"""
+	def __init__(self, n_stocks, window=60, stock_names=None):
+		"""
+		Positional Arguments:
+			n_stocks: number of stocks
+
+		Keyword Arguments:
+			window: number of daily returns in the window (default 60)
+			stock_names: list of stock names (default None, numbered stocks)
+		"""
+		if window < 2:
+			raise ValueError(f"The window must hold at least 2 returns, not {window}")
+		self._window = window
+		self._stock_names = list(range(n_stocks)) if stock_names is None else list(stock_names)
+		self._returns = np.zeros((window, n_stocks))
+		self._valid = np.zeros((window, n_stocks), dtype=bool)
+		self._n_updates = 0
+		self._last_prices = None
+		# Pairwise running sums over the sessions on which both stocks have a return: counts, sums of the row stock's
+		# returns and of their squares (stacked, so that both are updated by one matrix product), and sums of the
+		# products of both stocks' returns
+		self._counts = np.zeros((n_stocks, n_stocks))
+		self._moments = np.zeros((2 * n_stocks, n_stocks))
+		self._sums, self._squares = self._moments[:n_stocks], self._moments[n_stocks:]
+		self._products = np.zeros((n_stocks, n_stocks))
+
+	@classmethod
+	def from_prices(cls, prices, window=60, stock_names=None):
+		"""Returns a RollingCorrelation of the last window returns of a price panel, ready for new sessions' prices
+
+		Positional Arguments:
+			prices: price panel (sessions x stocks), eg. a dataframe whose columns are the stock names
+
+		Keyword Arguments:
+			window: number of daily returns in the window (default 60)
+			stock_names: list of stock names (default None, the dataframe's columns if prices is one)
+		"""
+		if hasattr(prices, "columns"):
+			stock_names = list(prices.columns) if stock_names is None else stock_names
+			prices = prices.to_numpy()
+		prices = np.asarray(prices, dtype=float)
+		rolling = cls(prices.shape[1], window, stock_names)
+		# Only the last window returns are in the window, so the sums are built from them at once
+		history = prices[-(window + 1):]
+		returns = np.full((window, prices.shape[1]), np.nan)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			returns[window - (len(history) - 1):] = history[1:] / history[:-1] - 1
+		rolling._n_updates = max(0, len(history) - 1)
+		rolling._load(returns)
+		rolling._last_prices = history[-1].copy()
+		return rolling
+
+	@property
+	def stock_names(self):
+		return self._stock_names
+
+	@property
+	def window(self):
+		return self._window
+
+	def update(self, prices):
+		"""Adds a new session's prices (one per stock, NaN if a stock has none) to the window
+
+		The first session's prices only set the prices that the next session's returns are computed from
+
+		Positional Arguments:
+			prices: 1d array of the session's prices
+		"""
+		prices = np.asarray(prices, dtype=float)
+		if self._last_prices is not None:
+			with np.errstate(divide="ignore", invalid="ignore"):
+				self.update_returns(prices / self._last_prices - 1)
+		# A stock without a price on this session keeps its last price
+		self._last_prices = prices if self._last_prices is None else np.where(np.isnan(prices), self._last_prices, prices)
+
+	def update_returns(self, returns):
+		"""Adds a new session's returns (one per stock, NaN if a stock has none) to the window, in O(N^2)
+
+		Positional Arguments:
+			returns: 1d array of the session's returns
+		"""
+		returns = np.asarray(returns, dtype=float)
+		valid = np.isfinite(returns)
+		returns = np.where(valid, returns, 0)
+		slot = self._n_updates % self._window
+		# The session leaving the window and the new session, taken away and added by one rank 2 update of each sum
+		values = np.stack([self._returns[slot], returns])
+		valid = np.stack([self._valid[slot], valid]).astype(float)
+		signs = np.array([[-1.0], [1.0]])
+		self._returns[slot] = returns
+		self._valid[slot] = valid[1] > 0
+		self._n_updates += 1
+		# Rounding errors of the running sums are cleared by rebuilding them once per window, which is O(N^2) per update on average
+		if self._n_updates % self._window == 0:
+			self._load(self._ordered_returns())
+		else:
+			self._counts += valid.T @ (signs * valid)
+			self._moments += np.hstack([values, values ** 2]).T @ (signs * valid)
+			self._products += values.T @ (signs * values)
+
+	def covariance(self, min_periods=2):
+		"""Returns the covariance matrix of the window's returns (NaN for pairs with fewer than min_periods common returns)
+
+		Keyword Arguments:
+			min_periods: minimum number of sessions on which both stocks have a return (default 2)
+		"""
+		with np.errstate(divide="ignore", invalid="ignore"):
+			covariance = (self._products - self._sums * self._sums.T / self._counts) / (self._counts - 1)
+		return np.where(self._counts >= max(min_periods, 2), covariance, np.nan)
+
+	def correlation(self, min_periods=2):
+		"""Returns the correlation matrix of the window's returns (NaN for pairs with fewer than min_periods common returns)
+
+		Keyword Arguments:
+			min_periods: minimum number of sessions on which both stocks have a return (default 2)
+		"""
+		with np.errstate(divide="ignore", invalid="ignore"):
+			deviations = self._squares - self._sums ** 2 / self._counts
+			covariance = self._products - self._sums * self._sums.T / self._counts
+			correlation = np.clip(covariance / np.sqrt(deviations * deviations.T), -1, 1)
+		return np.where(self._counts >= max(min_periods, 2), correlation, np.nan)
+
+	def correlation_frame(self, min_periods=2):
+		"""Returns the correlation matrix as a dataframe indexed by stock name
+
+		Keyword Arguments:
+			min_periods: minimum number of sessions on which both stocks have a return (default 2)
+		"""
+		import pandas as pd
+
+		return pd.DataFrame(self.correlation(min_periods), index=self._stock_names, columns=self._stock_names)
+
+	def most_correlated(self, n=10, min_periods=2):
+		"""Returns the n most correlated pairs of stocks as a dataframe
+
+		Keyword Arguments:
+			n: number of pairs (default 10)
+			min_periods: minimum number of sessions on which both stocks have a return (default 2)
+		"""
+		import pandas as pd
+
+		correlation = self.correlation(min_periods)
+		rows, columns = np.triu_indices(len(correlation), k=1)
+		values = correlation[rows, columns]
+		order = np.argsort(-np.nan_to_num(values, nan=-np.inf), kind="stable")[:n]
+		names = np.asarray(self._stock_names, dtype=object)
+		return pd.DataFrame({"stock_name": names[rows[order]], "other_stock_name": names[columns[order]],
+							 "correlation": values[order]})
+
+	def _load(self, returns):
+		"""Fills the ring buffer with a window of returns (oldest first, NaN where missing) and rebuilds the running sums
+		"""
+		valid = np.isfinite(returns)
+		values = np.where(valid, returns, 0)
+		self._returns[:] = np.roll(values, self._n_updates % self._window, axis=0)
+		self._valid[:] = np.roll(valid, self._n_updates % self._window, axis=0)
+		valid = valid.astype(float)
+		self._counts[:] = valid.T @ valid
+		self._moments[:] = np.hstack([values, values ** 2]).T @ valid
+		self._products[:] = values.T @ values
+
+	def _ordered_returns(self):
+		"""Returns the window's returns, oldest first, with NaN where missing
+		"""
+		slot = self._n_updates % self._window
+		returns = np.roll(self._returns, -slot, axis=0)
+		return np.where(np.roll(self._valid, -slot, axis=0), returns, np.nan)
+
+
+def _average_linkage(distances):
+	"""Returns the average linkage tree of a distance matrix, in scipy's linkage matrix format
+
+	Each of the N - 1 rows merges two clusters: [cluster, other cluster, distance, number of stocks], where clusters
+	below N are single stocks and cluster N + i is the one formed by row i
+
+	Positional Arguments:
+		distances: square matrix of distances
+	"""
+	n_stocks = len(distances)
+	distances = distances.astype(float, copy=True)
+	np.fill_diagonal(distances, np.inf)
+	sizes = np.ones(n_stocks)
+	clusters = np.arange(n_stocks)
+	linkage = np.zeros((max(n_stocks - 1, 0), 4))
+	for step in range(n_stocks - 1):
+		first, second = sorted(np.unravel_index(np.argmin(distances), distances.shape))
+		linkage[step] = [min(clusters[first], clusters[second]), max(clusters[first], clusters[second]),
+						 distances[first, second], sizes[first] + sizes[second]]
+		# Lance-Williams update: the merged cluster takes the size-weighted average of both clusters' distances
+		merged = (sizes[first] * distances[first] + sizes[second] * distances[second]) / (sizes[first] + sizes[second])
+		distances[first] = merged
+		distances[:, first] = merged
+		distances[first, first] = np.inf
+		distances[second] = np.inf
+		distances[:, second] = np.inf
+		sizes[first] += sizes[second]
+		clusters[first] = n_stocks + step
+	return linkage
+
+
+def _flat_clusters(linkage, n_stocks, max_distance):
+	"""Returns the cluster of every stock after the merges of a linkage tree no further apart than max_distance
+
+	Positional Arguments:
+		linkage: linkage matrix
+		n_stocks: number of stocks
+		max_distance: distance of the last merge to apply
+	"""
+	members = {stock: [stock] for stock in range(n_stocks)}
+	for step, (cluster, other_cluster, distance, _) in enumerate(linkage):
+		if distance > max_distance:
+			break
+		members[n_stocks + step] = members.pop(int(cluster)) + members.pop(int(other_cluster))
+	labels = np.zeros(n_stocks, dtype=int)
+	for label, stocks in enumerate(members.values()):
+		labels[stocks] = label
+	return labels
+
+
+def cluster_stocks(correlation, min_correlation=0.5, n_clusters=None, stock_names=None):
+	"""Clusters stocks by average linkage of their correlations, returning a list of clusters (lists of stock names)
+
+	The distance between two stocks is 1 - their correlation (pairs without a correlation are uncorrelated), so every
+	cluster's stocks have an average pairwise correlation of at least min_correlation. Clusters are sorted largest first,
+	and scipy is used for the linkage tree if it is installed
+
+	Positional Arguments:
+		correlation: correlation matrix, eg. RollingCorrelation.correlation(), or a dataframe indexed by stock name
+
+	Keyword Arguments:
+		min_correlation: average correlation of the loosest cluster (default 0.5)
+		n_clusters: number of clusters instead of min_correlation (default None)
+		stock_names: list of stock names (default None, the dataframe's columns if correlation is one)
+	"""
+	if hasattr(correlation, "columns"):
+		stock_names = list(correlation.columns) if stock_names is None else stock_names
+		correlation = correlation.to_numpy()
+	distances = 1 - np.nan_to_num(np.asarray(correlation, dtype=float), nan=0.0)
+	distances = np.clip((distances + distances.T) / 2, 0, 2)
+	np.fill_diagonal(distances, 0)
+	n_stocks = len(distances)
+	if stock_names is None:
+		stock_names = list(range(n_stocks))
+
+	if _SCIPY_FOUND:
+		from scipy.cluster.hierarchy import linkage as scipy_linkage
+		from scipy.spatial.distance import squareform
+
+		linkage = scipy_linkage(squareform(distances, checks=False), method="average") if n_stocks > 1 else np.zeros((0, 4))
+	else:
+		linkage = _average_linkage(distances)
+	if n_clusters is not None:
+		# Average linkage merges at increasing distances, so n_clusters remain after the first n_stocks - n_clusters merges
+		n_merges = min(max(n_stocks - n_clusters, 0), len(linkage))
+		max_distance = linkage[n_merges - 1, 2] if n_merges else -np.inf
+	else:
+		max_distance = 1 - min_correlation
+	labels = _flat_clusters(linkage, n_stocks, max_distance)
+	clusters = [[stock_names[stock] for stock in np.flatnonzero(labels == label)] for label in np.unique(labels)]
+	return sorted(clusters, key=len, reverse=True)
+
+
+if __name__ == "__main__":
+	import argparse
+	import time
+
+	from stitap_ta_screens import PrepareTechnicalAnalysis
+
+	parser = argparse.ArgumentParser(description="Prints the most correlated stocks and the clusters of co-moving stocks")
+	parser.add_argument("--window", type=int, default=60, help="daily returns in the window (default 60)")
+	parser.add_argument("--min-correlation", type=float, default=0.5, help="average correlation of a cluster (default 0.5)")
+	parser.add_argument("--clusters", type=int, default=None, help="number of clusters instead of --min-correlation")
+	parser.add_argument("--top", type=int, default=10, help="number of most correlated pairs to print (default 10)")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	rolling = RollingCorrelation.from_prices(PrepareTechnicalAnalysis.instance().adjusted_close_panel, window=args.window)
+	clusters = cluster_stocks(rolling.correlation(), args.min_correlation, args.clusters, rolling.stock_names)
+	print(f"CORRELATED: {len(rolling.stock_names)} STOCKS OVER {args.window} SESSIONS ({time.perf_counter() - start:.3f}s)", end="\n"*2)
+	print(f"-----TOP {args.top} MOST CORRELATED PAIRS-----", end="\n"*2)
+	print(rolling.most_correlated(args.top).to_string(index=False))
+	print("\n-----CLUSTERS-----", end="\n"*2)
+	for number, cluster in enumerate(clusters, start=1):
+		if len(cluster) > 1:
+			print(f"{number}: {', '.join(cluster)}")
@@ -0,0 +1,317 @@
+"""A resident screen service: keeps the price panels and indicator intermediates in memory and answers screens over HTTP
+
+The data is fetched and loaded at startup, and refreshed after every SGX close (skipping weekends and the public
+holidays of stitap_calendar) by a scheduler thread. As stitap_calendar only knows some years' holidays, a has_session
+function (eg. fetching one stock's latest bars) can check each close had a session before the full refresh. Each refresh builds new warm state and swaps it in, so requests
+never see half-refreshed data. Screens are answered from the warm state: composite screens reuse the ScreenContext's
+intermediates (eg. the RSI of each timeframe) across requests, and percentage change rankings are built once per
+timeframe.
+
+Endpoints (GET, answered as json):
+	/status: when the data was loaded and will next be refreshed
+	/screen?q=RSI(14) < 30 AND MACD BULLISH: stocks passing a composite screen, with their indicator values
+	/top?attribute=price&timeframe=daily&n=5&sector=Banks: stocks with the highest and lowest percentage changes
+and POST /refresh, which refreshes the data in the background.
+"""
+import json
+import math
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from stitap_calendar import next_sgx_close, sgx_timezone
+from stitap_ranking import RankingIndex, sector_subset
+from stitap_returns import ReturnEngine, pct_change_column, timeframe_periods
+
+
+class WarmState:
+	"""Everything screens are answered from, built from one load of the data
+	"""
+	def __init__(self, prepared_data):
+		"""
+		Positional Arguments:
+			prepared_data: PrepareTechnicalAnalysis instance
+		"""
+		from stitap_ta_expressions import ScreenContext
+
+		self.context = ScreenContext.from_prepared_data(prepared_data)
+		self.engine = ReturnEngine.from_prepared_data(prepared_data)
+		self.rankings = {}
+		self.loaded_at = datetime.now(sgx_timezone)
+		# Load of the prepared data the state was built from
+		self.loads = prepared_data.loads
+		# Rankings name stocks without spaces, answers name them as screens do
+		self.display_names = {stock_name.replace(" ", "_"): stock_name for stock_name in self.engine.stock_names}
+		self.latest_date = max(dates[-1] for dates in self.engine.sti_stocks_dates.values())
+
+	def ranking(self, timeframe):
+		"""Returns the ranking index of the price and volume percentage changes over a timeframe, built on first use
+		"""
+		if timeframe not in self.rankings:
+			self.rankings[timeframe] = RankingIndex(self.engine.pct_change_frame([timeframe]))
+		return self.rankings[timeframe]
+
+
+class ScreenService:
+	"""Answers screens from warm state, refreshing it after every SGX close
+	"""
+	def __init__(self, refresh_data=None, delay=timedelta(minutes=30), has_session=None):
+		"""
+		Keyword Arguments:
+			refresh_data: function fetching and storing fresh data before it is reloaded (default None, only reloads the stored data)
+			delay: time after the SGX close to refresh at (default 30 minutes)
+			has_session: function returning whether SGX traded on a date, called before each scheduled refresh so the
+				public holidays stitap_calendar does not know are skipped (default None, every close is refreshed)
+		"""
+		self._refresh_data = refresh_data
+		self._delay = delay
+		self._has_session = has_session
+		self._state = None
+		# Screens share the context's intermediates, so they are computed one at a time
+		self._screen_lock = threading.Lock()
+		self._refresh_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._scheduler = None
+		self._next_refresh = None
+		self._last_refresh_error = None
+
+	@property
+	def state(self):
+		return self._state
+
+	def load(self):
+		"""Loads the stored data into new warm state
+		"""
+		from stitap_ta_screens import PrepareTechnicalAnalysis
+
+		prepared_data = PrepareTechnicalAnalysis.instance()
+		# Reloads the stored data, unless it was reloaded since the current state was built (eg. by refresh_data
+		# wrangling it), so a refresh reads every csv file once
+		if self._state is not None and prepared_data.loads == self._state.loads:
+			prepared_data.refresh()
+		state = WarmState(prepared_data)
+		self._state = state
+		return state
+
+	def refresh(self):
+		"""Fetches fresh data (if a refresh_data function was given) and reloads it; concurrent refreshes are skipped
+		"""
+		if not self._refresh_lock.acquire(blocking=False):
+			return False
+		try:
+			if self._refresh_data is not None:
+				self._refresh_data()
+			self.load()
+			self._last_refresh_error = None
+		except Exception as error:
+			# A failed refresh keeps the current state, and is retried at the next close
+			self._last_refresh_error = f"{type(error).__name__}: {error}"
+			traceback.print_exc()
+		finally:
+			self._refresh_lock.release()
+		return True
+
+	def screen(self, text):
+		"""Returns the stocks passing a composite screen and their indicator values
+
+		Positional Arguments:
+			text: screen text, eg. "RSI(14) < 30 AND MACD BULLISH"
+		"""
+		import numpy as np
+		from stitap_ta_expressions import parse_screen
+
+		expression = parse_screen(text)
+		state = self._state
+		with self._screen_lock:
+			passed = np.flatnonzero(expression.evaluate(state.context))
+			values = {str(indicator): indicator.latest(state.context, passed) for indicator in expression.indicators()}
+		return {"screen": str(expression), "date": str(state.latest_date.date()), "stocks": len(state.context.stock_names),
+				"passed": [{"stock_name": state.context.stock_names[column],
+							**{name: _json_value(indicator_values[number]) for name, indicator_values in values.items()}}
+						   for number, column in enumerate(passed)]}
+
+	def top(self, attribute="price", timeframe="daily", n=5, sector=None):
+		"""Returns the stocks with the highest and lowest percentage changes in price or volume over a timeframe
+
+		Keyword Arguments:
+			attribute: "price" or "volume" (default "price")
+			timeframe: "daily", "weekly", "monthly" or a period in sessions (default "daily")
+			n: number of stocks (default 5)
+			sector: sector in stitap_ranking.sti_sectors to rank within (default None, all stocks)
+		"""
+		if attribute not in ("price", "volume"):
+			raise ValueError(f"Attribute {attribute} is not supported, only price and volume are")
+		state = self._state
+		metric = pct_change_column(attribute, timeframe)
+		subset = None if sector is None else sector_subset(sector)
+		with self._screen_lock:
+			ranking = state.ranking(timeframe)
+		return {"attribute": attribute, "timeframe": timeframe, "date": str(state.latest_date.date()),
+				"top": _ranked(ranking.top(metric, n, subset=subset), metric, state.display_names),
+				"bottom": _ranked(ranking.bottom(metric, n, subset=subset), metric, state.display_names)}
+
+	def status(self):
+		"""Returns when the data was loaded and will next be refreshed
+		"""
+		state = self._state
+		return {"loaded_at": state.loaded_at.isoformat(timespec="seconds"), "latest_date": str(state.latest_date.date()),
+				"stocks": len(state.context.stock_names), "sessions": len(state.context.prices),
+				"next_refresh": None if self._next_refresh is None else self._next_refresh.isoformat(timespec="seconds"),
+				"refreshing": self._refresh_lock.locked(), "last_refresh_error": self._last_refresh_error}
+
+	def handle(self, method, url):
+		"""Answers a request, returning the HTTP status and the json body
+
+		Positional Arguments:
+			method: "GET" or "POST"
+			url: path and query string, eg. "/top?attribute=volume&n=3"
+		"""
+		parts = urlsplit(url)
+		query = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+		try:
+			if method == "GET" and parts.path == "/status":
+				return 200, self.status()
+			if method == "GET" and parts.path == "/screen":
+				if "q" not in query:
+					raise ValueError("Missing screen, eg. /screen?q=RSI(14) < 30")
+				return 200, self.screen(query["q"])
+			if method == "GET" and parts.path == "/top":
+				timeframe = query.get("timeframe", "daily")
+				if timeframe not in timeframe_periods:
+					timeframe = int(timeframe)
+				return 200, self.top(query.get("attribute", "price"), timeframe, int(query.get("n", 5)), query.get("sector"))
+			if method == "POST" and parts.path == "/refresh":
+				threading.Thread(target=self.refresh, daemon=True).start()
+				return 202, {"refreshing": True}
+		except ValueError as error:
+			return 400, {"error": str(error)}
+		except KeyError as error:
+			# eg. an unknown sector
+			return 400, {"error": f"Unknown name {error}"}
+		return 404, {"error": f"{method} {parts.path} is not supported"}
+
+	def start_scheduler(self):
+		"""Starts the thread refreshing the data after every SGX close
+		"""
+		self._stop.clear()
+		self._scheduler = threading.Thread(target=self._schedule, name="stitap-refresh", daemon=True)
+		self._scheduler.start()
+
+	def stop(self):
+		"""Stops the scheduler thread
+		"""
+		self._stop.set()
+		if self._scheduler is not None:
+			self._scheduler.join()
+			self._scheduler = None
+
+	def _schedule(self):
+		"""Sleeps until each SGX close (plus the delay) and refreshes the data, until stopped
+		"""
+		while not self._stop.is_set():
+			self._next_refresh = next_sgx_close(delay=self._delay)
+			seconds = (self._next_refresh - datetime.now(sgx_timezone)).total_seconds()
+			if self._stop.wait(max(seconds, 0)):
+				break
+			self.scheduled_refresh(self._next_refresh)
+
+	def scheduled_refresh(self, close):
+		"""Refreshes the data after an SGX close, unless has_session finds there was no session that day; returns
+		whether it refreshed
+
+		Positional Arguments:
+			close: datetime of the close (plus the delay), in SGT
+		"""
+		try:
+			has_session = self._has_session is None or self._has_session(close.date())
+		except Exception:
+			# Refreshes anyway when the check fails, as a missed session is worse than a wasted refresh
+			traceback.print_exc()
+			has_session = True
+		if not has_session:
+			print(f"SKIPPED: NO SGX SESSION ON {close:%Y-%m-%d}, REFRESHING AFTER THE NEXT CLOSE", end="\n"*2)
+			return False
+		print(f"REFRESHING: SCHEDULED AFTER SGX CLOSE ({close:%Y-%m-%d %H:%M %Z})", end="\n"*2)
+		self.refresh()
+		return True
+
+
+def _json_value(value):
+	"""Returns a float for json, with None instead of NaN or infinite values (eg. the change from a volume of 0)
+	"""
+	value = float(value)
+	return value if math.isfinite(value) else None
+
+
+def _ranked(df, metric, display_names):
+	"""Returns the rows of a ranking as a list of dictionaries, with the stocks' display names
+	"""
+	return [{"stock_name": display_names[stock_name], metric: _json_value(value)}
+			for stock_name, value in zip(df.iloc[:, 0], df[metric])]
+
+
+def _handler(service):
+	"""Returns a request handler class answering requests with a ScreenService
+	"""
+	class ScreenRequestHandler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			self._answer("GET")
+
+		def do_POST(self):
+			self._answer("POST")
+
+		def _answer(self, method):
+			start = time.perf_counter()
+			status, body = service.handle(method, self.path)
+			content = json.dumps(body).encode()
+			self.send_response(status)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(content)))
+			self.send_header("Server-Timing", f"screen;dur={(time.perf_counter() - start) * 1000:.3f}")
+			self.end_headers()
+			self.wfile.write(content)
+
+	return ScreenRequestHandler
+
+
+def serve(host="127.0.0.1", port=8765, refresh_data=None, delay=timedelta(minutes=30), has_session=None):
+	"""Fetches and loads the data, and answers screens over HTTP until interrupted
+
+	Keyword Arguments:
+		host: address to listen on (default "127.0.0.1", local requests only)
+		port: port to listen on (default 8765)
+		refresh_data: function fetching and storing fresh data before each scheduled refresh (default None, only reloads it)
+		delay: time after the SGX close to refresh at (default 30 minutes)
+		has_session: function returning whether SGX traded on a date, to skip refreshes on unknown holidays (default None)
+	"""
+	service = ScreenService(refresh_data=refresh_data, delay=delay, has_session=has_session)
+	start = time.perf_counter()
+	if refresh_data is not None:
+		service.refresh()
+	if service.state is None:
+		# Nothing to refresh, or the refresh failed: serves the stored data until the next close
+		service.load()
+	print(f"LOADED: WARM STATE ({time.perf_counter() - start:.3f}s)", end="\n"*2)
+	service.start_scheduler()
+	server = ThreadingHTTPServer((host, port), _handler(service))
+	print(f"SERVING: SCREENS ON http://{host}:{port} (eg. /screen?q=RSI(14) < 30), NEXT REFRESH AFTER SGX CLOSE", end="\n"*2)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.stop()
+
+
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Answers screens from warm in-memory data, reloading it after every SGX close")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8765)
+	args = parser.parse_args()
+	serve(args.host, args.port)
@@ -0,0 +1,133 @@
+"""Currency conversion of the price panels, for the counters quoted in other currencies than SGD (eg. "JMH USD")
+
+Each currency pair is fetched once with ForeignExchange.get_currency_exchange_rate and cached for a time to live, so a
+refresh costs one API call per pair rather than per stock. Panels are converted with one multiply per currency group.
+
+The API only serves the current (spot) rate, which is applied to the whole history: prices of stocks in different
+currencies become comparable, while percentage changes (and the rankings on them) are unchanged.
+"""
+import re
+import threading
+import time
+from datetime import timedelta
+
+# A currency at the end of a stock's name, eg. "HongkongLand USD"
+_currency_suffix = re.compile(r" ([A-Z]{3})$")
+
+
+def stock_currency(stock_name, default="SGD"):
+	"""Returns the currency a stock is quoted in, from the currency at the end of its name (eg. "JSH USD")
+
+	Positional Arguments:
+		stock_name: stock's name, eg. "JSH USD"
+
+	Keyword Arguments:
+		default: currency of stocks without one in their name (default "SGD")
+	"""
+	match = _currency_suffix.search(stock_name)
+	return match.group(1) if match else default
+
+
+def currency_groups(stock_names, currencies=None):
+	"""Returns the column positions of the stocks quoted in each currency, as a dictionary of currency to list
+
+	Positional Arguments:
+		stock_names: stocks' names, in the order of the panel's columns
+
+	Keyword Arguments:
+		currencies: dictionary of stock name to currency, overriding stock_currency() (default None)
+	"""
+	currencies = currencies or {}
+	groups = {}
+	for position, stock_name in enumerate(stock_names):
+		groups.setdefault(currencies.get(stock_name) or stock_currency(stock_name), []).append(position)
+	return groups
+
+
+class FXRates:
+	"""Exchange rates into a base currency, fetched once per currency pair and cached for a time to live
+	"""
+	_function = "CURRENCY_EXCHANGE_RATE"
+
+	def __init__(self, foreign_exchange, base_currency="SGD", ttl=timedelta(hours=12)):
+		"""
+		Positional Arguments:
+			foreign_exchange: alpha_vantage ForeignExchange client
+
+		Keyword Arguments:
+			base_currency: currency prices are converted into (default "SGD")
+			ttl: time a rate is used for before it is fetched again (default 12 hours, so once per daily refresh)
+		"""
+		self._foreign_exchange = foreign_exchange
+		self._base_currency = base_currency
+		self._ttl = ttl.total_seconds()
+		self._rates = {}
+		self._lock = threading.Lock()
+
+	@property
+	def base_currency(self):
+		return self._base_currency
+
+	def rate(self, currency):
+		"""Returns the exchange rate from a currency into the base currency, fetching it if it is not cached or expired
+
+		Positional Arguments:
+			currency: currency, eg. "USD"
+		"""
+		if currency == self._base_currency:
+			return 1.0
+		with self._lock:
+			cached = self._rates.get(currency)
+			if cached is not None and time.monotonic() - cached[1] < self._ttl:
+				quota = getattr(self._foreign_exchange, "quota", None)
+				if quota is not None:
+					quota.record(self._foreign_exchange.key, self._function, cache_hits=1)
+				return cached[0]
+			data, _ = self._foreign_exchange.get_currency_exchange_rate(from_currency=currency, to_currency=self._base_currency)
+			try:
+				rate = float(data["5. Exchange Rate"])
+			except (KeyError, TypeError, ValueError):
+				raise ValueError(f"No exchange rate from {currency} to {self._base_currency} in the response: {data}")
+			self._rates[currency] = (rate, time.monotonic())
+			return rate
+
+	def clear(self):
+		"""Forgets the cached rates, so they are fetched again on next use
+		"""
+		with self._lock:
+			self._rates.clear()
+
+	def stock_rates(self, stock_names, currencies=None):
+		"""Returns the rate into the base currency of each stock quoted in another currency, as a dictionary of stock
+		name to rate
+
+		Positional Arguments:
+			stock_names: stocks' names
+
+		Keyword Arguments:
+			currencies: dictionary of stock name to currency, overriding stock_currency() (default None)
+		"""
+		stock_names = list(stock_names)
+		return {stock_names[position]: self.rate(currency)
+				for currency, positions in currency_groups(stock_names, currencies).items()
+				if currency != self._base_currency for position in positions}
+
+	def convert_panel(self, panel, currencies=None):
+		"""Returns a copy of a panel (sessions x stocks) with every stock's values in the base currency
+
+		The current rate is applied to the whole history, so percentage changes are unchanged while prices of
+		stocks in different currencies become comparable
+
+		Positional Arguments:
+			panel: dataframe with one column per stock, named after it
+
+		Keyword Arguments:
+			currencies: dictionary of stock name to currency, overriding stock_currency() (default None)
+		"""
+		import pandas as pd
+
+		values = panel.to_numpy(dtype=float, copy=True)
+		for currency, positions in currency_groups(panel.columns, currencies).items():
+			if currency != self._base_currency:
+				values[:, positions] *= self.rate(currency)
+		return pd.DataFrame(values, index=panel.index, columns=panel.columns)
@@ -0,0 +1,351 @@
+"""Live screens of intraday bars: polls the watchlist within the API's rate limit and emits signal events as they happen
+
+Each stock keeps incremental indicator state (the RSI's last gains and losses, the MACD's EMAs and the last volumes),
+so a poll only processes the bars newer than the stock's last bar. The RSI and MACD follow the formulas of
+stitap_ta_indicators.rsi() and macd(). A feed is anything with a fetch(ticker) method returning the ticker's latest
+bars as (times, closes, volumes) arrays, oldest first: AlphaVantageFeed polls TimeSeries.get_intraday, and ReplayFeed
+replays stored (or random walk) bars offline.
+"""
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+# A signal of a stock's bar: event is one of signal_events, and value is the RSI, MACD line or volume ratio
+SignalEvent = namedtuple("SignalEvent", ["stock_name", "ticker", "time", "event", "value"])
+
+signal_events = ["RSI OVERBOUGHT", "RSI OVERSOLD", "MACD BULLISH", "MACD BEARISH", "VOLUME SPIKE"]
+
+
+class IndicatorState:
+	"""RSI, MACD and volume state of one stock, updated one bar at a time in O(1)
+	"""
+	def __init__(self, rsi_timeframe=14, overbought_level=70, oversold_level=30, fast_span=12, slow_span=26, signal_span=9,
+				 volume_lookback=20, volume_ratio=3):
+		"""
+		Keyword Arguments:
+			rsi_timeframe: RSI timeframe (in bars) (default 14)
+			overbought_level: RSI level crossed upwards by an overbought event (default 70)
+			oversold_level: RSI level crossed downwards by an oversold event (default 30)
+			fast_span: span of the MACD's fast EMA (default 12)
+			slow_span: span of the MACD's slow EMA (default 26)
+			signal_span: span of the EMA of the MACD line (default 9)
+			volume_lookback: number of previous bars the volume is compared with (default 20)
+			volume_ratio: multiple of their mean volume which is a volume spike (default 3)
+		"""
+		self._rsi_timeframe = rsi_timeframe
+		self._overbought_level = overbought_level
+		self._oversold_level = oversold_level
+		self._volume_ratio = volume_ratio
+		self._alphas = [2 / (span + 1) for span in (fast_span, slow_span, signal_span)]
+		self._spans = (fast_span, slow_span, signal_span)
+		self._last_price = None
+		self._gains = deque(maxlen=rsi_timeframe)
+		self._losses = deque(maxlen=rsi_timeframe)
+		self._smoothed = None
+		self._rsi = np.nan
+		# Fast, slow and signal EMAs, and the number of values each has averaged
+		self._averages = [None, None, None]
+		self._counts = [0, 0, 0]
+		self._macd = (np.nan, np.nan)
+		self._volumes = deque(maxlen=volume_lookback)
+		self._n_bars = 0
+
+	@property
+	def rsi(self):
+		return self._rsi
+
+	@property
+	def macd(self):
+		"""The MACD line and its signal line (NaN until there are enough bars)
+		"""
+		return self._macd
+
+	@property
+	def n_bars(self):
+		return self._n_bars
+
+	def update(self, close, volume):
+		"""Adds a bar, returning the list of (event, value) of its signals
+
+		Positional Arguments:
+			close: closing price of the bar
+			volume: volume of the bar
+		"""
+		events = []
+		self._n_bars += 1
+		previous_rsi = self._rsi
+		self._update_rsi(close)
+		if previous_rsi > self._oversold_level >= self._rsi:
+			events.append(("RSI OVERSOLD", self._rsi))
+		elif previous_rsi < self._overbought_level <= self._rsi:
+			events.append(("RSI OVERBOUGHT", self._rsi))
+
+		previous_macd, previous_signal = self._macd
+		macd_line, signal_line = self._update_macd(close)
+		if previous_macd < previous_signal and macd_line > signal_line:
+			events.append(("MACD BULLISH", macd_line))
+		elif previous_macd > previous_signal and macd_line < signal_line:
+			events.append(("MACD BEARISH", macd_line))
+
+		if len(self._volumes) == self._volumes.maxlen:
+			mean_volume = sum(self._volumes) / len(self._volumes)
+			if mean_volume > 0 and volume >= self._volume_ratio * mean_volume:
+				events.append(("VOLUME SPIKE", volume / mean_volume))
+		self._volumes.append(volume)
+		return events
+
+	def _update_rsi(self, close):
+		"""Updates the RSI with a closing price: each smoothed mean is ((previous rolling mean * (timeframe - 1)) +
+		current value) / timeframe, starting at the first rolling mean, as in stitap_ta_indicators
+		"""
+		if self._last_price is None:
+			self._last_price = close
+			return
+		change = close - self._last_price
+		self._last_price = close
+		full = len(self._gains) == self._rsi_timeframe
+		previous_means = (sum(self._gains) / self._rsi_timeframe, sum(self._losses) / self._rsi_timeframe)
+		gain, loss = max(change, 0.0), max(-change, 0.0)
+		self._gains.append(gain)
+		self._losses.append(loss)
+		if full:
+			weight = self._rsi_timeframe
+			self._smoothed = ((previous_means[0] * (weight - 1) + gain) / weight, (previous_means[1] * (weight - 1) + loss) / weight)
+		elif len(self._gains) == self._rsi_timeframe:
+			self._smoothed = (sum(self._gains) / self._rsi_timeframe, sum(self._losses) / self._rsi_timeframe)
+		if self._smoothed is not None:
+			mean_gain, mean_loss = self._smoothed
+			if mean_loss > 0:
+				self._rsi = 100 - (100 / (1 + mean_gain / mean_loss))
+			else:
+				self._rsi = 100.0 if mean_gain > 0 else np.nan
+
+	def _update_macd(self, close):
+		"""Updates the EMAs (as pandas' ewm(span=span, min_periods=span, adjust=False)) with a closing price
+		"""
+		for number in (0, 1):
+			self._update_average(number, close)
+		fast, slow = self._averages[:2]
+		if self._counts[1] >= self._spans[1] and self._counts[0] >= self._spans[0]:
+			macd_line = fast - slow
+			self._update_average(2, macd_line)
+			signal_line = self._averages[2] if self._counts[2] >= self._spans[2] else np.nan
+			self._macd = (macd_line, signal_line)
+		return self._macd
+
+	def _update_average(self, number, value):
+		average = self._averages[number]
+		alpha = self._alphas[number]
+		self._averages[number] = value if average is None else ((1 - alpha) * average) + (alpha * value)
+		self._counts[number] += 1
+
+
+class AlphaVantageFeed:
+	"""Intraday bars from TimeSeries.get_intraday
+	"""
+	def __init__(self, time_series, interval="5min"):
+		"""
+		Positional Arguments:
+			time_series: alpha_vantage.timeseries.TimeSeries (json or pandas output format)
+
+		Keyword Arguments:
+			interval: "1min", "5min", "15min", "30min" or "60min" (default "5min")
+		"""
+		self._time_series = time_series
+		self._interval = interval
+
+	def fetch(self, ticker):
+		"""Returns the ticker's last 100 bars as (times, closes, volumes) arrays, oldest first
+
+		Positional Arguments:
+			ticker: ticker, eg. "D05.SI"
+		"""
+		data, _ = self._time_series.get_intraday(symbol=ticker, interval=self._interval, outputsize="compact")
+		if hasattr(data, "columns"):
+			data = data.sort_index()
+			return (np.asarray(data.index, dtype="datetime64[s]"), data["4. close"].to_numpy(dtype=float),
+					data["5. volume"].to_numpy(dtype=float))
+		times = sorted(data)
+		return (np.array(times, dtype="datetime64[s]"), np.array([float(data[bar_time]["4. close"]) for bar_time in times]),
+				np.array([float(data[bar_time]["5. volume"]) for bar_time in times]))
+
+
+class ReplayFeed:
+	"""Stored bars released a few at a time, as a stand-in for the API when offline or testing
+
+	Each fetch advances the ticker by bars_per_fetch bars and, like the API's compact output, returns its last 100 bars
+	"""
+	def __init__(self, bars, bars_per_fetch=1, compact_size=100):
+		"""
+		Positional Arguments:
+			bars: dictionary of ticker to (times, closes, volumes) arrays, oldest first
+
+		Keyword Arguments:
+			bars_per_fetch: number of new bars of each fetch (default 1)
+			compact_size: number of bars returned by each fetch (default 100)
+		"""
+		self._bars = bars
+		self._bars_per_fetch = bars_per_fetch
+		self._compact_size = compact_size
+		self._cursors = {ticker: 0 for ticker in bars}
+
+	@classmethod
+	def random_walk(cls, tickers, n_bars=500, interval_minutes=5, start="2018-07-19 09:00", seed=None, **kwargs):
+		"""Returns a ReplayFeed of random walk bars for every ticker
+
+		Positional Arguments:
+			tickers: list of tickers
+
+		Keyword Arguments:
+			n_bars: number of bars of each ticker (default 500)
+			interval_minutes: minutes between bars (default 5)
+			start: time of the first bar (default "2018-07-19 09:00")
+			seed: seed of the random number generator (default None)
+			kwargs: keyword arguments of ReplayFeed, eg. bars_per_fetch
+		"""
+		rng = np.random.default_rng(seed)
+		times = np.datetime64(start, "s") + np.arange(n_bars) * np.timedelta64(interval_minutes * 60, "s")
+		bars = {}
+		for ticker in tickers:
+			closes = np.round(rng.uniform(1, 30) * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars))), 3)
+			volumes = np.round(rng.lognormal(10, 0.8, n_bars))
+			bars[ticker] = (times, closes, volumes)
+		return cls(bars, **kwargs)
+
+	def fetch(self, ticker):
+		"""Returns the ticker's last compact_size bars as (times, closes, volumes) arrays, oldest first
+
+		Positional Arguments:
+			ticker: ticker, eg. "D05.SI"
+		"""
+		end = min(self._cursors[ticker] + self._bars_per_fetch, len(self._bars[ticker][0]))
+		self._cursors[ticker] = end
+		return tuple(values[max(0, end - self._compact_size):end] for values in self._bars[ticker])
+
+
+class LiveScreen:
+	"""Polls the watchlist's intraday bars round robin, feeding each stock's new bars into its indicator state
+	"""
+	def __init__(self, feed, watchlist, calls_per_minute=5, emit_history=False, clock=time.monotonic, sleep=time.sleep, **settings):
+		"""
+		Positional Arguments:
+			feed: feed of bars, eg. AlphaVantageFeed or ReplayFeed
+			watchlist: dictionary of stock name to ticker, eg. sti_stocks
+
+		Keyword Arguments:
+			calls_per_minute: maximum number of feed calls per minute (default 5, the API's free limit)
+			emit_history: emit the signals of the bars of each stock's first fetch (default False, they only warm up the state)
+			clock: function returning the time in seconds (default time.monotonic)
+			sleep: function sleeping for a number of seconds (default time.sleep)
+			settings: keyword arguments of IndicatorState, eg. rsi_timeframe=14
+		"""
+		self._feed = feed
+		self._watchlist = watchlist
+		self._call_interval = 60 / calls_per_minute if calls_per_minute else 0
+		self._emit_history = emit_history
+		self._clock = clock
+		self._sleep = sleep
+		self._settings = settings
+		self._states = {}
+		self._last_times = {}
+		self._last_call = None
+		self._n_processed = 0
+
+	@property
+	def states(self):
+		"""Dictionary of stock name to IndicatorState
+		"""
+		return self._states
+
+	@property
+	def n_processed(self):
+		"""Number of bars fed into the indicator states so far
+		"""
+		return self._n_processed
+
+	def poll(self, stock_name):
+		"""Fetches a stock's bars and processes the new ones, returning their signal events
+
+		Positional Arguments:
+			stock_name: stock name in the watchlist
+		"""
+		ticker = self._watchlist[stock_name]
+		self._wait()
+		times, closes, volumes = self._feed.fetch(ticker)
+		first_fetch = stock_name not in self._states
+		state = self._states.setdefault(stock_name, IndicatorState(**self._settings))
+		# The bars are sorted, so the new ones are those after the last bar processed
+		start = 0 if first_fetch else np.searchsorted(times, self._last_times[stock_name], side="right")
+		events = []
+		for bar_time, close, volume in zip(times[start:], closes[start:], volumes[start:]):
+			for event, value in state.update(float(close), float(volume)):
+				events.append(SignalEvent(stock_name, ticker, bar_time, event, value))
+		if len(times) > start:
+			self._last_times[stock_name] = times[-1]
+			self._n_processed += len(times) - start
+		return events if self._emit_history or not first_fetch else []
+
+	def poll_round(self):
+		"""Polls every stock of the watchlist once, returning their signal events
+		"""
+		return [event for stock_name in self._watchlist for event in self.poll(stock_name)]
+
+	def run(self, rounds=None, on_event=None):
+		"""Polls the watchlist round after round, passing each signal event to on_event
+
+		Keyword Arguments:
+			rounds: number of rounds (default None, forever)
+			on_event: function called with each SignalEvent (default None, printing it)
+		"""
+		on_event = on_event or print_event
+		completed = 0
+		while rounds is None or completed < rounds:
+			for event in self.poll_round():
+				on_event(event)
+			completed += 1
+
+	def _wait(self):
+		"""Sleeps until the next feed call is within the rate limit
+		"""
+		if self._last_call is not None:
+			remaining = self._last_call + self._call_interval - self._clock()
+			if remaining > 0:
+				self._sleep(remaining)
+		self._last_call = self._clock()
+
+
+def print_event(event):
+	"""Prints a signal event
+
+	Positional Arguments:
+		event: SignalEvent
+	"""
+	print(f"{event.time} {event.stock_name} ({event.ticker}): {event.event} {event.value:.2f}")
+
+
+if __name__ == "__main__":
+	import argparse
+
+	from stitap_ta_screens import sti_stocks
+
+	parser = argparse.ArgumentParser(description="Polls the intraday bars of the STI stocks and prints signals as they happen")
+	parser.add_argument("--interval", choices=["1min", "5min", "15min", "30min", "60min"], default="5min")
+	parser.add_argument("--calls-per-minute", type=float, default=5, help="API calls per minute (default 5)")
+	parser.add_argument("--key", default=None, help="Alpha Vantage API key (default the ALPHAVANTAGE_API_KEY environment variable)")
+	parser.add_argument("--replay", action="store_true", help="replay random walk bars instead of calling the API")
+	parser.add_argument("--rounds", type=int, default=None, help="number of rounds over the watchlist (default forever)")
+	parser.add_argument("--stocks", default=None, help="comma separated stock names (default every STI stock)")
+	args = parser.parse_args()
+
+	watchlist = {stock_name: sti_stocks[stock_name] for stock_name in args.stocks.split(",")} if args.stocks else sti_stocks
+	if args.replay:
+		feed = ReplayFeed.random_walk(list(watchlist.values()), bars_per_fetch=5)
+		calls_per_minute = 0
+	else:
+		from alpha_vantage.timeseries import TimeSeries
+
+		feed = AlphaVantageFeed(TimeSeries(key=args.key, output_format="json"), interval=args.interval)
+		calls_per_minute = args.calls_per_minute
+	print(f"POLLING: {len(watchlist)} STOCKS EVERY {args.interval}", end="\n"*2)
+	LiveScreen(feed, watchlist, calls_per_minute=calls_per_minute).run(rounds=args.rounds)
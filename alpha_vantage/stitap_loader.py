@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+
+def csv_engine():
+	"""Returns the fastest csv engine available to pandas: "pyarrow" if it is installed, otherwise "c"
+	"""
+	return "pyarrow" if find_spec("pyarrow") is not None else "c"
+
+
+def read_stock_csv(path, columns, dtypes=None, engine=None):
+	"""Reads a stock's csv file, parsing only the date and the requested columns
+
+	Positional Arguments:
+		path: path of the csv file
+		columns: list of columns to read (besides "date")
+
+	Keyword Arguments:
+		dtypes: dictionary of column name to dtype (default float64 for every column)
+		engine: csv engine used by pandas (default csv_engine())
+	"""
+	import pandas as pd
+
+	if dtypes is None:
+		dtypes = {column: "float64" for column in columns}
+	df = pd.read_csv(path, usecols=["date"] + list(columns), dtype=dtypes, engine=engine or csv_engine())
+	df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+	return df.set_index("date")
+
+
+def load_stock_csvs(stock_names, directory, columns, dtypes=None, max_workers=8):
+	"""Reads the csv files of several stocks concurrently
+
+	Returns a dictionary of stock name to dataframe (indexed by date) and a dictionary of stock name to load time (in seconds)
+
+	Positional Arguments:
+		stock_names: iterable of stock names (with spaces, eg. "Keppel Corp")
+		directory: directory containing the csv files, named after the stocks (without spaces)
+		columns: list of columns to read (besides "date")
+
+	Keyword Arguments:
+		dtypes: dictionary of column name to dtype (default float64 for every column)
+		max_workers: number of threads reading files (default 8)
+	"""
+	engine = csv_engine()
+
+	def _load(stock_name):
+		start = time.perf_counter()
+		path = f"{directory}/{stock_name.replace(' ', '_')}.csv"
+		df = read_stock_csv(path, columns, dtypes=dtypes, engine=engine)
+		return stock_name, df, time.perf_counter() - start
+
+	stocks = {}
+	timings = {}
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		for stock_name, df, elapsed in executor.map(_load, stock_names):
+			stocks[stock_name] = df
+			timings[stock_name] = elapsed
+	return stocks, timings
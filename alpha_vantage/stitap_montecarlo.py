@@ -0,0 +1,262 @@
+"""Bootstrap confidence intervals of the backtest strategies' results
+
+Three resampling methods, from fastest to most thorough:
+
+	bootstrap_trades             resamples the strategy's trade returns with replacement
+	bootstrap_strategy_returns   block-bootstraps the strategy's daily portfolio returns (blocks of whole sessions keep
+	                             their short term autocorrelation), so the signals are computed once
+	bootstrap_backtest           block-bootstraps the daily return panel of the stocks and re-runs the strategy's
+	                             indicators and backtest on every resampled history
+
+Resamples are batched as an extra array dimension, in batches of about max_cells values. For bootstrap_backtest,
+resampled histories are laid side by side as extra columns of one panel, so the indicator and backtest kernels run on
+all of them at once; its cost still grows with sessions x stocks x resamples. On a 30 stock x 5000 session panel,
+10,000 resamples take about 0.2s with bootstrap_trades, a few seconds with bootstrap_strategy_returns and about 6
+minutes with bootstrap_backtest (200 resamples take about 7s).
+"""
+import time
+
+import numpy as np
+
+from stitap_backtest import signal_strategies, backtest, run_backtest, trade_returns, max_drawdowns, asset_returns
+
+
+def trade_statistics(returns, axis=-1):
+	"""Returns the win rate and mean return (in percent) of trades, along an axis of resamples
+
+	Positional Arguments:
+		returns: array of trade returns, eg. (resamples x trades)
+
+	Keyword Arguments:
+		axis: axis of the trades (default -1)
+	"""
+	return {"win_rate_pct": (returns > 0).mean(axis=axis) * 100,
+			"mean_trade_return_pct": returns.mean(axis=axis) * 100}
+
+
+def bootstrap_trades(returns, n_resamples=10000, seed=None, max_cells=2000000):
+	"""Resamples trade returns with replacement, returning the statistics of every resample as a dataframe
+
+	Positional Arguments:
+		returns: 1d array of trade returns, eg. from BacktestResult.trade_returns()
+
+	Keyword Arguments:
+		n_resamples: number of resamples (default 10000)
+		seed: seed of the random number generator (default None)
+		max_cells: number of resampled trades held in memory at once (default 2000000)
+	"""
+	import pandas as pd
+
+	returns = np.asarray(returns, dtype=float)
+	if returns.size == 0:
+		raise ValueError("There are no trades to resample")
+	rng = np.random.default_rng(seed)
+	batch_size = max(1, max_cells // returns.size)
+	batches = []
+	for start in range(0, n_resamples, batch_size):
+		resampled = returns[rng.integers(0, returns.size, size=(min(batch_size, n_resamples - start), returns.size))]
+		batches.append(pd.DataFrame(trade_statistics(resampled)))
+	return pd.concat(batches, ignore_index=True)
+
+
+def block_bootstrap_indices(n_sessions, n_resamples, block_length, rng):
+	"""Returns the sessions of every resampled history (resamples x sessions), drawn as blocks of consecutive sessions
+
+	Positional Arguments:
+		n_sessions: number of sessions of the history
+		n_resamples: number of resampled histories
+		block_length: number of consecutive sessions in each block
+		rng: numpy random Generator
+	"""
+	block_length = max(1, min(block_length, n_sessions))
+	n_blocks = -(-n_sessions // block_length)
+	starts = rng.integers(0, n_sessions - block_length + 1, size=(n_resamples, n_blocks))
+	sessions = starts[:, :, None] + np.arange(block_length)
+	return sessions.reshape(n_resamples, -1)[:, :n_sessions]
+
+
+def _return_statistics(portfolio_returns, periods_per_year):
+	"""Returns the total return, Sharpe ratio and maximum drawdown of each column of portfolio returns
+
+	Positional Arguments:
+		portfolio_returns: array of portfolio returns (sessions x resamples)
+		periods_per_year: number of sessions in a year
+	"""
+	volatility = portfolio_returns.std(axis=0)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		sharpe_ratio = np.where(volatility > 0, portfolio_returns.mean(axis=0) / volatility * np.sqrt(periods_per_year), np.nan)
+	return {"total_return_pct": (np.prod(1 + portfolio_returns, axis=0) - 1) * 100,
+			"sharpe_ratio": sharpe_ratio,
+			"max_drawdown_pct": max_drawdowns(portfolio_returns) * 100}
+
+
+def bootstrap_strategy_returns(prices, strategy, n_resamples=10000, block_length=20, seed=None, fees_bps=10, slippage_bps=5,
+							   periods_per_year=252, max_cells=2000000, **settings):
+	"""Block-bootstraps the daily portfolio returns of a strategy backtested once over a price panel
+
+	Returns the statistics of the actual history and a dataframe of the statistics of every resample. Unlike
+	bootstrap_backtest, the signals are those of the actual history, so only the sessions' returns are resampled
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		strategy: "MACD", "RSI" or "STOCHRSI"
+
+	Keyword Arguments:
+		n_resamples: number of resampled histories (default 10000)
+		block_length: number of consecutive sessions in each resampled block (default 20)
+		seed: seed of the random number generator (default None)
+		fees_bps, slippage_bps, periods_per_year: see run_backtest
+		max_cells: number of resampled returns held in memory at once (default 2000000)
+		settings: settings of the strategy's signal function, eg. timeframe=14
+	"""
+	import pandas as pd
+
+	portfolio_returns = backtest(prices, strategy, fees_bps=fees_bps, slippage_bps=slippage_bps,
+								 periods_per_year=periods_per_year, **settings).portfolio_returns
+	n_sessions = len(portfolio_returns)
+	actual = {statistic: values[0] for statistic, values in _return_statistics(portfolio_returns[:, None], periods_per_year).items()}
+	rng = np.random.default_rng(seed)
+	batch_size = max(1, max_cells // n_sessions)
+	batches = []
+	for start in range(0, n_resamples, batch_size):
+		sessions = block_bootstrap_indices(n_sessions, min(batch_size, n_resamples - start), block_length, rng)
+		batches.append(pd.DataFrame(_return_statistics(portfolio_returns[sessions.T], periods_per_year)))
+	return actual, pd.concat(batches, ignore_index=True)
+
+
+def _backtest_statistics(prices, strategy, n_resamples, fees_bps, slippage_bps, periods_per_year, settings):
+	"""Backtests a strategy over resampled histories laid side by side, returning the statistics of each history
+
+	Positional Arguments:
+		prices: price panel with the histories' stocks as consecutive columns (sessions x (resamples * stocks))
+		strategy: "MACD", "RSI" or "STOCHRSI"
+		n_resamples: number of histories
+		fees_bps, slippage_bps, periods_per_year: see run_backtest
+		settings: settings of the strategy's signal function
+	"""
+	entries, exits = signal_strategies[strategy](prices, **settings)
+	result = run_backtest(prices, entries, exits, fees_bps=fees_bps, slippage_bps=slippage_bps, periods_per_year=periods_per_year)
+	n_sessions = prices.shape[0]
+	portfolio_returns = result.returns.reshape(n_sessions, n_resamples, -1).mean(axis=2)
+
+	# Groups the trades of each history
+	returns, columns = trade_returns(result.positions, result.returns, result.trades)
+	resamples = columns // (prices.shape[1] // n_resamples)
+	n_trades = np.bincount(resamples, minlength=n_resamples)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		win_rate = np.bincount(resamples, weights=returns > 0, minlength=n_resamples) / n_trades
+		mean_trade_return = np.bincount(resamples, weights=returns, minlength=n_resamples) / n_trades
+	return {**_return_statistics(portfolio_returns, periods_per_year),
+			"trades": n_trades,
+			"win_rate_pct": win_rate * 100,
+			"mean_trade_return_pct": mean_trade_return * 100}
+
+
+def bootstrap_backtest(prices, strategy, n_resamples=1000, block_length=20, seed=None, fees_bps=10, slippage_bps=5,
+					   periods_per_year=252, max_cells=250000, **settings):
+	"""Block-bootstraps the daily returns of a price panel and backtests a strategy over every resampled history
+
+	Returns the statistics of the actual history and a dataframe of the statistics of every resample. Each resampled
+	history starts at the actual first prices and compounds resampled returns; stocks keep NaN prices before their
+	first session, and sessions before a stock's first session have a return of 0. As the indicators are re-run on
+	every resampled history, this takes about 35ms per resample on a 30 stock x 5000 session panel (see the module
+	docstring for faster methods)
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		strategy: "MACD", "RSI" or "STOCHRSI"
+
+	Keyword Arguments:
+		n_resamples: number of resampled histories (default 1000)
+		block_length: number of consecutive sessions in each resampled block (default 20)
+		seed: seed of the random number generator (default None)
+		fees_bps, slippage_bps, periods_per_year: see run_backtest
+		max_cells: number of values in each batch's price panel, small enough for the kernels to stay in cache (default 250000)
+		settings: settings of the strategy's signal function, eg. timeframe=14
+	"""
+	import pandas as pd
+
+	if strategy not in signal_strategies:
+		raise ValueError(f"Strategy {strategy} is not supported, only {', '.join(signal_strategies)} are")
+	prices = np.asarray(prices, dtype=float)
+	n_sessions, n_stocks = prices.shape
+	backtest_settings = (fees_bps, slippage_bps, periods_per_year, settings)
+	actual = {statistic: values[0] for statistic, values in _backtest_statistics(prices, strategy, 1, *backtest_settings).items()}
+
+	valid = ~np.isnan(prices)
+	first_sessions = np.where(valid.any(axis=0), valid.argmax(axis=0), n_sessions)
+	first_prices = prices[np.minimum(first_sessions, n_sessions - 1), np.arange(n_stocks)]
+	rows = np.arange(n_sessions)[:, None, None]
+	listed = rows >= first_sessions
+	log_returns = np.log1p(asset_returns(prices))
+
+	rng = np.random.default_rng(seed)
+	batch_size = max(1, max_cells // (n_sessions * n_stocks))
+	batches = []
+	for start in range(0, n_resamples, batch_size):
+		n_batch = min(batch_size, n_resamples - start)
+		sessions = block_bootstrap_indices(n_sessions, n_batch, block_length, rng)
+		# Resampled log returns (sessions x resamples x stocks), compounded from each stock's first price
+		resampled = np.where(rows > first_sessions, log_returns[sessions.T], 0)
+		resampled_prices = np.where(listed, first_prices * np.exp(np.cumsum(resampled, axis=0)), np.nan)
+		statistics = _backtest_statistics(resampled_prices.reshape(n_sessions, -1), strategy, n_batch, *backtest_settings)
+		batches.append(pd.DataFrame(statistics))
+	return actual, pd.concat(batches, ignore_index=True)
+
+
+def confidence_intervals(resamples, actual=None, level=0.95):
+	"""Returns the median and confidence interval of every statistic over the resamples as a dataframe
+
+	With actual statistics, also returns the percentage of resamples below each actual value
+
+	Positional Arguments:
+		resamples: dataframe of statistics with one row per resample
+
+	Keyword Arguments:
+		actual: dictionary of statistic to actual value (default None)
+		level: confidence level of the intervals (default 0.95)
+	"""
+	import pandas as pd
+
+	tail = (1 - level) / 2
+	intervals = pd.DataFrame({"lower": resamples.quantile(tail), "median": resamples.median(), "upper": resamples.quantile(1 - tail)})
+	if actual is not None:
+		intervals.insert(0, "actual", pd.Series(actual))
+		intervals["pct_of_resamples_below_actual"] = pd.Series({statistic: (resamples[statistic] < value).mean() * 100
+																for statistic, value in actual.items() if statistic in resamples})
+	return intervals
+
+
+if __name__ == "__main__":
+	import argparse
+
+	from stitap_ta_screens import sti_stocks
+	from stitap_backtest import load_backtest_prices, sessions_per_year
+
+	parser = argparse.ArgumentParser(description="Bootstraps the backtest results of a strategy over the backtest data")
+	parser.add_argument("strategy", choices=list(signal_strategies))
+	parser.add_argument("--timeframe", choices=list(sessions_per_year), default="daily")
+	parser.add_argument("--resamples", type=int, default=1000)
+	parser.add_argument("--block-length", type=int, default=20, help="sessions in each resampled block (default 20)")
+	parser.add_argument("--trades", action="store_true", help="resample the trades instead of the daily returns")
+	parser.add_argument("--rerun", action="store_true",
+						help="re-run the strategy on every resampled history of the stocks' daily returns, instead of resampling "
+							 "the strategy's daily returns (about 35ms per resample on 30 stocks x 5000 sessions)")
+	parser.add_argument("--level", type=float, default=0.95, help="confidence level (default 0.95)")
+	parser.add_argument("--seed", type=int, default=None)
+	args = parser.parse_args()
+
+	dates, prices, stock_names = load_backtest_prices(sti_stocks, timeframe=args.timeframe)
+	periods_per_year = sessions_per_year[args.timeframe]
+	start = time.perf_counter()
+	if args.trades:
+		returns, _ = backtest(prices, args.strategy, periods_per_year=periods_per_year).trade_returns()
+		actual, resamples = trade_statistics(returns), bootstrap_trades(returns, args.resamples, seed=args.seed)
+	elif args.rerun:
+		actual, resamples = bootstrap_backtest(prices, args.strategy, args.resamples, block_length=args.block_length, seed=args.seed,
+											   periods_per_year=periods_per_year)
+	else:
+		actual, resamples = bootstrap_strategy_returns(prices, args.strategy, args.resamples, block_length=args.block_length,
+													   seed=args.seed, periods_per_year=periods_per_year)
+	print(f"RESAMPLED: {args.strategy} {args.resamples} TIMES ({time.perf_counter() - start:.3f}s)", end="\n"*2)
+	print(confidence_intervals(resamples, actual, level=args.level).to_string())
@@ -0,0 +1,248 @@
+"""Grid and random searches of the backtest strategies' settings, with walk-forward train/test splits
+
+Parameter sets are backtested in a process pool. The price panel is published once as a shared panel, which every
+worker attaches to, instead of being pickled with each task. Each worker keeps the intermediate results (eg. the RSI
+of each timeframe) of the parameter sets it has backtested, and neighbouring parameter sets are sent to the same worker.
+"""
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from stitap_backtest import backtest
+from stitap_shared_panel import SharedPanel, attach
+
+# Default search space of each strategy's settings
+strategy_spaces = {"MACD":{"fast_span":list(range(4, 21)), "slow_span":list(range(20, 61, 2)), "signal_span":list(range(5, 16))},
+				   "RSI":{"timeframe":list(range(5, 31)), "overbought_level":list(range(60, 91, 5)), "oversold_level":list(range(10, 41, 5))},
+				   "STOCHRSI":{"timeframe":list(range(5, 31)), "overbought_level":[0.7, 0.75, 0.8, 0.85, 0.9, 0.95],
+							   "oversold_level":[0.05, 0.1, 0.15, 0.2, 0.25, 0.3]}}
+
+# Metrics of the backtest portfolio summaries which can be optimized
+optimization_metrics = ["total_return_pct", "annualised_return_pct", "sharpe_ratio", "max_drawdown_pct"]
+
+
+def valid_parameters(strategy, parameters):
+	"""Returns whether a parameter set makes sense for a strategy (eg. the fast EMA is shorter than the slow EMA)
+
+	Positional Arguments:
+		strategy: "MACD", "RSI" or "STOCHRSI"
+		parameters: dictionary of setting name to value
+	"""
+	if strategy == "MACD":
+		return parameters["fast_span"] < parameters["slow_span"]
+	return parameters["oversold_level"] < parameters["overbought_level"]
+
+
+def parameter_grid(strategy, space=None):
+	"""Returns every valid parameter set of a search space, as a list of dictionaries
+
+	Positional Arguments:
+		strategy: "MACD", "RSI" or "STOCHRSI"
+
+	Keyword Arguments:
+		space: dictionary of setting name to list of values (default strategy_spaces[strategy])
+	"""
+	space = space or strategy_spaces[strategy]
+	parameter_sets = (dict(zip(space, values)) for values in itertools.product(*space.values()))
+	return [parameters for parameters in parameter_sets if valid_parameters(strategy, parameters)]
+
+
+def random_parameters(strategy, n_samples, space=None, seed=None):
+	"""Returns up to n_samples distinct valid parameter sets drawn at random from a search space
+
+	The parameter sets are sorted, so that those sharing intermediate results are backtested by the same worker
+
+	Positional Arguments:
+		strategy: "MACD", "RSI" or "STOCHRSI"
+		n_samples: number of parameter sets
+
+	Keyword Arguments:
+		space: dictionary of setting name to list of values (default strategy_spaces[strategy])
+		seed: seed of the random number generator (default None)
+	"""
+	space = space or strategy_spaces[strategy]
+	generator = random.Random(seed)
+	n_sets = math.prod(len(values) for values in space.values())
+	samples = set()
+	# Gives up on drawing after enough attempts, in case the space has fewer valid parameter sets than n_samples
+	for _ in range(n_samples * 20):
+		if len(samples) == min(n_samples, n_sets):
+			break
+		values = tuple(generator.choice(values) for values in space.values())
+		if values not in samples and valid_parameters(strategy, dict(zip(space, values))):
+			samples.add(values)
+	return [dict(zip(space, values)) for values in sorted(samples)]
+
+
+def walk_forward_splits(n_sessions, n_splits=4, train_sessions=None):
+	"""Returns (train, test) pairs of session slices for walk-forward analysis
+
+	The sessions are cut into n_splits + 1 equal windows. Each test window is one of the last n_splits windows, and its
+	train window ends where it starts, expanding from the first session (or holding the train_sessions before it)
+
+	Positional Arguments:
+		n_sessions: number of sessions
+
+	Keyword Arguments:
+		n_splits: number of train/test splits (default 4)
+		train_sessions: length of each train window (default None, expanding windows)
+	"""
+	test_sessions = n_sessions // (n_splits + 1)
+	if n_splits < 1 or test_sessions < 1:
+		raise ValueError(f"Cannot split {n_sessions} sessions into {n_splits} walk-forward splits")
+	splits = []
+	for split in range(n_splits):
+		test_start = n_sessions - ((n_splits - split) * test_sessions)
+		train_start = 0 if train_sessions is None else max(0, test_start - train_sessions)
+		splits.append((slice(train_start, test_start), slice(test_start, test_start + test_sessions)))
+	return splits
+
+
+# State of each worker process: the attached price panel, the backtest settings and cached intermediates
+_worker = {}
+
+
+def _init_worker(descriptor, strategy, backtest_settings, windows):
+	"""Attaches a worker process to the shared price panel
+
+	Positional Arguments:
+		descriptor: SharedPanelDescriptor of the price panel
+		strategy: "MACD", "RSI" or "STOCHRSI"
+		backtest_settings: keyword arguments of backtest(), eg. fees_bps
+		windows: list of (split, sample, sessions) to summarize each backtest over
+	"""
+	_worker.update(prices=attach(descriptor), strategy=strategy, backtest_settings=backtest_settings, windows=windows, cache={})
+
+
+def _evaluate(parameter_sets):
+	"""Backtests parameter sets on the shared price panel, returning one row per parameter set and walk-forward split
+
+	Positional Arguments:
+		parameter_sets: list of parameter sets (dictionaries of setting name to value)
+	"""
+	rows = {}
+	for number, parameters in parameter_sets:
+		result = backtest(_worker["prices"], _worker["strategy"], cache=_worker["cache"], **_worker["backtest_settings"], **parameters)
+		for split, sample, sessions in _worker["windows"]:
+			row = rows.setdefault((number, split), dict(parameters, split=split))
+			for metric, value in result.portfolio_summary(sessions).items():
+				row[f"{sample}_{metric}"] = value
+	return list(rows.values())
+
+
+def optimize(prices, strategy, parameter_sets, n_splits=4, train_sessions=None, max_workers=None, chunk_size=None,
+			 fees_bps=10, slippage_bps=5, periods_per_year=252):
+	"""Backtests every parameter set of a strategy over a price panel in a process pool
+
+	Returns a dataframe with one row per parameter set and walk-forward split, holding the settings and the portfolio
+	summary of the train and test windows (eg. "train_sharpe_ratio" and "test_sharpe_ratio"). With n_splits=0 the
+	whole history is summarized as the train window
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		strategy: "MACD", "RSI" or "STOCHRSI"
+		parameter_sets: list of parameter sets, eg. from parameter_grid() or random_parameters()
+
+	Keyword Arguments:
+		n_splits: number of walk-forward splits (default 4)
+		train_sessions: length of each train window (default None, expanding windows)
+		max_workers: number of worker processes (default os.cpu_count())
+		chunk_size: number of parameter sets per task (default about 4 tasks per worker)
+		fees_bps: fees per trade, in basis points of the traded value (default 10)
+		slippage_bps: slippage per trade, in basis points of the traded value (default 5)
+		periods_per_year: number of sessions in a year (default 252)
+	"""
+	import pandas as pd
+
+	if n_splits:
+		windows = [(split, sample, sessions) for split, (train, test) in enumerate(walk_forward_splits(len(prices), n_splits, train_sessions))
+				   for sample, sessions in [("train", train), ("test", test)]]
+	else:
+		windows = [(0, "train", slice(None))]
+	backtest_settings = {"fees_bps":fees_bps, "slippage_bps":slippage_bps, "periods_per_year":periods_per_year}
+	max_workers = max_workers or os.cpu_count()
+	chunk_size = chunk_size or max(1, math.ceil(len(parameter_sets) / (max_workers * 4)))
+	numbered = list(enumerate(parameter_sets))
+	chunks = [numbered[start:start + chunk_size] for start in range(0, len(numbered), chunk_size)]
+
+	with SharedPanel(prices) as shared_prices:
+		with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+								 initargs=(shared_prices.descriptor, strategy, backtest_settings, windows)) as executor:
+			rows = [row for chunk_rows in executor.map(_evaluate, chunks) for row in chunk_rows]
+	return pd.DataFrame(rows)
+
+
+def rank_parameters(results, metric="sharpe_ratio", sample="test"):
+	"""Returns the parameter sets sorted by their mean metric over the walk-forward splits (best first)
+
+	Positional Arguments:
+		results: dataframe returned by optimize()
+
+	Keyword Arguments:
+		metric: metric in optimization_metrics (default "sharpe_ratio")
+		sample: "train" or "test" (default "test")
+	"""
+	parameter_names = [column for column in results.columns if column != "split" and not column.startswith(("train_", "test_"))]
+	column = f"{sample}_{metric}"
+	ranked = results.groupby(parameter_names)[column].agg(["mean", "min", "max"]).add_prefix(f"{column}_")
+	return ranked.sort_values(f"{column}_mean", ascending=False).reset_index()
+
+
+def walk_forward(results, metric="sharpe_ratio"):
+	"""Returns, for each walk-forward split, the parameter set with the best train metric and its test metrics
+
+	Positional Arguments:
+		results: dataframe returned by optimize()
+
+	Keyword Arguments:
+		metric: metric in optimization_metrics (default "sharpe_ratio")
+	"""
+	best = results.loc[results.groupby("split")[f"train_{metric}"].idxmax()]
+	return best.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+	import argparse
+
+	from stitap_ta_screens import sti_stocks
+	from stitap_backtest import load_backtest_prices, sessions_per_year
+
+	parser = argparse.ArgumentParser(description="Optimizes the settings of a backtest strategy over the backtest data")
+	parser.add_argument("strategy", choices=list(strategy_spaces))
+	parser.add_argument("--timeframe", choices=list(sessions_per_year), default="daily")
+	parser.add_argument("--samples", type=int, default=None, help="number of random parameter sets (default the whole grid)")
+	parser.add_argument("--seed", type=int, default=None)
+	parser.add_argument("--splits", type=int, default=4, help="number of walk-forward splits (default 4)")
+	parser.add_argument("--train-sessions", type=int, default=None, help="length of each train window (default expanding)")
+	parser.add_argument("--metric", choices=optimization_metrics, default="sharpe_ratio")
+	parser.add_argument("--workers", type=int, default=None)
+	parser.add_argument("--fees-bps", type=float, default=10)
+	parser.add_argument("--slippage-bps", type=float, default=5)
+	parser.add_argument("--top", type=int, default=20, help="number of parameter sets to print (default 20)")
+	parser.add_argument("--output", default=None, help="csv file to save every result to")
+	args = parser.parse_args()
+
+	dates, prices, stock_names = load_backtest_prices(sti_stocks, timeframe=args.timeframe)
+	if args.samples:
+		parameter_sets = random_parameters(args.strategy, args.samples, seed=args.seed)
+	else:
+		parameter_sets = parameter_grid(args.strategy)
+	print(f"OPTIMIZING: {args.strategy} OVER {len(parameter_sets)} PARAMETER SETS, {len(stock_names)} STOCKS, {len(dates)} SESSIONS", end="\n"*2)
+
+	start = time.perf_counter()
+	results = optimize(prices, args.strategy, parameter_sets, n_splits=args.splits, train_sessions=args.train_sessions,
+					   max_workers=args.workers, fees_bps=args.fees_bps, slippage_bps=args.slippage_bps,
+					   periods_per_year=sessions_per_year[args.timeframe])
+	print(f"OPTIMIZED: {len(parameter_sets)} PARAMETER SETS ({time.perf_counter() - start:.3f}s)", end="\n"*2)
+
+	if args.output:
+		results.to_csv(args.output, index=False)
+	sample = "test" if args.splits else "train"
+	print(f"-----TOP {args.top} PARAMETER SETS BY MEAN {sample.upper()} {args.metric.upper()}-----", end="\n"*2)
+	print(rank_parameters(results, args.metric, sample).head(args.top).to_string(index=False))
+	if args.splits:
+		print("\n-----WALK-FORWARD: BEST TRAIN PARAMETER SET OF EACH SPLIT-----", end="\n"*2)
+		print(walk_forward(results, args.metric).to_string(index=False))
@@ -0,0 +1,295 @@
+"""Portfolio simulation of screen output over history, with periodic rebalancing
+
+A selection is a boolean panel (sessions x stocks) which is True where a stock passes a screen, eg. while a MACD
+crossover or an oversold RSI is in force (see signal_selection()). On each rebalance session the portfolio is
+rebalanced at the close into the selected stocks, with equal or inverse volatility weights. Shares, holdings, cash
+and turnover are kept as dense arrays indexed by session and stock, and only the rebalance sessions are stepped through.
+"""
+import numpy as np
+
+from stitap_backtest import signal_strategies, positions_from_signals, max_drawdowns
+from stitap_resample import resample_frequencies
+
+# Weighting schemes of the selected stocks
+weightings = ["equal", "inverse_volatility"]
+
+
+def signal_selection(prices, strategy, **settings):
+	"""Returns the selection of a backtest strategy: True from each entry signal until the next exit signal
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		strategy: "MACD", "RSI" or "STOCHRSI"
+
+	Keyword Arguments:
+		settings: settings of the strategy's signal function, eg. timeframe=14
+	"""
+	if strategy not in signal_strategies:
+		raise ValueError(f"Strategy {strategy} is not supported, only {', '.join(signal_strategies)} are")
+	return positions_from_signals(*signal_strategies[strategy](prices, **settings)) > 0
+
+
+def rebalance_sessions(dates, schedule="monthly"):
+	"""Returns a boolean array which is True on the last session of each rebalance period
+
+	Positional Arguments:
+		dates: DatetimeIndex of the sessions
+
+	Keyword Arguments:
+		schedule: "daily", "weekly" or "monthly" (default "monthly")
+	"""
+	if schedule == "daily":
+		return np.ones(len(dates), dtype=bool)
+	if schedule not in resample_frequencies:
+		raise ValueError(f"Schedule {schedule} is not supported, only daily, {', '.join(resample_frequencies)} are")
+	periods = dates.to_period(resample_frequencies[schedule]).asi8
+	rebalance = np.ones(len(dates), dtype=bool)
+	rebalance[:-1] = periods[:-1] != periods[1:]
+	return rebalance
+
+
+def rolling_volatility(prices, lookback=20):
+	"""Returns the standard deviation of each stock's daily returns over the last lookback sessions (NaN until there are enough)
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+
+	Keyword Arguments:
+		lookback: number of daily returns (default 20)
+	"""
+	returns = np.full(prices.shape, np.nan)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		returns[1:] = prices[1:] / prices[:-1] - 1
+	valid = np.isfinite(returns)
+	# Running sums with a leading row of zeros, so that the window ending at t is [t + 1 - lookback, t + 1)
+	sums = np.zeros((len(prices) + 1, prices.shape[1]))
+	squares = np.zeros_like(sums)
+	counts = np.zeros_like(sums)
+	np.cumsum(np.where(valid, returns, 0), axis=0, out=sums[1:])
+	np.cumsum(np.where(valid, returns, 0) ** 2, axis=0, out=squares[1:])
+	np.cumsum(valid, axis=0, out=counts[1:])
+	window_sums = sums[lookback:] - sums[:-lookback]
+	window_squares = squares[lookback:] - squares[:-lookback]
+	complete = (counts[lookback:] - counts[:-lookback]) == lookback
+	volatility = np.full(prices.shape, np.nan)
+	with np.errstate(invalid="ignore"):
+		variance = (window_squares - window_sums ** 2 / lookback) / (lookback - 1)
+		volatility[lookback - 1:] = np.where(complete, np.sqrt(np.maximum(variance, 0)), np.nan)
+	return volatility
+
+
+def target_weights(selection, prices, weighting="equal", lookback=20):
+	"""Returns the target weight of every stock on every session (sessions x stocks), summing to 1 over the selected stocks
+
+	Stocks without a price (or, for inverse volatility weights, without a volatility) are not held
+
+	Positional Arguments:
+		selection: boolean panel of selected stocks (sessions x stocks)
+		prices: price panel (sessions x stocks)
+
+	Keyword Arguments:
+		weighting: "equal" or "inverse_volatility" (default "equal")
+		lookback: number of daily returns of the volatility (default 20)
+	"""
+	held = selection & np.isfinite(prices)
+	if weighting == "equal":
+		raw = held.astype(float)
+	elif weighting == "inverse_volatility":
+		volatility = rolling_volatility(prices, lookback)
+		with np.errstate(divide="ignore"):
+			raw = np.where(held & (volatility > 0), 1 / volatility, 0.0)
+	else:
+		raise ValueError(f"Weighting {weighting} is not supported, only {', '.join(weightings)} are")
+	totals = raw.sum(axis=1, keepdims=True)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(totals > 0, raw / totals, 0.0)
+
+
+class PortfolioResult:
+	"""Shares, holdings, cash and turnover of a simulated portfolio on every session
+	"""
+	def __init__(self, dates, stock_names, shares, holdings, cash, turnover, costs, rebalances, periods_per_year=252):
+		"""
+		Positional Arguments:
+			dates: DatetimeIndex of the sessions
+			stock_names: list of stock names
+			shares: shares held after each session's close (sessions x stocks)
+			holdings: value of the shares held at each session's close (sessions x stocks)
+			cash: cash after each session's close
+			turnover: value traded on each session, as a fraction of the portfolio's value
+			costs: fees and slippage paid on each session
+			rebalances: boolean array which is True on rebalance sessions
+
+		Keyword Arguments:
+			periods_per_year: number of sessions in a year (default 252)
+		"""
+		self._dates = dates
+		self._stock_names = stock_names
+		self._shares = shares
+		self._holdings = holdings
+		self._cash = cash
+		self._turnover = turnover
+		self._costs = costs
+		self._rebalances = rebalances
+		self._periods_per_year = periods_per_year
+
+	@property
+	def shares(self):
+		return self._shares
+
+	@property
+	def holdings(self):
+		return self._holdings
+
+	@property
+	def cash(self):
+		return self._cash
+
+	@property
+	def value(self):
+		return self._cash + self._holdings.sum(axis=1)
+
+	@property
+	def weights(self):
+		return self._holdings / self.value[:, None]
+
+	@property
+	def turnover(self):
+		return self._turnover
+
+	@property
+	def returns(self):
+		value = self.value
+		returns = np.zeros(len(value))
+		returns[1:] = value[1:] / value[:-1] - 1
+		return returns
+
+	def to_frame(self):
+		"""Returns the portfolio's value, cash, number of holdings, turnover and costs on every session as a dataframe
+		"""
+		import pandas as pd
+
+		return pd.DataFrame({"value": self.value, "cash": self._cash, "holdings": (self._shares > 0).sum(axis=1),
+							 "turnover": self._turnover, "costs": self._costs, "rebalance": self._rebalances},
+							index=pd.Index(self._dates, name="date"))
+
+	def holdings_frame(self, date=None):
+		"""Returns the shares, value and weight of each stock held on a date (default the last session) as a dataframe
+
+		Keyword Arguments:
+			date: date (string "YYYY-MM-DD" or datetime) (default None, the last session)
+		"""
+		import pandas as pd
+
+		row = -1 if date is None else self._dates.get_loc(pd.Timestamp(date))
+		held = self._shares[row] > 0
+		return pd.DataFrame({"shares": self._shares[row, held], "value": self._holdings[row, held],
+							 "weight": self._holdings[row, held] / self.value[row]},
+							index=pd.Index(np.asarray(self._stock_names)[held], name="stock_name")).sort_values("weight", ascending=False)
+
+	def summary(self):
+		"""Returns the portfolio's total and annualised returns, volatility, Sharpe ratio, maximum drawdown and turnover
+		"""
+		returns = self.returns
+		value = self.value
+		n_years = (len(value) - 1) / self._periods_per_year
+		total_return = value[-1] / value[0] - 1
+		volatility = returns[1:].std() * np.sqrt(self._periods_per_year)
+		return {"total_return_pct": float(total_return * 100),
+				"annualised_return_pct": float(((1 + total_return) ** (1 / n_years) - 1) * 100) if n_years > 0 else np.nan,
+				"annualised_volatility_pct": float(volatility * 100),
+				"sharpe_ratio": float(returns[1:].mean() * self._periods_per_year / volatility) if volatility > 0 else np.nan,
+				"max_drawdown_pct": float(max_drawdowns(returns) * 100),
+				"rebalances": int(self._rebalances.sum()),
+				"annual_turnover_pct": float(self._turnover.sum() / n_years * 100) if n_years > 0 else np.nan,
+				"costs": float(self._costs.sum())}
+
+
+def simulate_portfolio(prices, selection, dates, schedule="monthly", weighting="equal", lookback=20, initial_cash=100000,
+					   fees_bps=10, slippage_bps=5, stock_names=None, periods_per_year=252):
+	"""Simulates a portfolio rebalanced into the selected stocks at the close of every rebalance session
+
+	Fees and slippage are charged on the value traded and paid from cash; the targets are scaled down so that the
+	portfolio stays fully invested after paying them. Between rebalances the shares are held, so holdings drift with prices
+
+	Positional Arguments:
+		prices: price panel (sessions x stocks)
+		selection: boolean panel of selected stocks (sessions x stocks)
+		dates: DatetimeIndex of the sessions
+
+	Keyword Arguments:
+		schedule: "daily", "weekly" or "monthly" (default "monthly")
+		weighting: "equal" or "inverse_volatility" (default "equal")
+		lookback: number of daily returns of the volatility (default 20)
+		initial_cash: cash at the start (default 100000)
+		fees_bps: fees, in basis points of the value traded (default 10)
+		slippage_bps: slippage, in basis points of the value traded (default 5)
+		stock_names: list of stock names (default None, numbered columns)
+		periods_per_year: number of sessions in a year (default 252)
+	"""
+	prices = np.asarray(prices, dtype=float)
+	n_sessions, n_stocks = prices.shape
+	rebalances = rebalance_sessions(dates, schedule)
+	weights = target_weights(np.asarray(selection, dtype=bool), prices, weighting, lookback)
+	# Stocks without a price are never held, so their value is 0
+	marks = np.nan_to_num(prices)
+	cost_rate = (fees_bps + slippage_bps) / 10000
+
+	shares = np.zeros((n_sessions, n_stocks))
+	cash = np.zeros(n_sessions)
+	turnover = np.zeros(n_sessions)
+	costs = np.zeros(n_sessions)
+	current_shares = np.zeros(n_stocks)
+	current_cash = float(initial_cash)
+	rebalance_rows = np.flatnonzero(rebalances)
+	# Sessions up to the first rebalance are held in cash
+	cash[:rebalance_rows[0] if len(rebalance_rows) else n_sessions] = current_cash
+	for number, row in enumerate(rebalance_rows):
+		value = current_cash + current_shares @ marks[row]
+		targets = weights[row] * value
+		traded = np.abs(targets - current_shares * marks[row]).sum()
+		cost = traded * cost_rate
+		if value > 0:
+			targets *= (value - cost) / value
+		with np.errstate(divide="ignore", invalid="ignore"):
+			current_shares = np.where(marks[row] > 0, targets / marks[row], 0.0)
+		current_cash = value - cost - targets.sum()
+		turnover[row] = traded / value if value > 0 else 0.0
+		costs[row] = cost
+		# The shares and cash are held until the next rebalance
+		end = rebalance_rows[number + 1] if number + 1 < len(rebalance_rows) else n_sessions
+		shares[row:end] = current_shares
+		cash[row:end] = current_cash
+	holdings = shares * marks
+	if stock_names is None:
+		stock_names = list(range(n_stocks))
+	return PortfolioResult(dates, stock_names, shares, holdings, cash, turnover, costs, rebalances, periods_per_year=periods_per_year)
+
+
+if __name__ == "__main__":
+	import argparse
+
+	from stitap_ta_screens import sti_stocks
+	from stitap_backtest import load_backtest_prices, sessions_per_year
+
+	parser = argparse.ArgumentParser(description="Simulates a portfolio of the stocks selected by a strategy over the backtest data")
+	parser.add_argument("strategy", choices=list(signal_strategies))
+	parser.add_argument("--timeframe", choices=list(sessions_per_year), default="daily")
+	parser.add_argument("--schedule", choices=["daily", "weekly", "monthly"], default="monthly")
+	parser.add_argument("--weighting", choices=weightings, default="equal")
+	parser.add_argument("--lookback", type=int, default=20, help="daily returns of the volatility (default 20)")
+	parser.add_argument("--cash", type=float, default=100000, help="initial cash (default 100000)")
+	parser.add_argument("--fees-bps", type=float, default=10)
+	parser.add_argument("--slippage-bps", type=float, default=5)
+	args = parser.parse_args()
+
+	dates, prices, stock_names = load_backtest_prices(sti_stocks, timeframe=args.timeframe)
+	result = simulate_portfolio(prices, signal_selection(prices, args.strategy), dates, schedule=args.schedule,
+								weighting=args.weighting, lookback=args.lookback, initial_cash=args.cash, fees_bps=args.fees_bps,
+								slippage_bps=args.slippage_bps, stock_names=stock_names,
+								periods_per_year=sessions_per_year[args.timeframe])
+	print(f"-----{args.strategy} PORTFOLIO, {args.schedule.upper()} {args.weighting.upper()} REBALANCES-----", end="\n"*2)
+	for statistic, value in result.summary().items():
+		print(f"{statistic}: {value:.2f}")
+	print("\n-----HOLDINGS-----", end="\n"*2)
+	print(result.holdings_frame().to_string())
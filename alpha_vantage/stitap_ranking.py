@@ -0,0 +1,112 @@
+import os
+
+sti_sectors = {"Banks":["DBS", "OCBC Bank", "UOB"],
+               "REITs":["CapitaMall Trust", "CapitaCom Trust", "Ascendas Reit"],
+               "Property":["CityDev", "UOL", "CapitaLand", "HongkongLand USD"],
+               "Conglomerates":["Keppel Corp", "Sembcorp Ind", "Jardine C&C", "JSH USD", "JMH USD"],
+               "Telecommunications":["SingTel", "StarHub"],
+               "Industrials":["ST Engineering", "YZJ Shipbldg SGD", "Venture", "HPH Trust USD", "ComfortDelGro", "SIA", "SATS"],
+               "Consumer":["Genting Sing", "ThaiBev", "SPH", "Wilmar Intl", "Golden Agri-Res"],
+               "Financial Services":["SGX"]}
+
+
+class RankingIndex:
+	"""Orderings of every metric of a set of stocks, sorted once so that top n and bottom n lookups are slices
+
+	As with pandas' nlargest and nsmallest, ties keep the order of the rows and NaN values are ranked last
+	"""
+	def __init__(self, df, name_column="stock_name_no_spaces"):
+		"""
+		Positional Arguments:
+			df: dataframe with one row per stock
+
+		Keyword Arguments:
+			name_column: column holding the stocks' names (default "stock_name_no_spaces")
+		"""
+		import numpy as np
+
+		self._name_column = name_column
+		self._names = df[name_column].to_numpy()
+		self._positions = {name: position for position, name in enumerate(self._names)}
+		self._values = {}
+		self._descending = {}
+		self._ascending = {}
+		for metric in df.select_dtypes("number").columns:
+			values = df[metric].to_numpy(dtype=float)
+			self._values[metric] = values
+			# argsort places NaN values last in both orderings
+			self._descending[metric] = np.argsort(-values, kind="stable")
+			self._ascending[metric] = np.argsort(values, kind="stable")
+
+	@property
+	def metrics(self):
+		return list(self._values)
+
+	def _select(self, order, metric, n, subset):
+		"""Returns the first n stocks of an ordering as a dataframe of names and metric values
+
+		Positional Arguments:
+			order: array of row positions
+			metric: metric column
+			n: number of stocks
+			subset: iterable of stock names to rank within, or None for all stocks
+		"""
+		import numpy as np
+		import pandas as pd
+
+		if subset is not None:
+			in_subset = np.zeros(len(self._names), dtype=bool)
+			in_subset[[self._positions[name] for name in subset if name in self._positions]] = True
+			order = order[in_subset[order]]
+		selected = order[:n]
+		return pd.DataFrame({self._name_column: self._names[selected], metric: self._values[metric][selected]}, index=selected)
+
+	def top(self, metric, n, subset=None):
+		"""Returns the n stocks with the highest values of a metric (highest first)
+
+		Positional Arguments:
+			metric: metric column, eg. "price_daily_pct_change"
+			n: number of stocks
+
+		Keyword Arguments:
+			subset: iterable of stock names to rank within, eg. a sector (default None, all stocks)
+		"""
+		return self._select(self._descending[metric], metric, n, subset)
+
+	def bottom(self, metric, n, subset=None):
+		"""Returns the n stocks with the lowest values of a metric (lowest first)
+
+		Positional Arguments:
+			metric: metric column, eg. "price_daily_pct_change"
+			n: number of stocks
+
+		Keyword Arguments:
+			subset: iterable of stock names to rank within, eg. a sector (default None, all stocks)
+		"""
+		return self._select(self._ascending[metric], metric, n, subset)
+
+
+_ranking_indexes = {}
+
+
+def load_ranking_index(path="sti_stock_data/combined_data/combined_data.csv"):
+	"""Returns the ranking index of a combined data file, which is only rebuilt when the file changes (ie. after the data is refreshed)
+
+	Keyword Arguments:
+		path: path of the combined data csv file (default "sti_stock_data/combined_data/combined_data.csv")
+	"""
+	import pandas as pd
+
+	modified = os.path.getmtime(path)
+	if path not in _ranking_indexes or _ranking_indexes[path][0] != modified:
+		_ranking_indexes[path] = (modified, RankingIndex(pd.read_csv(path)))
+	return _ranking_indexes[path][1]
+
+
+def sector_subset(sector):
+	"""Returns the names (without spaces) of a sector's stocks, for use as a ranking subset
+
+	Positional Arguments:
+		sector: sector in sti_sectors, eg. "Banks"
+	"""
+	return [stock_name.replace(" ", "_") for stock_name in sti_sectors[sector]]
@@ -0,0 +1,44 @@
+from stitap_calendar import is_sgx_trading_day
+
+# Columns of Alpha Vantage's weekly and monthly adjusted series, and how each is derived from daily bars
+resample_aggregations = {"1. open":"first", "2. high":"max", "3. low":"min", "4. close":"last",
+                         "5. adjusted close":"last", "6. volume":"sum", "7. dividend amount":"sum"}
+
+# Pandas period frequencies of the supported timeframes (weeks run from Monday to Friday)
+resample_frequencies = {"weekly":"W-FRI", "monthly":"M"}
+
+
+def resample_daily(sti_stocks_daily, timeframe):
+	"""Derives weekly or monthly bars from the daily bars of all stocks in one pass
+
+	Bars on days SGX does not trade are dropped, and each resampled bar is labelled with the last trading session
+	of its period, as in Alpha Vantage's weekly and monthly series. Returns a dictionary of stock name to dataframe
+	(most recent date on top)
+
+	Positional Arguments:
+		sti_stocks_daily: dictionary of stock name to dataframe of daily bars indexed by date (Alpha Vantage columns)
+		timeframe: timeframe of the bars. Supported values are "weekly" and "monthly"
+	"""
+	import pandas as pd
+
+	if timeframe not in resample_frequencies:
+		raise ValueError(f"Timeframe {timeframe} is not supported, only {', '.join(resample_frequencies)} are")
+	daily = pd.concat(sti_stocks_daily, names=["stock_name", "date"])[list(resample_aggregations)]
+	dates = pd.DatetimeIndex(pd.to_datetime(daily.index.get_level_values("date")))
+	trading_day = is_sgx_trading_day(dates)
+	daily, dates = daily[trading_day], dates[trading_day]
+
+	daily = daily.reset_index()
+	daily["date"] = dates
+	daily["period"] = dates.to_period(resample_frequencies[timeframe])
+	# Daily bars have to be in chronological order for "first" and "last"
+	daily.sort_values(["stock_name", "date"], inplace=True)
+	aggregations = dict(resample_aggregations, date="max")
+	resampled = daily.groupby(["stock_name", "period"], sort=False).agg(aggregations)
+	resampled["date"] = resampled["date"].dt.strftime("%Y-%m-%d")
+
+	sti_stocks_resampled = {}
+	for stock_name, bars in resampled.groupby(level="stock_name", sort=False):
+		bars = bars.set_index("date").sort_index(ascending=False)
+		sti_stocks_resampled[stock_name] = bars
+	return sti_stocks_resampled
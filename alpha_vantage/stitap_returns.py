@@ -0,0 +1,163 @@
+# Number of sessions in each named timeframe (public holidays on weekdays count as sessions)
+timeframe_periods = {"daily":1, "weekly":5, "monthly":20}
+
+
+def parse_periods(text):
+	"""Parses a comma separated list of periods in sessions, eg. "1,5,20,60,250"
+
+	Positional Arguments:
+		text: comma separated periods
+	"""
+	periods = [int(period) for period in text.split(",")]
+	if any(period < 1 for period in periods):
+		raise ValueError(f"Periods must be at least 1 session, got {text}")
+	return periods
+
+
+def pct_change_column(attribute, timeframe):
+	"""Returns the name of a percentage change column, eg. "price_daily_pct_change" or "volume_60_pct_change"
+
+	Positional Arguments:
+		attribute: "price" or "volume"
+		timeframe: timeframe in timeframe_periods or period in sessions
+	"""
+	return f"{attribute}_{timeframe}_pct_change"
+
+
+class ReturnEngine:
+	"""Log prices and log volumes of all stocks, from which the percentage change over any period ending on any date is O(1)
+
+	The log of a price is its cumulative log return up to a constant, so the change over a period is the difference of two
+	entries. Arrays are (sessions x stocks) and aligned on each stock's most recent session, as in PrepareTechnicalAnalysis
+	"""
+	def __init__(self, prices, volumes, sti_stocks_dates):
+		"""
+		Positional Arguments:
+			prices: array of adjusted closes (sessions x stocks, least recent session on top)
+			volumes: array of volumes, aligned like prices
+			sti_stocks_dates: dictionary of stock name to DatetimeIndex of the stock's sessions, in the column order of prices
+		"""
+		import numpy as np
+
+		with np.errstate(divide="ignore"):
+			# Zero volumes become -inf, so changes from zero are inf and changes to zero are -100% (as with pandas)
+			self._log_values = {"price": np.log(np.asarray(prices, dtype=float)),
+								"volume": np.log(np.asarray(volumes, dtype=float))}
+		self._stock_names = list(sti_stocks_dates)
+		self._sti_stocks_dates = sti_stocks_dates
+
+	@classmethod
+	def from_prepared_data(cls, prepared=None):
+		"""Builds the engine from the daily data prepared for technical analysis screens
+
+		Keyword Arguments:
+			prepared: PrepareTechnicalAnalysis instance (default None, the shared instance)
+		"""
+		from stitap_ta_screens import PrepareTechnicalAnalysis
+
+		if prepared is None:
+			prepared = PrepareTechnicalAnalysis.instance()
+		sti_stocks_dates = {stock_name: adjusted_close.index for stock_name, adjusted_close in prepared.sti_stocks_adjusted_close.items()}
+		return cls(prepared.adjusted_close_panel.values, prepared.volume_panel.values, sti_stocks_dates)
+
+	@property
+	def stock_names(self):
+		return self._stock_names
+
+	@property
+	def sti_stocks_dates(self):
+		return self._sti_stocks_dates
+
+	@property
+	def n_sessions(self):
+		"""Number of sessions of the longest history"""
+		return next(iter(self._log_values.values())).shape[0]
+
+	@staticmethod
+	def period(timeframe):
+		"""Returns the number of sessions in a timeframe
+
+		Positional Arguments:
+			timeframe: timeframe in timeframe_periods or period in sessions
+		"""
+		period = timeframe_periods.get(timeframe, timeframe)
+		if not isinstance(period, int) or period < 1:
+			raise ValueError(f"Timeframe {timeframe} is not supported, use {', '.join(timeframe_periods)} or a number of sessions")
+		return period
+
+	def _end_positions(self, end):
+		"""Returns the row of each stock's session on an end date (or its most recent session if end is None)
+
+		Positional Arguments:
+			end: date (string "YYYY-MM-DD" or datetime) or None
+		"""
+		import numpy as np
+		import pandas as pd
+
+		n_sessions = self.n_sessions
+		if end is None:
+			return np.full(len(self._stock_names), n_sessions - 1)
+		end = pd.Timestamp(end)
+		positions = np.full(len(self._stock_names), -1)
+		for column, dates in enumerate(self._sti_stocks_dates.values()):
+			if end in dates:
+				positions[column] = n_sessions - len(dates) + dates.get_loc(end)
+		return positions
+
+	def pct_change(self, timeframe, attribute="price", end=None):
+		"""Returns each stock's percentage change over a timeframe as an array (NaN where the history is too short)
+
+		Positional Arguments:
+			timeframe: timeframe in timeframe_periods or period in sessions
+
+		Keyword Arguments:
+			attribute: "price" or "volume" (default "price")
+			end: last date of the timeframe (default None, each stock's most recent session)
+		"""
+		import numpy as np
+
+		log_values = self._log_values[attribute]
+		period = self.period(timeframe)
+		columns = np.arange(log_values.shape[1])
+		ends = self._end_positions(end)
+		starts = ends - period
+		valid = (ends >= 0) & (starts >= 0)
+		pct_change = np.full(len(columns), np.nan)
+		with np.errstate(invalid="ignore"):
+			pct_change[valid] = (np.exp(log_values[ends[valid], columns[valid]] - log_values[starts[valid], columns[valid]]) - 1) * 100
+		return pct_change
+
+	def pct_change_history(self, timeframe, attribute="price"):
+		"""Returns the percentage change over a timeframe ending on every session (sessions x stocks)
+
+		Positional Arguments:
+			timeframe: timeframe in timeframe_periods or period in sessions
+
+		Keyword Arguments:
+			attribute: "price" or "volume" (default "price")
+		"""
+		import numpy as np
+
+		log_values = self._log_values[attribute]
+		period = self.period(timeframe)
+		pct_change = np.full(log_values.shape, np.nan)
+		with np.errstate(invalid="ignore"):
+			pct_change[period:] = (np.exp(log_values[period:] - log_values[:-period]) - 1) * 100
+		return pct_change
+
+	def pct_change_frame(self, timeframes, end=None):
+		"""Returns the price and volume percentage changes over each timeframe as a dataframe with one row per stock
+
+		Positional Arguments:
+			timeframes: list of timeframes in timeframe_periods or periods in sessions
+
+		Keyword Arguments:
+			end: last date of the timeframes (default None, each stock's most recent session)
+		"""
+		import pandas as pd
+
+		df = pd.DataFrame({"stock_name_no_spaces": [stock_name.replace(" ", "_") for stock_name in self._stock_names]})
+		for attribute in ["price", "volume"]:
+			for timeframe in timeframes:
+				df[pct_change_column(attribute, timeframe)] = self.pct_change(timeframe, attribute=attribute, end=end)
+		return df
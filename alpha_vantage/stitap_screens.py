@@ -1,20 +1,34 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 from pprint import pprint
 
-import pandas as pd
+from stitap_ranking import sector_subset
+from stitap_returns import pct_change_column
+try:
+	from alpha_vantage import instrumentation
+except ImportError:
+	# Run as a script from the alpha_vantage folder, without the package installed: imports it from the repo root, so
+	# that every script shares one instrumentation module with run.py
+	import sys
+	from os import path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+	from alpha_vantage import instrumentation
 
 class TopPctChangeScreen(ABC):
 	"""Abstract base class for screening stocks with top n percentage change in an attribute (in a timeframe)
 	"""
-	def __init__(self, timeframe="daily", n=5, timeframes=["daily", "weekly", "monthly"]):
+	_attribute = None
+
+	def __init__(self, timeframe="daily", n=5, timeframes=["daily", "weekly", "monthly"], sector=None):
 		"""
 		Keyword Arguments:
-			timeframe: timeframe of screen. Supported values are "daily", "weekly" and "monthly" (default "daily")
+			timeframe: timeframe of screen. Supported values are "daily", "weekly", "monthly" and periods in sessions (default "daily")
 			n: number of stocks to screen for. (default n)
+			sector: sector in stitap_ranking.sti_sectors to screen within (default None, all stocks)
 		"""
 		self._timeframe = timeframe
 		self._n = n
 		self._timeframes = timeframes
+		self._sector = sector
 
 	@property
 	def timeframe(self):
@@ -33,15 +47,30 @@ class TopPctChangeScreen(ABC):
 		self._n = n
 
 	def _input(self):
-		"""Collects data
+		"""Collects data from the ranking index of the combined data, which is shared by all screens
 		"""
-		self._df_combined = pd.read_csv("sti_stock_data/combined_data/combined_data.csv")
+		from stitap_ranking import load_ranking_index
+
+		self._ranking = load_ranking_index()
 
-	@abstractmethod
 	def _top_pct_change(self):
 		"""Screens stocks with top n percentage change in an attribute
 		"""
-		pass
+		attribute = self._attribute
+		metric = pct_change_column(attribute, self.timeframe)
+		subset = None if self._sector is None else sector_subset(self._sector)
+		in_sector = "" if self._sector is None else f" IN {self._sector.upper()}"
+		timeframe = self.timeframe.upper() if isinstance(self.timeframe, str) else f"{self.timeframe} SESSION"
+
+		print(f"TOP {self.n} STOCKS{in_sector} WITH HIGHEST PERCENTAGE CHANGE IN {attribute.upper()}: {timeframe} SCREEN", end="\n"*2)
+		print("-"*20, end="\n"*2)
+		pprint(self._ranking.top(metric, self.n, subset=subset))
+		print("-"*20, end="\n"*2)
+
+		print(f"TOP {self.n} STOCKS{in_sector} WITH LOWEST PERCENTAGE CHANGE IN {attribute.upper()}: {timeframe} SCREEN", end="\n"*2)
+		print("-"*20, end="\n"*2)
+		pprint(self._ranking.bottom(metric, self.n, subset=subset))
+		print("-"*20, end="\n"*2)
 
 	def _summarize(self):
 		"""Runs top_pct_change for each timeframe, summarizing the results
@@ -57,46 +86,17 @@ class TopPctChangeScreen(ABC):
 		"""Runs the screen
 		"""
 		self._input()
-		self._summarize()
+		with instrumentation.span("screen", type(self).__name__):
+			self._summarize()
 
 
 class TopPricePctChangeScreen(TopPctChangeScreen):
 	"""Screens stocks with top n percentage change in price (in a timeframe)
 	"""
-	def _top_pct_change(self):
-		"""Screens stocks with top n percentage change in price
-		"""
-		print(f"TOP {self.n} STOCKS WITH HIGHEST PERCENTAGE CHANGE IN PRICE: {self.timeframe.upper()} SCREEN", end="\n"*2)
-		print("-"*20, end="\n"*2)
-		top_n = self._df_combined.nlargest(n=self.n, columns=f"price_{self.timeframe}_pct_change")
-		top_n = top_n[["stock_name_no_spaces", f"price_{self.timeframe}_pct_change"]]
-		pprint(top_n)
-		print("-"*20, end="\n"*2)
-
-		print(f"TOP {self.n} STOCKS WITH LOWEST PERCENTAGE CHANGE IN PRICE: {self.timeframe.upper()} SCREEN", end="\n"*2)
-		print("-"*20, end="\n"*2)
-		bottom_n = self._df_combined.nsmallest(n=self.n, columns=f"price_{self.timeframe}_pct_change")
-		bottom_n = bottom_n[["stock_name_no_spaces", f"price_{self.timeframe}_pct_change"]]
-		pprint(bottom_n)
-		print("-"*20, end="\n"*2)
+	_attribute = "price"
 
 
 class TopVolumePctChangeScreen(TopPctChangeScreen):
 	"""Screens stocks with top n percentage change in volume (in a timeframe)
 	"""
-	def _top_pct_change(self):
-		"""Screens stocks with top n percentage change in volume
-		"""
-		print(f"TOP {self.n} STOCKS WITH HIGHEST PERCENTAGE CHANGE IN VOLUME: {self.timeframe.upper()} SCREEN", end="\n"*2)
-		print("-"*20, end="\n"*2)
-		top_n = self._df_combined.nlargest(n=self.n, columns=f"volume_{self.timeframe}_pct_change")
-		top_n = top_n[["stock_name_no_spaces", f"volume_{self.timeframe}_pct_change"]]
-		pprint(top_n)
-		print("-"*20, end="\n"*2)
-
-		print(f"TOP {self.n} STOCKS WITH LOWEST PERCENTAGE CHANGE IN VOLUME: {self.timeframe.upper()} SCREEN", end="\n"*2)
-		print("-"*20, end="\n"*2)
-		bottom_n = self._df_combined.nsmallest(n=self.n, columns=f"volume_{self.timeframe}_pct_change")
-		bottom_n = bottom_n[["stock_name_no_spaces", f"volume_{self.timeframe}_pct_change"]]
-		pprint(bottom_n)
-		print("-"*20, end="\n"*2)
\ No newline at end of file
+	_attribute = "volume"
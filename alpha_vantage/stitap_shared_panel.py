@@ -0,0 +1,129 @@
+"""Panels (2d numpy arrays) published once for worker processes, which attach to them without copying
+
+A panel is copied into a multiprocessing.shared_memory block, or into a memmapped file when shared memory is not
+available (or not wanted). Workers receive only a SharedPanelDescriptor, which is a few hundred bytes to pickle,
+so memory use and startup cost do not grow with the number of workers.
+"""
+import os
+import tempfile
+from collections import namedtuple
+from importlib.util import find_spec
+
+_SHARED_MEMORY_FOUND = find_spec("multiprocessing.shared_memory") is not None
+
+# Everything a worker needs to attach to a panel: backend is "shared_memory" or "memmap", and name is the shared
+# memory block's name or the memmapped file's path
+SharedPanelDescriptor = namedtuple("SharedPanelDescriptor", ["backend", "name", "shape", "dtype", "columns"])
+
+
+class SharedPanel:
+	"""A panel published by its owner process; the owner closes and unlinks it when the workers are done
+
+	Can be used as a context manager, which unlinks the panel on exit
+	"""
+	def __init__(self, panel, columns=None, backend=None, directory=None):
+		"""
+		Positional Arguments:
+			panel: 2d array, or a dataframe whose values and columns are published
+
+		Keyword Arguments:
+			columns: list of column names, eg. stock names (default None, the dataframe's columns if panel is one)
+			backend: "shared_memory" or "memmap" (default None, shared memory if available)
+			directory: directory of the memmapped file (default None, the temporary directory)
+		"""
+		import numpy as np
+
+		if hasattr(panel, "columns"):
+			columns = list(panel.columns) if columns is None else columns
+			panel = panel.to_numpy()
+		values = np.ascontiguousarray(panel, dtype=np.float64)
+		backend = backend or ("shared_memory" if _SHARED_MEMORY_FOUND else "memmap")
+		if backend == "shared_memory":
+			from multiprocessing import shared_memory
+
+			self._shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+			name = self._shm.name
+			self._array = np.ndarray(values.shape, dtype=values.dtype, buffer=self._shm.buf)
+		elif backend == "memmap":
+			self._shm = None
+			file_descriptor, name = tempfile.mkstemp(prefix="stitap_panel_", suffix=".dat", dir=directory)
+			os.close(file_descriptor)
+			self._array = np.memmap(name, dtype=values.dtype, mode="w+", shape=values.shape) if values.size else np.empty(values.shape)
+		else:
+			raise ValueError(f"Backend {backend} is not supported, only shared_memory and memmap are")
+		self._array[:] = values
+		if backend == "memmap" and values.size:
+			self._array.flush()
+		self._descriptor = SharedPanelDescriptor(backend, name, values.shape, values.dtype.str, None if columns is None else tuple(columns))
+
+	@property
+	def descriptor(self):
+		return self._descriptor
+
+	@property
+	def array(self):
+		return self._array
+
+	def close(self):
+		"""Releases the owner's view of the panel
+		"""
+		self._array = None
+		if self._shm is not None:
+			self._shm.close()
+
+	def unlink(self):
+		"""Closes the panel and frees its memory (or deletes its file) once every worker has released it
+		"""
+		self.close()
+		if self._descriptor.backend == "shared_memory":
+			self._shm.unlink()
+		elif os.path.exists(self._descriptor.name):
+			os.remove(self._descriptor.name)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.unlink()
+
+
+# Panels attached by this process, by name, with the handles keeping their memory mapped
+_attached = {}
+
+
+def attach(descriptor):
+	"""Returns a read-only view of a published panel, without copying it
+
+	Attaching to the same panel again in a process returns the same view
+
+	Positional Arguments:
+		descriptor: SharedPanelDescriptor of the panel
+	"""
+	import numpy as np
+
+	if descriptor.name not in _attached:
+		if descriptor.backend == "shared_memory":
+			from multiprocessing import shared_memory
+
+			# Workers share the resource tracker of the owner process, which unlinks the block
+			handle = shared_memory.SharedMemory(name=descriptor.name)
+			array = np.ndarray(descriptor.shape, dtype=descriptor.dtype, buffer=handle.buf)
+		elif descriptor.backend == "memmap":
+			handle = None
+			array = np.memmap(descriptor.name, dtype=descriptor.dtype, mode="r", shape=descriptor.shape) if np.prod(descriptor.shape) else np.empty(descriptor.shape)
+		else:
+			raise ValueError(f"Backend {descriptor.backend} is not supported, only shared_memory and memmap are")
+		array.flags.writeable = False
+		_attached[descriptor.name] = (handle, array)
+	return _attached[descriptor.name][1]
+
+
+def detach(descriptor):
+	"""Releases this process's view of a published panel
+
+	Positional Arguments:
+		descriptor: SharedPanelDescriptor of the panel
+	"""
+	handle, _ = _attached.pop(descriptor.name, (None, None))
+	if handle is not None:
+		handle.close()
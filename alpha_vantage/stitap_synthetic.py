@@ -0,0 +1,360 @@
+"""Synthetic market data for scale testing: realistic daily bars for any number of stocks and sessions, written
+directly into the sti_stock_data layouts
+
+Returns are drawn from geometric Brownian motion (a market factor plus idiosyncratic noise, scaled by a clustered
+volatility regime) or block-bootstrapped from a panel of real returns. Volumes cluster and rise with large moves,
+dividend payers go ex twice a year and some stocks split or consolidate, and the adjusted closes are back-adjusted for
+both as in Alpha Vantage's daily adjusted series. Sessions follow the SGX calendar (weekends and public holidays are
+skipped), and some stocks list part way through the history.
+
+Stocks are generated and written in chunks by a process pool. Each chunk draws from its own seeded random generator,
+so the data depends on the seed but not on the number of workers, and each csv file is formatted with a single %
+operation on a template of the dates' rows.
+"""
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import stitap_adjust
+from stitap_adjust import daily_columns
+from stitap_calendar import sgx_trading_days
+from stitap_resample import resample_aggregations, resample_frequencies
+from stitap_ta_indicators import _ema_recursion
+
+return_models = ["gbm", "bootstrap"]
+
+# Layouts written, with the number of most recent sessions each keeps (None keeps the whole history)
+synthetic_layouts = {"original_data":100, "backtest_data":None}
+
+_sessions_per_year = 252
+# Split coefficients (eg. 2.0 for a 2-for-1 split, 0.2 for a 1-for-5 consolidation) and how often each is drawn
+_split_coefficients = [2.0, 3.0, 5.0, 0.5, 0.2]
+_split_probabilities = [0.45, 0.2, 0.1, 0.1, 0.15]
+
+
+def synthetic_stocks(n_stocks):
+	"""Returns a dictionary of synthetic stock name to ticker, eg. {"Synthetic 00001":"S00001.SI"}
+
+	Positional Arguments:
+		n_stocks: number of stocks
+	"""
+	width = max(5, len(str(n_stocks)))
+	return {f"Synthetic {number:0{width}d}": f"S{number:0{width}d}.SI" for number in range(1, n_stocks + 1)}
+
+
+def clustered_noise(n_sessions, n_columns, span, rng):
+	"""Returns AR(1) noise with unit variance (sessions x columns), which persists over about span sessions
+
+	Positional Arguments:
+		n_sessions: number of sessions
+		n_columns: number of columns
+		span: span of the exponential average the noise is smoothed with
+		rng: numpy random Generator
+	"""
+	alpha = 2 / (span + 1)
+	stationary_std = math.sqrt(alpha / (2 - alpha))
+	shocks = rng.standard_normal((n_sessions, n_columns))
+	# The recursion starts at the first shock, which is drawn from the stationary distribution
+	shocks[0] *= stationary_std
+	return _ema_recursion(shocks, alpha) / stationary_std
+
+
+def market_history(n_sessions, model="gbm", returns=None, block_length=20, market_volatility=0.15, seed=None):
+	"""Returns what every stock's returns are drawn from, shared by all chunks of stocks
+
+	For "gbm", the market factor's daily shocks and a clustered volatility regime (a multiplier with a mean of about 1);
+	for "bootstrap", the sessions of the returns panel resampled in blocks (which keeps the stocks' co-movements and
+	volatility clusters)
+
+	Positional Arguments:
+		n_sessions: number of sessions
+
+	Keyword Arguments:
+		model: "gbm" or "bootstrap" (default "gbm")
+		returns: panel of daily returns (sessions x stocks) to bootstrap from (default None, required for "bootstrap")
+		block_length: number of consecutive sessions in each bootstrapped block (default 20)
+		market_volatility: annualized volatility of the market factor (default 0.15)
+		seed: seed of the random generator (default None)
+	"""
+	from stitap_montecarlo import block_bootstrap_indices
+
+	rng = np.random.default_rng(seed)
+	if model == "gbm":
+		regime = np.exp(0.4 * clustered_noise(n_sessions, 1, 60, rng)[:, 0] - 0.08)
+		return {"model": model, "factor": rng.standard_normal(n_sessions), "regime": regime,
+				"market_volatility": market_volatility}
+	if model == "bootstrap":
+		if returns is None:
+			raise ValueError("Bootstrapped histories need a panel of returns to resample")
+		log_returns = np.log1p(np.nan_to_num(np.asarray(returns, dtype=np.float64)))
+		sessions = block_bootstrap_indices(len(log_returns), 1, block_length, rng)[0]
+		# Resampled histories longer than the panel repeat its blocks
+		sessions = np.resize(sessions, n_sessions)
+		return {"model": model, "returns": log_returns[sessions]}
+	raise ValueError(f"Model {model} is not supported, only {', '.join(return_models)} are")
+
+
+def generate_bars(market, n_stocks, rng, listing_fraction=0.2, dividend_fraction=0.7, splits_per_year=0.05):
+	"""Returns the daily bars of a chunk of stocks, as a dictionary of daily column to panel (sessions x stocks), and
+	the first session of each stock (panels are NaN before it)
+
+	Positional Arguments:
+		market: dictionary returned by market_history()
+		n_stocks: number of stocks
+		rng: numpy random Generator
+
+	Keyword Arguments:
+		listing_fraction: fraction of the stocks which list part way through the history (default 0.2)
+		dividend_fraction: fraction of the stocks which pay dividends (default 0.7)
+		splits_per_year: expected number of splits and consolidations of each stock per year (default 0.05)
+	"""
+	if market["model"] == "gbm":
+		n_sessions = len(market["factor"])
+		drift = rng.normal(0.06, 0.08, n_stocks)
+		volatility = rng.uniform(0.15, 0.5, n_stocks)
+		systematic = rng.uniform(0.5, 1.5, n_stocks) * market["market_volatility"]
+		idiosyncratic = np.sqrt(np.maximum(volatility ** 2 - systematic ** 2, 0.05 ** 2))
+		shocks = systematic * market["factor"][:, None] + idiosyncratic * rng.standard_normal((n_sessions, n_stocks))
+		daily_volatility = market["regime"][:, None] * np.sqrt(systematic ** 2 + idiosyncratic ** 2) / math.sqrt(_sessions_per_year)
+		log_returns = (drift - 0.5 * volatility ** 2) / _sessions_per_year + market["regime"][:, None] * shocks / math.sqrt(_sessions_per_year)
+	else:
+		source = market["returns"]
+		n_sessions = len(source)
+		columns = rng.integers(0, source.shape[1], n_stocks)
+		source_volatility = source.std(axis=0)[columns]
+		# Stocks resampled from the same column differ by some idiosyncratic noise
+		log_returns = source[:, columns] + 0.25 * source_volatility * rng.standard_normal((n_sessions, n_stocks))
+		daily_volatility = np.broadcast_to(source_volatility, (n_sessions, n_stocks))
+	rows = np.arange(n_sessions)[:, None]
+
+	# Splits and consolidations, and semiannual dividends (as a fraction of the previous close) on other sessions
+	split = rng.random((n_sessions, n_stocks)) < splits_per_year / _sessions_per_year
+	split[0] = False
+	split_coefficients = np.ones((n_sessions, n_stocks))
+	split_coefficients[split] = rng.choice(_split_coefficients, size=int(split.sum()), p=_split_probabilities)
+	half_year = _sessions_per_year // 2
+	pays = rng.random(n_stocks) < dividend_fraction
+	dividend_yield = np.where(pays, rng.uniform(0.01, 0.07, n_stocks), 0)
+	ex_dividend = (rows >= 1) & ((rows - rng.integers(1, half_year + 1, n_stocks)) % half_year == 0) & pays & ~split
+	dividend_fractions = np.where(ex_dividend, dividend_yield / 2, 0)
+
+	# Prices fall by the dividends on their ex-dates, and are multiplied by the coefficients of later splits
+	log_prices = rng.normal(math.log(1.5), 1, n_stocks) + np.cumsum(log_returns + np.log1p(-dividend_fractions), axis=0)
+	later_splits = np.cumprod(split_coefficients[::-1], axis=0)[::-1] / split_coefficients
+	close = np.maximum(np.round(np.exp(log_prices) * later_splits, 3), 0.001)
+	previous_close = np.vstack([close[:1], close[:-1]])
+	dividend = np.round(dividend_fractions * previous_close, 4)
+
+	# Adjusted closes are back-adjusted for every later dividend and split
+	adjusted_close = stitap_adjust.adjusted_close(close, dividend, split_coefficients)
+
+	# Opening gaps and intraday ranges widen with the size of the move
+	ranges = 0.5 * (np.abs(log_returns) + daily_volatility)
+	open_ = np.maximum(np.round(close * np.exp(0.8 * ranges * rng.standard_normal((n_sessions, n_stocks))), 3), 0.001)
+	high = np.round(np.maximum(open_, close) * np.exp(0.5 * ranges * np.abs(rng.standard_normal((n_sessions, n_stocks)))), 3)
+	low = np.maximum(np.round(np.minimum(open_, close) * np.exp(-0.5 * ranges * np.abs(rng.standard_normal((n_sessions, n_stocks)))), 3), 0.001)
+
+	# Volumes (in board lots of 100 shares) cluster, and rise with the size of the move
+	typical_volume = np.exp(rng.normal(math.log(2e6), 1.2, n_stocks))
+	move = np.minimum(np.abs(log_returns) / daily_volatility, 6)
+	volume_shocks = 0.6 * clustered_noise(n_sessions, n_stocks, 20, rng) + 0.3 * rng.standard_normal((n_sessions, n_stocks))
+	volume = np.round(typical_volume * np.exp(volume_shocks + 0.3 * move - 0.5) / 100) * 100
+
+	late = rng.random(n_stocks) < listing_fraction
+	listed = np.where(late, rng.integers(0, max(1, int(0.8 * n_sessions)), n_stocks), 0)
+	bars = dict(zip(daily_columns, [open_, high, low, close, adjusted_close, volume, dividend, split_coefficients]))
+	before_listing = rows < listed
+	for panel in bars.values():
+		panel[before_listing] = np.nan
+	return bars, listed
+
+
+def resample_bars(dates, bars, listed, timeframe):
+	"""Derives weekly or monthly bars from the daily bars of generate_bars(), as resample_daily() does
+
+	Returns the last session of each period, a dictionary of resampled column to panel (periods x stocks) and the
+	first period of each stock
+
+	Positional Arguments:
+		dates: DatetimeIndex of the sessions (trading days only)
+		bars: dictionary of daily column to panel (sessions x stocks)
+		listed: first session of each stock
+		timeframe: "weekly" or "monthly"
+	"""
+	if timeframe not in resample_frequencies:
+		raise ValueError(f"Timeframe {timeframe} is not supported, only {', '.join(resample_frequencies)} are")
+	periods = dates.to_period(resample_frequencies[timeframe]).asi8
+	starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+	ends = np.r_[starts[1:] - 1, len(dates) - 1]
+	# Stocks start at the first period they traded in, which opens on their first session
+	first_rows = np.maximum(starts[:, None], listed)
+	columns = np.arange(len(listed))
+
+	reducers = {"first": lambda panel: panel[np.minimum(first_rows, len(dates) - 1), columns],
+				"last": lambda panel: panel[ends],
+				"max": lambda panel: np.fmax.reduceat(panel, starts, axis=0),
+				"min": lambda panel: np.fmin.reduceat(panel, starts, axis=0),
+				"sum": lambda panel: np.add.reduceat(np.nan_to_num(panel), starts, axis=0)}
+	resampled = {column: reducers[aggregation](bars[column]) for column, aggregation in resample_aggregations.items()}
+	return ends, resampled, np.searchsorted(ends, listed)
+
+
+def _row_template(dates, columns):
+	"""Returns the csv template of all rows (most recent first) and where each row ends, so that the template of the
+	n most recent rows is template[:ends[n - 1]]
+	"""
+	formats = ",".join("%d" if column == "6. volume" else "%.4f" for column in columns)
+	rows = [f"{date},{formats}\n" for date in dates[::-1]]
+	return "".join(rows), np.cumsum([len(row) for row in rows])
+
+
+def _write_csvs(directory, stock_names, columns, panels, listed, template, ends):
+	"""Writes one csv file per stock, from its first session to the most recent
+	"""
+	header = ",".join(["date"] + columns) + "\n"
+	values = np.stack([panels[column] for column in columns], axis=2)[::-1]
+	n_rows = len(values)
+	for column, stock_name in enumerate(stock_names):
+		stock_rows = n_rows - listed[column]
+		if stock_rows <= 0:
+			continue
+		text = template[:ends[stock_rows - 1]] % tuple(values[:stock_rows, column].ravel().tolist())
+		with open(f"{directory}/{stock_name.replace(' ', '_')}.csv", "w") as csv_file:
+			csv_file.write(header)
+			csv_file.write(text)
+
+
+_worker = {}
+
+
+def _init_worker(settings):
+	"""Keeps the settings shared by every chunk in the worker process
+	"""
+	_worker.clear()
+	_worker.update(settings)
+
+
+def _write_chunk(chunk):
+	"""Generates and writes a chunk of stocks, returning the number of files written
+	"""
+	number, stock_names = chunk
+	settings = _worker
+	dates = settings["dates"]
+	rng = np.random.default_rng([settings["seed"], number])
+	bars, listed = generate_bars(settings["market"], len(stock_names), rng, **settings["bar_settings"])
+
+	n_files = 0
+	for layout, sessions in settings["layouts"].items():
+		first = 0 if sessions is None else max(len(dates) - sessions, 0)
+		layout_bars = {column: panel[first:] for column, panel in bars.items()}
+		layout_listed = np.maximum(listed - first, 0)
+		for timeframe in settings["timeframes"]:
+			directory = f"{settings['directory']}/{layout}/{timeframe}"
+			template, ends = settings["templates"][timeframe]
+			if timeframe == "daily":
+				_write_csvs(directory, stock_names, daily_columns, layout_bars, layout_listed, template, ends)
+			else:
+				_, resampled, listed_periods = resample_bars(dates[first:], layout_bars, layout_listed, timeframe)
+				_write_csvs(directory, stock_names, list(resample_aggregations), resampled, listed_periods, template, ends)
+			n_files += len(stock_names)
+	return n_files
+
+
+def write_synthetic_data(n_stocks, start_date="2000-01-01", end_date="2019-12-31", directory="sti_stock_data",
+						 model="gbm", returns=None, timeframes=("daily", "weekly", "monthly"), layouts=None,
+						 chunk_size=200, max_workers=None, seed=None, **bar_settings):
+	"""Generates synthetic stocks and writes their csv files into the sti_stock_data layouts, in a process pool
+
+	Returns a dictionary of stock name to ticker, eg. for load_backtest_prices() or as the sti_stocks of a screen
+
+	Positional Arguments:
+		n_stocks: number of stocks
+
+	Keyword Arguments:
+		start_date: first date of the history (default "2000-01-01")
+		end_date: last date of the history (default "2019-12-31")
+		directory: root of the data layouts (default "sti_stock_data")
+		model: "gbm" or "bootstrap" (default "gbm")
+		returns: panel of daily returns (sessions x stocks) to bootstrap from (default None, required for "bootstrap")
+		timeframes: timeframes written (default "daily", "weekly" and "monthly")
+		layouts: dictionary of layout to the number of most recent sessions it keeps (default synthetic_layouts)
+		chunk_size: number of stocks generated and written by each task (default 200)
+		max_workers: number of worker processes (default os.cpu_count())
+		seed: seed of the random generators (default None, a random seed)
+		**bar_settings: listing_fraction, dividend_fraction and splits_per_year of generate_bars()
+	"""
+	for timeframe in timeframes:
+		if timeframe != "daily" and timeframe not in resample_frequencies:
+			raise ValueError(f"Timeframe {timeframe} is not supported, only daily, {', '.join(resample_frequencies)} are")
+	dates = sgx_trading_days(start_date, end_date)
+	if not len(dates):
+		raise ValueError(f"There are no SGX trading days between {start_date} and {end_date}")
+	if seed is None:
+		seed = np.random.SeedSequence().entropy
+	layouts = synthetic_layouts if layouts is None else layouts
+	stocks = synthetic_stocks(n_stocks)
+
+	templates = {}
+	for timeframe in timeframes:
+		if timeframe == "daily":
+			templates[timeframe] = _row_template(dates.strftime("%Y-%m-%d"), daily_columns)
+		else:
+			periods = dates.to_period(resample_frequencies[timeframe]).asi8
+			ends = np.r_[np.flatnonzero(periods[1:] != periods[:-1]), len(dates) - 1]
+			templates[timeframe] = _row_template(dates[ends].strftime("%Y-%m-%d"), list(resample_aggregations))
+		for layout in layouts:
+			os.makedirs(f"{directory}/{layout}/{timeframe}", exist_ok=True)
+
+	settings = {"dates": dates, "seed": seed, "directory": directory, "layouts": layouts, "timeframes": list(timeframes),
+				"templates": templates, "bar_settings": bar_settings,
+				"market": market_history(len(dates), model=model, returns=returns, seed=[seed, 0])}
+	stock_names = list(stocks)
+	# Chunks are numbered from 1, as 0 seeds the market history
+	chunks = [(number, stock_names[start:start + chunk_size])
+			  for number, start in enumerate(range(0, n_stocks, chunk_size), start=1)]
+	max_workers = min(max_workers or os.cpu_count(), len(chunks))
+	if max_workers <= 1:
+		_init_worker(settings)
+		for chunk in chunks:
+			_write_chunk(chunk)
+	else:
+		with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(settings,)) as executor:
+			list(executor.map(_write_chunk, chunks))
+	return stocks
+
+
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Writes synthetic stock data into the sti_stock_data layouts for scale testing")
+	parser.add_argument("--stocks", type=int, default=1000)
+	parser.add_argument("--years", type=float, default=20, help="length of the history, up to the end date (default 20)")
+	parser.add_argument("--end-date", default="2019-12-31")
+	parser.add_argument("--model", choices=return_models, default="gbm",
+						help="bootstrap resamples the returns of the 30 STI stocks' backtest data")
+	parser.add_argument("--directory", default="sti_stock_data")
+	parser.add_argument("--workers", type=int, default=None)
+	parser.add_argument("--chunk-size", type=int, default=200)
+	parser.add_argument("--seed", type=int, default=None)
+	args = parser.parse_args()
+
+	import pandas as pd
+
+	end_date = pd.Timestamp(args.end_date)
+	start_date = end_date - pd.Timedelta(days=round(args.years * 365.25)) + pd.Timedelta(days=1)
+	returns = None
+	if args.model == "bootstrap":
+		from stitap_backtest import load_backtest_prices
+		from stitap_ta_screens import sti_stocks
+
+		_, prices, _ = load_backtest_prices(sti_stocks)
+		returns = prices[1:] / prices[:-1] - 1
+
+	start = time.perf_counter()
+	stocks = write_synthetic_data(args.stocks, start_date, end_date, directory=args.directory, model=args.model,
+								  returns=returns, chunk_size=args.chunk_size, max_workers=args.workers, seed=args.seed)
+	print(f"SYNTHESIZED: {len(stocks)} STOCKS FROM {start_date:%Y-%m-%d} TO {end_date:%Y-%m-%d} INTO {args.directory} "
+		  f"({time.perf_counter() - start:.3f}s)", end="\n"*2)
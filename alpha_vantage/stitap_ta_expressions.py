@@ -0,0 +1,466 @@
+"""Composite screens built from technical indicator conditions
+
+Screens can be written in python, eg. (RSI(14) < 30) & MACDCrossover("bullish") & (VolumeChange(5) > 50), or parsed
+from text, eg. parse_screen("RSI(14) < 30 AND MACD BULLISH AND VOLUME_CHANGE(5) > 50"). Conditions joined by AND
+only see the stocks which passed the previous ones, and intermediates (price changes, gains and losses, EMAs, RSI)
+are computed once per ScreenContext, for the stocks which need them.
+"""
+from abc import ABC, abstractmethod
+import operator
+import re
+
+import numpy as np
+
+import stitap_ta_indicators as indicators
+
+
+class ScreenContext:
+	"""Holds the price and volume panels of a screen, and the intermediates computed from them
+	"""
+	def __init__(self, prices, volumes, stock_names):
+		"""
+		Positional Arguments:
+			prices: adjusted close panel (sessions x stocks)
+			volumes: volume panel (sessions x stocks)
+			stock_names: list of stock names (one per column)
+		"""
+		self._prices = np.asarray(prices, dtype=float)
+		self._volumes = np.asarray(volumes, dtype=float)
+		self._stock_names = list(stock_names)
+		self._intermediates = {}
+		self._computed = {}
+
+	@classmethod
+	def from_prepared_data(cls, prepared_data):
+		"""Creates a context from a PrepareTechnicalAnalysis instance
+
+		Positional Arguments:
+			prepared_data: PrepareTechnicalAnalysis instance
+		"""
+		prices = prepared_data.adjusted_close_panel
+		return cls(prices.values, prepared_data.volume_panel.values, prices.columns)
+
+	@property
+	def stock_names(self):
+		return self._stock_names
+
+	@property
+	def prices(self):
+		return self._prices
+
+	@property
+	def volumes(self):
+		return self._volumes
+
+	@property
+	def computed_stocks(self):
+		"""Number of stocks each intermediate has been computed for"""
+		return {key: int(computed.sum()) for key, computed in self._computed.items()}
+
+	def intermediate(self, key, columns, compute):
+		"""Returns an intermediate for the given columns, computing it only for the columns it is missing
+
+		Positional Arguments:
+			key: hashable key of the intermediate, eg. ("rsi", 14)
+			columns: array of column indices (stocks)
+			compute: function computing the intermediate for an array of column indices, with stocks on the last axis
+		"""
+		if key not in self._computed:
+			self._intermediates[key] = None
+			self._computed[key] = np.zeros(len(self._stock_names), dtype=bool)
+		missing = columns[~self._computed[key][columns]]
+		if len(missing):
+			values = compute(missing)
+			if self._intermediates[key] is None:
+				self._intermediates[key] = np.full(values.shape[:-1] + (len(self._stock_names),), np.nan)
+			self._intermediates[key][..., missing] = values
+			self._computed[key][missing] = True
+		return self._intermediates[key][..., columns]
+
+	def price_changes(self, columns):
+		return self.intermediate(("price_changes",), columns,
+								 lambda missing: indicators.price_changes(self._prices[:, missing]))
+
+	def gains_losses(self, columns):
+		"""Returns gains and losses stacked as one array (2 x sessions x stocks)"""
+		return self.intermediate(("gains_losses",), columns,
+								 lambda missing: np.stack(indicators.gains_losses(self.price_changes(missing))))
+
+	def rsi(self, timeframe, columns):
+		def compute(missing):
+			gains, losses = self.gains_losses(missing)
+			return indicators.rsi_from_gains_losses(gains, losses, [timeframe])[0]
+		return self.intermediate(("rsi", timeframe), columns, compute)
+
+	def ema(self, span, columns):
+		return self.intermediate(("ema", span), columns, lambda missing: indicators.ema(self._prices[:, missing], span))
+
+	def macd(self, fast_span, slow_span, columns):
+		return self.intermediate(("macd", fast_span, slow_span), columns,
+								 lambda missing: self.ema(fast_span, missing) - self.ema(slow_span, missing))
+
+	def macd_signal(self, fast_span, slow_span, signal_span, columns):
+		return self.intermediate(("macd_signal", fast_span, slow_span, signal_span), columns,
+								 lambda missing: indicators.ema(self.macd(fast_span, slow_span, missing), signal_span))
+
+
+class Indicator(ABC):
+	"""Abstract base class for an indicator whose most recent value is compared with a level, eg. RSI(14) < 30
+	"""
+	# Relative cost of computing the indicator, cheaper conditions are evaluated first
+	cost = 1
+
+	def __lt__(self, level):
+		return Comparison(self, "<", level)
+
+	def __le__(self, level):
+		return Comparison(self, "<=", level)
+
+	def __gt__(self, level):
+		return Comparison(self, ">", level)
+
+	def __ge__(self, level):
+		return Comparison(self, ">=", level)
+
+	@abstractmethod
+	def latest(self, context, columns):
+		"""Returns the most recent value of the indicator for the given columns
+
+		Positional Arguments:
+			context: ScreenContext
+			columns: array of column indices (stocks)
+		"""
+		pass
+
+
+class RSI(Indicator):
+	"""Relative Strength Index, as in RSIScreener
+	"""
+	cost = 2
+
+	def __init__(self, timeframe=14):
+		self.timeframe = int(timeframe)
+
+	def latest(self, context, columns):
+		return context.rsi(self.timeframe, columns)[-1]
+
+	def __str__(self):
+		return f"RSI({self.timeframe})"
+
+
+class StochRSI(Indicator):
+	"""Stochastic Relative Strength Index, as in StochRSIScreener
+	"""
+	cost = 3
+
+	def __init__(self, timeframe=14):
+		self.timeframe = int(timeframe)
+
+	def latest(self, context, columns):
+		rsi = context.rsi(self.timeframe, columns)
+		return indicators.latest_stoch_rsi_from_rsi(rsi[None], [self.timeframe])[0]
+
+	def __str__(self):
+		return f"STOCHRSI({self.timeframe})"
+
+
+class PriceChange(Indicator):
+	"""Percentage change in adjusted close over a number of sessions
+	"""
+	def __init__(self, period=1):
+		self.period = int(period)
+
+	def latest(self, context, columns):
+		return indicators.latest_pct_change(context.prices[:, columns], self.period)
+
+	def __str__(self):
+		return f"PRICE_CHANGE({self.period})"
+
+
+class VolumeChange(Indicator):
+	"""Percentage change in volume over a number of sessions
+	"""
+	def __init__(self, period=1):
+		self.period = int(period)
+
+	def latest(self, context, columns):
+		return indicators.latest_pct_change(context.volumes[:, columns], self.period)
+
+	def __str__(self):
+		return f"VOLUME_CHANGE({self.period})"
+
+
+class ScreenExpression(ABC):
+	"""Abstract base class for a screen condition, combined with & (AND) and | (OR)
+	"""
+	cost = 1
+
+	def __and__(self, other):
+		return AllOf([self, other])
+
+	def __or__(self, other):
+		return AnyOf([self, other])
+
+	@abstractmethod
+	def _evaluate(self, context, columns):
+		"""Returns a boolean array which is True for the given columns passing the condition
+
+		Positional Arguments:
+			context: ScreenContext
+			columns: array of column indices (stocks) to evaluate the condition for
+		"""
+		pass
+
+	@abstractmethod
+	def indicators(self):
+		"""Returns the indicators used by the condition
+		"""
+		pass
+
+	def evaluate(self, context):
+		"""Returns a boolean array which is True for the stocks passing the screen
+
+		Positional Arguments:
+			context: ScreenContext
+		"""
+		columns = np.arange(len(context.stock_names))
+		return self._evaluate(context, columns)
+
+	def run(self, context):
+		"""Returns the names of the stocks passing the screen
+
+		Positional Arguments:
+			context: ScreenContext
+		"""
+		passed = self.evaluate(context)
+		return [stock_name for stock_name, stock_passed in zip(context.stock_names, passed) if stock_passed]
+
+
+class Comparison(ScreenExpression):
+	"""Compares the most recent value of an indicator with a level
+	"""
+	_operators = {"<":operator.lt, "<=":operator.le, ">":operator.gt, ">=":operator.ge}
+
+	def __init__(self, indicator, symbol, level):
+		self.indicator = indicator
+		self.symbol = symbol
+		self.level = float(level)
+		self.cost = indicator.cost
+
+	def _evaluate(self, context, columns):
+		values = self.indicator.latest(context, columns)
+		with np.errstate(invalid="ignore"):
+			return self._operators[self.symbol](values, self.level)
+
+	def indicators(self):
+		return [self.indicator]
+
+	def __str__(self):
+		return f"{self.indicator} {self.symbol} {self.level:g}"
+
+
+class MACDCrossover(ScreenExpression):
+	"""MACD signal line crossover on the most recent session: "bullish" (MACD crosses above its signal line) or
+	"bearish" (MACD crosses below its signal line)
+	"""
+	cost = 3
+
+	def __init__(self, direction, fast_span=12, slow_span=26, signal_span=9):
+		if direction not in ("bullish", "bearish"):
+			raise ValueError(f"MACD crossover direction {direction} is not supported, only bullish and bearish are")
+		self.direction = direction
+		self.spans = (int(fast_span), int(slow_span), int(signal_span))
+
+	def _evaluate(self, context, columns):
+		macd_line = context.macd(self.spans[0], self.spans[1], columns)[-2:]
+		signal_line = context.macd_signal(*self.spans, columns)[-2:]
+		bullish, bearish = indicators.crossovers(macd_line, signal_line)
+		return bullish[-1] if self.direction == "bullish" else bearish[-1]
+
+	def indicators(self):
+		return []
+
+	def __str__(self):
+		return f"MACD({self.spans[0]}, {self.spans[1]}, {self.spans[2]}) {self.direction.upper()}"
+
+
+class AllOf(ScreenExpression):
+	"""Passes stocks passing every condition; each condition (cheapest first) only sees the stocks passing the previous ones
+	"""
+	def __init__(self, conditions):
+		flattened = []
+		for condition in conditions:
+			flattened.extend(condition.conditions if isinstance(condition, AllOf) else [condition])
+		self.conditions = sorted(flattened, key=lambda condition: condition.cost)
+		self.cost = sum(condition.cost for condition in self.conditions)
+
+	def _evaluate(self, context, columns):
+		remaining = columns
+		for condition in self.conditions:
+			remaining = remaining[condition._evaluate(context, remaining)]
+			if not len(remaining):
+				break
+		return np.isin(columns, remaining)
+
+	def indicators(self):
+		return [indicator for condition in self.conditions for indicator in condition.indicators()]
+
+	def __str__(self):
+		return " AND ".join(f"({condition})" if isinstance(condition, AnyOf) else str(condition) for condition in self.conditions)
+
+
+class AnyOf(ScreenExpression):
+	"""Passes stocks passing any condition; each condition (cheapest first) only sees the stocks failing the previous ones
+	"""
+	def __init__(self, conditions):
+		flattened = []
+		for condition in conditions:
+			flattened.extend(condition.conditions if isinstance(condition, AnyOf) else [condition])
+		self.conditions = sorted(flattened, key=lambda condition: condition.cost)
+		self.cost = sum(condition.cost for condition in self.conditions)
+
+	def _evaluate(self, context, columns):
+		remaining = columns
+		for condition in self.conditions:
+			remaining = remaining[~condition._evaluate(context, remaining)]
+			if not len(remaining):
+				break
+		return ~np.isin(columns, remaining)
+
+	def indicators(self):
+		return [indicator for condition in self.conditions for indicator in condition.indicators()]
+
+	def __str__(self):
+		return " OR ".join(str(condition) for condition in self.conditions)
+
+
+# Indicators which can be compared with a level in screen text
+screen_indicators = {"RSI":RSI, "STOCHRSI":StochRSI, "PRICE_CHANGE":PriceChange, "VOLUME_CHANGE":VolumeChange}
+
+_TOKEN = re.compile(r"(?:(?P<number>-?\d+\.?\d*|-?\.\d+)|(?P<name>[A-Za-z_]+)|(?P<symbol><=|>=|<|>|\(|\)|,))")
+
+
+def _tokenize(text):
+	"""Splits screen text into (kind, value) tokens
+
+	Positional Arguments:
+		text: screen text
+	"""
+	tokens = []
+	position = 0
+	text = text.strip()
+	while position < len(text):
+		while text[position].isspace():
+			position += 1
+		match = _TOKEN.match(text, position)
+		if match is None:
+			raise ValueError(f"Unexpected character {text[position]!r} at position {position}")
+		kind = match.lastgroup
+		value = match.group(kind)
+		tokens.append((kind, value.upper() if kind == "name" else value))
+		position = match.end()
+	return tokens
+
+
+class _Parser:
+	"""Recursive descent parser for screen text:
+
+	screen := all ("OR" all)*
+	all := condition ("AND" condition)*
+	condition := "(" screen ")" | "MACD" [parameters] ("BULLISH" | "BEARISH") | indicator [parameters] operator number
+	parameters := "(" number ("," number)* ")"
+	"""
+	def __init__(self, text):
+		self._tokens = _tokenize(text)
+		self._position = 0
+
+	def _peek(self):
+		return self._tokens[self._position] if self._position < len(self._tokens) else (None, None)
+
+	def _next(self, description):
+		kind, value = self._peek()
+		if kind is None:
+			raise ValueError(f"Unexpected end of screen, expected {description}")
+		self._position += 1
+		return kind, value
+
+	def _expect(self, expected):
+		_, value = self._next(expected)
+		if value != expected:
+			raise ValueError(f"Expected {expected} but found {value}")
+
+	def _number(self):
+		kind, value = self._next("a number")
+		if kind != "number":
+			raise ValueError(f"Expected a number but found {value}")
+		return float(value)
+
+	def _parameters(self):
+		if self._peek()[1] != "(":
+			return []
+		self._expect("(")
+		parameters = [self._number()]
+		while self._peek()[1] == ",":
+			self._expect(",")
+			parameters.append(self._number())
+		self._expect(")")
+		return parameters
+
+	def parse(self):
+		screen = self._screen()
+		if self._peek()[0] is not None:
+			raise ValueError(f"Unexpected {self._peek()[1]} after the end of the screen")
+		return screen
+
+	def _screen(self):
+		conditions = [self._all()]
+		while self._peek()[1] == "OR":
+			self._expect("OR")
+			conditions.append(self._all())
+		return conditions[0] if len(conditions) == 1 else AnyOf(conditions)
+
+	def _all(self):
+		conditions = [self._condition()]
+		while self._peek()[1] == "AND":
+			self._expect("AND")
+			conditions.append(self._condition())
+		return conditions[0] if len(conditions) == 1 else AllOf(conditions)
+
+	def _condition(self):
+		kind, value = self._next("a condition")
+		if value == "(":
+			screen = self._screen()
+			self._expect(")")
+			return screen
+		if value == "MACD":
+			parameters = self._parameters()
+			if len(parameters) not in (0, 3):
+				raise ValueError("MACD takes either no parameters or three (fast span, slow span, signal span)")
+			_, direction = self._next("BULLISH or BEARISH")
+			if direction not in ("BULLISH", "BEARISH"):
+				raise ValueError(f"Expected BULLISH or BEARISH but found {direction}")
+			return MACDCrossover(direction.lower(), *parameters)
+		if value not in screen_indicators:
+			raise ValueError(f"Unknown indicator {value}, supported indicators are MACD, {', '.join(screen_indicators)}")
+		parameters = self._parameters()
+		if len(parameters) > 1:
+			raise ValueError(f"{value} takes at most one parameter")
+		indicator = screen_indicators[value](*parameters)
+		kind, symbol = self._next("a comparison")
+		if symbol not in Comparison._operators:
+			raise ValueError(f"Expected a comparison (<, <=, > or >=) but found {symbol}")
+		return Comparison(indicator, symbol, self._number())
+
+
+def parse_screen(text):
+	"""Parses screen text into a screen expression, eg. "RSI(14) < 30 AND MACD BULLISH AND VOLUME_CHANGE(5) > 50"
+
+	Conditions are joined with AND / OR (AND binds tighter) and may be grouped with brackets. Supported conditions:
+		RSI(timeframe) / STOCHRSI(timeframe) compared with a level, eg. STOCHRSI(14) >= 0.8
+		PRICE_CHANGE(sessions) / VOLUME_CHANGE(sessions) compared with a percentage, eg. PRICE_CHANGE(5) < -3
+		MACD BULLISH / MACD BEARISH (signal line crossovers), optionally with spans, eg. MACD(12, 26, 9) BULLISH
+
+	Positional Arguments:
+		text: screen text (case insensitive)
+	"""
+	return _Parser(text).parse()
@@ -0,0 +1,281 @@
+"""Technical indicators computed for all stocks (and all periods) at once
+
+A price panel is a 2d numpy array of adjusted closes, one row per session (least recent on top) and one column
+per stock. The formulas follow the screens in stitap_ta_screens.
+"""
+import numpy as np
+
+
+def price_changes(prices):
+	"""Returns the daily changes in price, with NaN on the first row
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+	"""
+	changes = np.empty_like(prices, dtype=float)
+	changes[0] = np.nan
+	np.subtract(prices[1:], prices[:-1], out=changes[1:])
+	return changes
+
+
+def gains_losses(changes):
+	"""Splits price changes into gains and losses (both positive), keeping NaN values
+
+	Positional Arguments:
+		changes: panel of price changes (dates x stocks)
+	"""
+	gains = np.where(changes < 0, 0.0, changes)
+	losses = np.where(changes > 0, 0.0, -changes)
+	return gains, losses
+
+
+def _rolling_means(values, periods):
+	"""Returns the rolling means of values for each period as a (periods x dates x stocks) array
+
+	A window containing a NaN value has a NaN mean, as with pandas' rolling(period).mean()
+
+	Positional Arguments:
+		values: panel (dates x stocks)
+		periods: 1d array of window lengths
+	"""
+	n_dates = values.shape[0]
+	valid = ~np.isnan(values)
+	# Running sums and counts with a leading row of zeros, so that the window ending at t is [t + 1 - period, t + 1)
+	sums = np.zeros((n_dates + 1,) + values.shape[1:])
+	counts = np.zeros((n_dates + 1,) + values.shape[1:], dtype=np.int64)
+	np.cumsum(np.where(valid, values, 0.0), axis=0, out=sums[1:])
+	np.cumsum(valid, axis=0, out=counts[1:])
+
+	ends = np.arange(1, n_dates + 1)
+	starts = ends[None, :] - periods[:, None]
+	in_range = starts >= 0
+	starts = np.where(in_range, starts, 0)
+	window_sums = sums[ends][None] - sums[starts]
+	window_counts = counts[ends][None] - counts[starts]
+	complete = in_range[..., None] & (window_counts == periods[:, None, None])
+	return np.where(complete, window_sums / periods[:, None, None], np.nan)
+
+
+def _smoothed_means(values, periods):
+	"""Returns the adjusted rolling means used by the RSI screen for each period (periods x dates x stocks)
+
+	Each value is ((previous rolling mean * (period - 1)) + current value) / period, and the first value is the
+	first rolling mean (see: https://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:relative_strength_index_rsi)
+
+	Positional Arguments:
+		values: panel of gains or losses (dates x stocks)
+		periods: 1d array of window lengths
+	"""
+	rolling_means = _rolling_means(values, periods)
+	smoothed = np.full_like(rolling_means, np.nan)
+	weights = periods[:, None, None]
+	smoothed[:, 1:] = ((rolling_means[:, :-1] * (weights - 1)) + values[None, 1:]) / weights
+	first = ~np.isnan(rolling_means)
+	first[:, 1:] &= np.isnan(rolling_means[:, :-1])
+	smoothed[first] = rolling_means[first]
+	return smoothed
+
+
+def rsi_from_gains_losses(gains, losses, periods):
+	"""Returns the relative strength index for every period (periods x dates x stocks) from precomputed gains and losses
+
+	Positional Arguments:
+		gains: panel of gains (dates x stocks)
+		losses: panel of losses (dates x stocks)
+		periods: list of RSI timeframes (in days)
+	"""
+	periods = np.asarray(periods, dtype=np.int64)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		relative_strength = _smoothed_means(gains, periods) / _smoothed_means(losses, periods)
+		return 100 - (100 / (1 + relative_strength))
+
+
+def rsi_sweep(prices, periods):
+	"""Returns the relative strength index of every stock for every period (periods x dates x stocks)
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+		periods: list of RSI timeframes (in days)
+	"""
+	gains, losses = gains_losses(price_changes(prices))
+	return rsi_from_gains_losses(gains, losses, periods)
+
+
+def rsi(prices, period):
+	"""Returns the relative strength index of every stock (dates x stocks)
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+		period: RSI timeframe (in days)
+	"""
+	return rsi_sweep(prices, [period])[0]
+
+
+def latest_stoch_rsi_from_rsi(rsi_values, periods):
+	"""Returns the most recent stochastic relative strength index for every period (periods x stocks) from RSI series
+
+	Positional Arguments:
+		rsi_values: RSI series for every period (periods x dates x stocks), eg. from rsi_sweep()
+		periods: list of StochRSI timeframes (in days), the same as the RSI timeframes
+	"""
+	periods = np.asarray(periods, dtype=np.int64)
+	n_dates = rsi_values.shape[1]
+	# Only the last period rows of each RSI series are needed for the most recent value
+	rows = np.arange(n_dates)
+	window = (rows[None, :] >= n_dates - periods[:, None])[..., None]
+	window_has_nan = (np.isnan(rsi_values) & window).any(axis=1)
+	highest = np.where(window, rsi_values, -np.inf).max(axis=1)
+	lowest = np.where(window, rsi_values, np.inf).min(axis=1)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		stoch_rsi = (rsi_values[:, -1] - lowest) / (highest - lowest)
+	stoch_rsi[window_has_nan | (periods[:, None] > n_dates)] = np.nan
+	return stoch_rsi
+
+
+def stoch_rsi(prices, period):
+	"""Returns the stochastic relative strength index of every session (dates x stocks)
+
+	A window containing a NaN RSI value has a NaN StochRSI, as with pandas' rolling(period).max() and min()
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+		period: RSI and StochRSI timeframe (in days)
+	"""
+	rsi_values = rsi(prices, period)
+	stoch_rsi_values = np.full(rsi_values.shape, np.nan)
+	if period > rsi_values.shape[0]:
+		return stoch_rsi_values
+	windows = np.lib.stride_tricks.sliding_window_view(rsi_values, period, axis=0)
+	highest = windows.max(axis=-1)
+	lowest = windows.min(axis=-1)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		stoch_rsi_values[period - 1:] = (rsi_values[period - 1:] - lowest) / (highest - lowest)
+	return stoch_rsi_values
+
+
+def latest_stoch_rsi_sweep(prices, periods):
+	"""Returns the most recent stochastic relative strength index of every stock for every period (periods x stocks)
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+		periods: list of StochRSI timeframes (in days)
+	"""
+	return latest_stoch_rsi_from_rsi(rsi_sweep(prices, periods), periods)
+
+
+def _ema_recursion(values, alpha):
+	"""Returns average[t] = ((1 - alpha) * average[t - 1]) + (alpha * values[t]), starting at values[0], for panels without NaN values
+
+	Within a block of rows the recursion has the closed form average[s + j] = decay ** (j + 1) * (average[s - 1] +
+	alpha * sum(values[s + k] / decay ** (k + 1) for k <= j)), which is a cumulative sum. Blocks are short enough
+	that decay ** -block stays well within float64 range
+
+	Positional Arguments:
+		values: panel without NaN values (dates x stocks)
+		alpha: smoothing factor
+	"""
+	decay = 1 - alpha
+	block = max(1, int(50 / -np.log(decay)))
+	powers = decay ** np.arange(1, min(block, values.shape[0]) + 1)[:, None]
+	averages = np.empty(values.shape)
+	previous = values[0]
+	for start in range(0, values.shape[0], block):
+		block_values = values[start:start + block]
+		block_powers = powers[:len(block_values)]
+		averages[start:start + block] = block_powers * (previous + alpha * np.cumsum(block_values / block_powers, axis=0))
+		previous = averages[start + len(block_values) - 1]
+	return averages
+
+
+def ema(values, span):
+	"""Returns the exponentially weighted moving average of every column, as pandas' ewm(span=span, min_periods=span, adjust=False)
+
+	Each column starts at its first non-NaN value, so stocks padded with NaN values get the average of their own history.
+	Later NaN values are skipped (as with ignore_na=True)
+
+	Positional Arguments:
+		values: panel (dates x stocks)
+		span: span of the average (in days)
+	"""
+	alpha = 2 / (span + 1)
+	n_dates = values.shape[0]
+	valid = ~np.isnan(values)
+	first = np.where(valid.any(axis=0), valid.argmax(axis=0), n_dates)
+	rows = np.arange(n_dates)[:, None]
+	if n_dates and (valid | (rows < first)).all():
+		# NaN values only pad the start of each column, so each column can start early at its first value
+		first_values = np.nan_to_num(values[np.minimum(first, n_dates - 1), np.arange(values.shape[1])])
+		averages = _ema_recursion(np.where(valid, values, first_values), alpha)
+		averages[rows < first + span - 1] = np.nan
+		return averages
+
+	averages = np.full(values.shape, np.nan)
+	average = np.full(values.shape[1:], np.nan)
+	count = np.zeros(values.shape[1:], dtype=np.int64)
+	for row, value in enumerate(values):
+		valid = ~np.isnan(value)
+		updated = np.where(np.isnan(average), value, ((1 - alpha) * average) + (alpha * value))
+		average = np.where(valid, updated, average)
+		count += valid
+		averages[row] = np.where(count >= span, average, np.nan)
+	return averages
+
+
+def macd(prices, fast_span=12, slow_span=26, signal_span=9):
+	"""Returns the MACD line and its signal line (both dates x stocks)
+
+	Positional Arguments:
+		prices: price panel (dates x stocks)
+
+	Keyword Arguments:
+		fast_span: span of the fast EMA (default 12)
+		slow_span: span of the slow EMA (default 26)
+		signal_span: span of the EMA of the MACD line (default 9)
+	"""
+	macd_line = ema(prices, fast_span) - ema(prices, slow_span)
+	return macd_line, ema(macd_line, signal_span)
+
+
+def crossovers(macd_line, signal_line):
+	"""Returns boolean arrays (dates x stocks) which are True where the MACD line crosses above (bullish) or below
+	(bearish) its signal line, comparing each session with the previous one
+
+	Positional Arguments:
+		macd_line: MACD panel (dates x stocks)
+		signal_line: signal line panel (dates x stocks)
+	"""
+	bullish = np.zeros(macd_line.shape, dtype=bool)
+	bearish = np.zeros(macd_line.shape, dtype=bool)
+	bullish[1:] = (macd_line[:-1] < signal_line[:-1]) & (macd_line[1:] > signal_line[1:])
+	bearish[1:] = (macd_line[:-1] > signal_line[:-1]) & (macd_line[1:] < signal_line[1:])
+	return bullish, bearish
+
+
+def latest_pct_change(values, period):
+	"""Returns the percentage change of every column over the last period sessions
+
+	Positional Arguments:
+		values: panel (dates x stocks)
+		period: number of sessions
+	"""
+	if period >= values.shape[0]:
+		return np.full(values.shape[1:], np.nan)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return ((values[-1] / values[-1 - period]) - 1) * 100
+
+
+def threshold_signals(values, overbought_levels, oversold_levels):
+	"""Classifies indicator values for every pair of overbought and oversold levels
+
+	Returns an int8 array of shape (overbought levels x oversold levels) + values.shape, holding 1 for overbought
+	(at or above the overbought level), -1 for oversold (at or below the oversold level) and 0 otherwise
+
+	Positional Arguments:
+		values: array of indicator values
+		overbought_levels: list of overbought levels
+		oversold_levels: list of oversold levels
+	"""
+	extra_dims = (None,) * np.ndim(values)
+	overbought = values[None, None] >= np.asarray(overbought_levels, dtype=float)[(slice(None), None) + extra_dims]
+	oversold = values[None, None] <= np.asarray(oversold_levels, dtype=float)[(None, slice(None)) + extra_dims]
+	return np.where(overbought, 1, np.where(oversold, -1, 0)).astype(np.int8)
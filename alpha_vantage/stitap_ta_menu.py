@@ -1,6 +1,6 @@
 import time
 
-from stitap_ta_screens import MACDScreener, RSIScreener, StochRSIScreener
+from stitap_ta_screens import MACDScreener, RSIScreener, StochRSIScreener, RSISweepScreener, StochRSISweepScreener, ExpressionScreener
 
 class TechnicalAnalysisMenu:
 	"""Displays technical analysis menu
@@ -8,7 +8,10 @@ class TechnicalAnalysisMenu:
 	def __init__(self):
 		self._technical_analysis_screens = {"Moving Average Convergence / Divergence":"MACD",
 											"Relative Strength Index":"RSI",
-											"Stochastic Relative Strength Index":"STOCHRSI"}
+											"Stochastic Relative Strength Index":"STOCHRSI",
+											"Relative Strength Index Sweep":"RSISWEEP",
+											"Stochastic Relative Strength Index Sweep":"STOCHRSISWEEP",
+											"Composite Screen":"COMPOSITE"}
 		self._screen = None
 
 	@property
@@ -27,6 +30,9 @@ class TechnicalAnalysisMenu:
 				"MACD": Moving Average Convergence / Divergence
 				"RSI": Relative Strength Index
 				"STOCHRSI": Stochastic Relative Strength Index
+				"RSISWEEP": Relative Strength Index over a range of timeframes and levels
+				"STOCHRSISWEEP": Stochastic Relative Strength Index over a range of timeframes and levels
+				"COMPOSITE": Conditions on several indicators, eg. RSI(14) < 30 AND MACD BULLISH
 		"""
 		if screen == "MACD":
 			macd = MACDScreener()
@@ -40,6 +46,18 @@ class TechnicalAnalysisMenu:
 			stochrsi = StochRSIScreener()
 			stochrsi.run()
 			self.run()
+		elif screen == "RSISWEEP":
+			rsi_sweep = RSISweepScreener()
+			rsi_sweep.run()
+			self.run()
+		elif screen == "STOCHRSISWEEP":
+			stochrsi_sweep = StochRSISweepScreener()
+			stochrsi_sweep.run()
+			self.run()
+		elif screen == "COMPOSITE":
+			composite = ExpressionScreener()
+			composite.run()
+			self.run()
 		else:
 			return
 
@@ -52,7 +70,10 @@ class TechnicalAnalysisMenu:
 		time.sleep(0.1)
 		print("Moving Average Convergence / Divergence - MACD",
 			"Relative Strength Index - RSI",
-			"Stochastic Relative Strength Index - STOCHRSI", sep="\n", end="\n"*3)
+			"Stochastic Relative Strength Index - STOCHRSI",
+			"Relative Strength Index Sweep - RSISWEEP",
+			"Stochastic Relative Strength Index Sweep - STOCHRSISWEEP",
+			"Composite Screen - COMPOSITE", sep="\n", end="\n"*3)
 
 	def _input(self):
 		"""Collects input from the user and runs selected technical analysis screen
@@ -1,15 +1,22 @@
 from abc import ABC, abstractmethod
+import atexit
 import time
-from datetime import datetime
 import decimal
 import copy
 from pprint import pprint
 
-import pandas as pd
-import numpy as np
-
-sg_public_holidays_dates = ["2018-01-01", "2018-02-16", "2018-03-30", "2018-05-01", "2018-05-29",
-                              "2018-06-15", "2018-08-09", "2018-08-22", "2018-11-06", "2018-12-25"]
+from stitap_loader import load_stock_csvs
+from stitap_calendar import sgx_holidays
+from stitap_validate import format_report, quarantine_reasons, validate_bars
+try:
+	from alpha_vantage import instrumentation
+except ImportError:
+	# Run as a script from the alpha_vantage folder, without the package installed: imports it from the repo root, so
+	# that every script shares one instrumentation module with run.py
+	import sys
+	from os import path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+	from alpha_vantage import instrumentation
 
 sti_stocks = {"CityDev":"C09.SI", "DBS":"D05.SI", "UOL":"U14.SI", "SingTel":"Z74.SI", "UOB":"U11.SI",
                 "Keppel Corp":"BN4.SI", "CapitaLand":"C31.SI", "OCBC Bank":"O39.SI", "Genting Sing":"G13.SI", "Venture":"V03.SI",
@@ -21,58 +28,193 @@ sti_stocks = {"CityDev":"C09.SI", "DBS":"D05.SI", "UOL":"U14.SI", "SingTel":"Z74
 
 class PrepareTechnicalAnalysis:
 	"""A singleton that prepares and supplies stock data for technical analysis screens
+
+	The data is only loaded on first use through instance(), so importing this module does not read any csv files
 	"""
-	def __init__(self):
+	_instance = None
+	# stitap_fx.FXRates converting the adjusted closes of stocks quoted in other currencies (eg. "JMH USD") into its
+	# base currency at the current rate, or None to keep the prices as quoted
+	fx_rates = None
+	# Leaves the stocks whose stored data fails stitap_validate's checks out of the screens, instead of screening them
+	quarantine = True
+
+	def __init__(self, max_workers=8):
+		"""
+		Keyword Arguments:
+			max_workers: number of threads reading csv files (default 8)
+		"""
+		self._max_workers = max_workers
+		self._load_timings = {}
+		self._loads = 0
+		self._validation_report = None
+		self._adjusted_close_panel = None
+		self._volume_panel = None
+		self._shared_panels = None
 		self._prepare_data()
 
+	@classmethod
+	def instance(cls, refresh=False):
+		"""Returns the shared instance, preparing the data on first use
+
+		Keyword Arguments:
+			refresh: reloads the data from disk, eg. after fresh data has been fetched (default False)
+		"""
+		if cls._instance is None:
+			cls._instance = cls()
+		elif refresh:
+			cls._instance.refresh()
+		return cls._instance
+
 	@property
 	def sti_stocks_adjusted_close(self):
 		return self._sti_stocks_adjusted_close
 
+	@property
+	def adjusted_close_panel(self):
+		"""Adjusted closes of all stocks as one dataframe (sessions x stocks), aligned on each stock's most recent session
+
+		Stocks with a shorter history are padded with NaN values at the top, and prices are converted as in
+		sti_stocks_adjusted_close
+		"""
+		if self._adjusted_close_panel is None:
+			self._adjusted_close_panel = self._panel({stock_name: adjusted_close["adjusted_close"]
+													  for stock_name, adjusted_close in self._sti_stocks_adjusted_close.items()})
+		return self._adjusted_close_panel
+
+	@property
+	def volume_panel(self):
+		"""Volumes of all stocks as one dataframe (sessions x stocks), aligned like adjusted_close_panel
+		"""
+		if self._volume_panel is None:
+			self._volume_panel = self._panel(self._sti_stocks_volume)
+		return self._volume_panel
+
+	@property
+	def validation_report(self):
+		"""Data quality report of the last load, as returned by stitap_validate.validate_bars()"""
+		return self._validation_report
+
+	@property
+	def loads(self):
+		"""Number of times the data has been loaded from disk"""
+		return self._loads
+
+	@property
+	def load_timings(self):
+		"""Time taken (in seconds) to read each stock's csv file during the last load"""
+		return self._load_timings
+
+	def refresh(self):
+		"""Reloads stock data from disk
+		"""
+		self._prepare_data()
+
+	def publish(self, backend=None):
+		"""Publishes the adjusted close and volume panels once for worker processes, returning their descriptors
+
+		Workers attach to the panels with stitap_shared_panel.attach() instead of receiving pickled dataframes. The
+		panels stay published until the data is refreshed, unpublish() is called or the process exits
+
+		Keyword Arguments:
+			backend: "shared_memory" or "memmap" (default None, shared memory if available)
+		"""
+		from stitap_shared_panel import SharedPanel
+
+		if self._shared_panels is None:
+			self._shared_panels = {"adjusted_close": SharedPanel(self.adjusted_close_panel, backend=backend),
+								   "volume": SharedPanel(self.volume_panel, backend=backend)}
+			atexit.register(self.unpublish)
+		return {name: shared_panel.descriptor for name, shared_panel in self._shared_panels.items()}
+
+	def unpublish(self):
+		"""Frees the panels published by publish()
+		"""
+		if self._shared_panels is not None:
+			for shared_panel in self._shared_panels.values():
+				shared_panel.unlink()
+			self._shared_panels = None
+			atexit.unregister(self.unpublish)
+
+	@staticmethod
+	def _panel(sti_stocks_series):
+		"""Stacks each stock's series into one dataframe (sessions x stocks), aligned on each stock's most recent session
+
+		Positional Arguments:
+			sti_stocks_series: dictionary of stock name to series (least recent date on top)
+		"""
+		import pandas as pd
+		import numpy as np
+
+		n_sessions = max(len(series) for series in sti_stocks_series.values())
+		panel = np.full((n_sessions, len(sti_stocks_series)), np.nan)
+		for column, series in enumerate(sti_stocks_series.values()):
+			panel[n_sessions - len(series):, column] = series.values
+		return pd.DataFrame(panel, columns=list(sti_stocks_series))
+
 	def _prepare_data(self):
 		"""Prepares stock data for technical analysis screens
 		"""
-		self._sti_stocks_adjusted_close = {}
-		# Converts public holidays from strings to datetime objects
-		sg_public_holidays_datetimes = [datetime.strptime(sg_public_holiday_date, "%Y-%m-%d") for sg_public_holiday_date in sg_public_holidays_dates]
-
-		for stock_name, stock_ticker in sti_stocks.items():
-			time.sleep(0.1)
-			stock_name_no_spaces = stock_name.replace(" ", "_")
-			# Load stock's csv file with date as index
-			df_original = pd.read_csv(f"sti_stock_data/original_data/daily/{stock_name_no_spaces}.csv", index_col=["date"])
-			# Get stock's adjusted close (previous 100 trading sessions)
-			adjusted_close = df_original[["5. adjusted close"]]
-			# Change column name
-			adjusted_close.columns = ["adjusted_close"]
-			# Note:Please refer to sg_public_holidays list at the top of the file for Singapore's public holidays
+		with instrumentation.span("prepare") as prepare_span:
+			start = time.perf_counter()
+			# Load each stock's date, prices and volume concurrently (previous 100 trading sessions)
+			sti_stocks_original, self._load_timings = load_stock_csvs(sti_stocks, "sti_stock_data/original_data/daily",
+																		["1. open", "2. high", "3. low", "4. close", "5. adjusted close", "6. volume"],
+																		max_workers=self._max_workers)
+			for stock_name, elapsed in self._load_timings.items():
+				print(f"LOADED: {stock_name} ({elapsed:.3f}s)", end="\n"*2)
+			print(f"LOADED: ALL {len(sti_stocks_original)} STI STOCKS ({time.perf_counter() - start:.3f}s)", end="\n"*2)
+
+			# Checks the bars for gaps, duplicate dates, bad prices, volume outliers and stale data before screening them
+			self._validation_report = validate_bars(sti_stocks_original)
+			print(format_report(self._validation_report), end="\n"*2)
+			if self.quarantine:
+				for stock_name, reason in quarantine_reasons(self._validation_report).items():
+					print(f"QUARANTINED: {stock_name} ({reason})", end="\n"*2)
+					del sti_stocks_original[stock_name]
+
+			# Note:Please refer to sg_public_holidays_dates in stitap_calendar for Singapore's public holidays
 			# Note:The date index currently excludes weekends and public holidays
-			# Includes Singapore's public holidays in the date index, if they fall on a weekday
-			# Check whether each public holiday falls within the previous 100 trading sessions' date range
-			# Get start and end dates as datetime objects for the previous 100 trading sessions
-			end_date = adjusted_close.index.values[0]
-			end_date = datetime.strptime(end_date, "%Y-%m-%d")
-			start_date = adjusted_close.index.values[-1]			
-			start_date = datetime.strptime(start_date, "%Y-%m-%d")
-			# Check whether each public holiday falls within date range
-			for sg_public_holidays_datetime in sg_public_holidays_datetimes:
-				# If public holiday falls within range, add public holiday to date index
-				if start_date < sg_public_holidays_datetime < end_date:
-					adjusted_close.loc[sg_public_holidays_datetime.strftime("%Y-%m-%d")] = np.nan
-			# Sort stock's adjusted close dataframe (most recent date on top)
-			adjusted_close.sort_values(by="date", ascending=False, inplace=True)
-			# Backward fill the NaN values with previous day's adjusted close price
-			adjusted_close.fillna(method="bfill", inplace=True)
-			# Sort stock's adjusted close (least recent date on top)
-			adjusted_close.sort_values(by="date", ascending=True, inplace=True)
-			self._sti_stocks_adjusted_close[stock_name] = adjusted_close
+			sg_public_holidays_datetimes = sgx_holidays()
+			self.unpublish()
+			self._sti_stocks_adjusted_close = {}
+			self._sti_stocks_volume = {}
+			self._adjusted_close_panel = None
+			self._volume_panel = None
+			for stock_name, adjusted_close in sti_stocks_original.items():
+				# Change column names
+				adjusted_close = adjusted_close[["5. adjusted close", "6. volume"]]
+				adjusted_close.columns = ["adjusted_close", "volume"]
+				# Includes Singapore's public holidays in the date index, if they fall within the stock's date range
+				start_date, end_date = adjusted_close.index.min(), adjusted_close.index.max()
+				in_range = (sg_public_holidays_datetimes > start_date) & (sg_public_holidays_datetimes < end_date)
+				# Sort stock's adjusted close (least recent date on top), with public holidays as NaN values
+				adjusted_close = adjusted_close.reindex(adjusted_close.index.union(sg_public_holidays_datetimes[in_range]))
+				adjusted_close.index.name = "date"
+				# Fill the NaN values with previous day's adjusted close price and volume
+				adjusted_close = adjusted_close.ffill()
+				self._sti_stocks_adjusted_close[stock_name] = adjusted_close[["adjusted_close"]]
+				self._sti_stocks_volume[stock_name] = adjusted_close["volume"]
+
+			# Converts the adjusted closes of the stocks quoted in other currencies, keeping them as quoted if the rates
+			# cannot be fetched (eg. a Note reply when the API quota is used up) rather than failing the refresh
+			if self.fx_rates is not None:
+				try:
+					stock_rates = self.fx_rates.stock_rates(self._sti_stocks_adjusted_close)
+				except (KeyError, ValueError, OSError) as error:
+					print(f"FX: NO EXCHANGE RATES ({error}), PRICES KEPT AS QUOTED", end="\n"*2)
+					stock_rates = {}
+				for stock_name, rate in stock_rates.items():
+					self._sti_stocks_adjusted_close[stock_name] = self._sti_stocks_adjusted_close[stock_name] * rate
+
+			self._loads += 1
+			prepare_span.add(rows=sum(len(adjusted_close) for adjusted_close in self._sti_stocks_adjusted_close.values()))
 
 
 class TechnicalAnalysisScreener(ABC):
 	"""Abstract base class for technical analysis screener
 	"""
 	def __init__(self):
-		self._sti_stocks_adjusted_close = copy.deepcopy(prepare_ta.sti_stocks_adjusted_close)
+		self._sti_stocks_adjusted_close = copy.deepcopy(PrepareTechnicalAnalysis.instance().sti_stocks_adjusted_close)
 
 	def _validate_input(self, prompt, input_type=None, input_range=None):
 		"""Validates user input for settings of stock screen
@@ -105,6 +247,35 @@ class TechnicalAnalysisScreener(ABC):
 				continue
 			return input_type(user_input)
 
+	def _validate_list_input(self, prompt, input_type, input_range):
+		"""Validates user input for a list of settings of stock screen (eg. "7, 14, 21", or "2-30" for integers)
+
+		Positional arguments:
+			prompt: user prompt for input
+			input_type: desired type of each value (int or float)
+			input_range: desired range of each value, in hundredths for floats (eg. range(0, 31) for 0 - 0.3)
+		"""
+		scale = 100 if input_type is float else 1
+		while True:
+			user_input = input(f"{prompt}\n\n")
+			values = []
+			try:
+				for token in user_input.replace(" ", "").split(","):
+					if input_type is int and "-" in token:
+						start, end = token.split("-")
+						values.extend(range(int(start), int(end) + 1))
+					else:
+						values.append(input_type(token))
+			except ValueError:
+				print(f"\n\nSupported values: {input_type.__name__} values separated by commas. Please try again.", end="\n"*2)
+				time.sleep(0.1)
+				continue
+			if not values or any(round(value * scale) not in input_range for value in values):
+				print(f"\n\nSupported range: between {input_range[0] / scale:g} and {input_range[-1] / scale:g}. Please try again.", end="\n"*2)
+				time.sleep(0.1)
+				continue
+			return sorted(set(values))
+
 	@abstractmethod
 	def _input_settings(self):
 		"""Requests user for settings, displays and validates them
@@ -121,7 +292,8 @@ class TechnicalAnalysisScreener(ABC):
 		"""Runs the screener
 		"""
 		self._input_settings()
-		self._screen()
+		with instrumentation.span("screen", type(self).__name__):
+			self._screen()
 
 
 class MACDScreener(TechnicalAnalysisScreener):
@@ -156,9 +328,8 @@ class MACDScreener(TechnicalAnalysisScreener):
 		bearish_macd_crossover = set()
 		no_macd_crossover = set()
 
-		for stock_name, stock_ticker in sti_stocks.items():
+		for stock_name, adjusted_close in self._sti_stocks_adjusted_close.items():
 			time.sleep(0.1)
-			adjusted_close = self._sti_stocks_adjusted_close[stock_name]
 			# Calculate stock's EWMA
 			adjusted_close["12_day_ema"] = adjusted_close["adjusted_close"].ewm(span=12, min_periods=12, adjust=False).mean()
 			adjusted_close["26_day_ema"] = adjusted_close["adjusted_close"].ewm(span=26, min_periods=26, adjust=False).mean()
@@ -166,12 +337,12 @@ class MACDScreener(TechnicalAnalysisScreener):
 			adjusted_close["macd"] = adjusted_close["12_day_ema"] - adjusted_close["26_day_ema"]
 			# Calculate stock's 9 day EWMA of MACD
 			adjusted_close["macd_signal_line"] = adjusted_close["macd"].ewm(span=9, min_periods=9, adjust=False).mean()
-			# Check for MACD bullish signal line crossover
-			if (adjusted_close.iloc[-2, 4] < adjusted_close.iloc[-2, 3]) and (adjusted_close.iloc[-1, 4] > adjusted_close.iloc[-1, 3]):
+			# Check for MACD bullish signal line crossover (MACD crosses above its signal line)
+			if (adjusted_close.iloc[-2, 3] < adjusted_close.iloc[-2, 4]) and (adjusted_close.iloc[-1, 3] > adjusted_close.iloc[-1, 4]):
 				print(f"MACD BULLISH CROSSOVER DETECTED: {stock_name}", end="\n"*2)		
 				bullish_macd_crossover.add(stock_name)
-			# Check for MACD bearish signal line crossover
-			elif (adjusted_close.iloc[-2, 4] > adjusted_close.iloc[-2, 3]) and (adjusted_close.iloc[-1, 4] < adjusted_close.iloc[-1, 3]):
+			# Check for MACD bearish signal line crossover (MACD crosses below its signal line)
+			elif (adjusted_close.iloc[-2, 3] > adjusted_close.iloc[-2, 4]) and (adjusted_close.iloc[-1, 3] < adjusted_close.iloc[-1, 4]):
 				print(f"MACD BEARISH CROSSOVER DETECTED: {stock_name}", end="\n"*2)		
 				bearish_macd_crossover.add(stock_name)
 			else:
@@ -235,6 +406,8 @@ class RSIScreener(TechnicalAnalysisScreener):
 	def _screen(self):
 		"""Screens stocks according to user settings
 		"""
+		import pandas as pd
+
 		print("SCREENING FOR OVERBOUGHT AND OVERSOLD STOCKS......", end="\n"*3)
 		time.sleep(0.1)
 		print("-"*20, end="\n"*2)
@@ -244,9 +417,8 @@ class RSIScreener(TechnicalAnalysisScreener):
 		rsi_oversold = {}
 		rsi_neutral = {}
 
-		for stock_name, stock_ticker in sti_stocks.items():
+		for stock_name, adjusted_close in self._sti_stocks_adjusted_close.items():
 			time.sleep(0.1)
-			adjusted_close = self._sti_stocks_adjusted_close[stock_name]
 			# Calculate stock's daily changes in adjusted closing price
 			adjusted_close["daily_price_change"] = adjusted_close["adjusted_close"].diff(periods=1)
 			# Calculate stock's daily changes for up and down days
@@ -346,6 +518,8 @@ class StochRSIScreener(TechnicalAnalysisScreener):
 	def _screen(self):
 		"""Screens stocks according to user settings
 		"""
+		import pandas as pd
+
 		print("SCREENING FOR OVERBOUGHT AND OVERSOLD STOCKS......", end="\n"*3)
 		time.sleep(0.1)
 		print("-"*20, end="\n"*2)
@@ -355,9 +529,8 @@ class StochRSIScreener(TechnicalAnalysisScreener):
 		stochrsi_oversold = {}
 		stochrsi_neutral = {}
 
-		for stock_name, stock_ticker in sti_stocks.items():
+		for stock_name, adjusted_close in self._sti_stocks_adjusted_close.items():
 			time.sleep(0.1)
-			adjusted_close = self._sti_stocks_adjusted_close[stock_name]
 			# Calculate stock's daily changes in adjusted closing price
 			adjusted_close["daily_price_change"] = adjusted_close["adjusted_close"].diff(periods=1)
 			# Calculate stock's daily changes for up and down days
@@ -419,4 +592,213 @@ class StochRSIScreener(TechnicalAnalysisScreener):
 		print("-"*20, end="\n"*3)
 
 
-prepare_ta = PrepareTechnicalAnalysis()
\ No newline at end of file
+class SweepScreener(TechnicalAnalysisScreener):
+	"""Abstract base class for screening an oscillator over a range of timeframes and overbought/oversold levels in one pass
+	"""
+	# Name of the indicator in the results
+	_indicator_name = None
+
+	def __init__(self):
+		"""Initializes sweep screener
+		"""
+		super().__init__()
+		self._timeframes = None
+		self._overbought_levels = None
+		self._oversold_levels = None
+
+	@abstractmethod
+	def _latest_values(self, prices, timeframes):
+		"""Returns the most recent indicator value of every stock for every timeframe (timeframes x stocks)
+
+		Positional arguments:
+			prices: price panel (sessions x stocks)
+			timeframes: list of timeframes (in days)
+		"""
+		pass
+
+	def sweep(self, timeframes, overbought_levels, oversold_levels):
+		"""Evaluates the indicator for all stocks over every timeframe, and classifies it for every pair of levels
+
+		Returns a dataframe of indicator values (stocks x timeframes) and a dataframe of signals
+		(stocks x (timeframe, overbought level, oversold level)): 1 for overbought, -1 for oversold and 0 for neutral
+
+		Positional arguments:
+			timeframes: list of timeframes (in days)
+			overbought_levels: list of overbought levels
+			oversold_levels: list of oversold levels
+		"""
+		import pandas as pd
+		from stitap_ta_indicators import threshold_signals
+
+		panel = PrepareTechnicalAnalysis.instance().adjusted_close_panel
+		values = self._latest_values(panel.values, timeframes)
+		signals = threshold_signals(values, overbought_levels, oversold_levels)
+		df_values = pd.DataFrame(values.T, index=panel.columns, columns=pd.Index(timeframes, name="timeframe"))
+		columns = pd.MultiIndex.from_product([timeframes, overbought_levels, oversold_levels], names=["timeframe", "overbought", "oversold"])
+		# Signals are (overbought levels x oversold levels x timeframes x stocks)
+		df_signals = pd.DataFrame(signals.transpose(3, 2, 0, 1).reshape(len(panel.columns), -1), index=panel.columns, columns=columns)
+		return df_values, df_signals
+
+	def _screen(self):
+		"""Screens stocks according to user settings
+		"""
+		import pandas as pd
+
+		print("SWEEPING FOR OVERBOUGHT AND OVERSOLD STOCKS......", end="\n"*3)
+		time.sleep(0.1)
+		print("-"*20, end="\n"*2)
+		time.sleep(0.1)
+
+		df_values, df_signals = self.sweep(self._timeframes, self._overbought_levels, self._oversold_levels)
+		df_counts = pd.DataFrame({"Overbought": (df_signals == 1).sum(), "Oversold": (df_signals == -1).sum()})
+
+		print(f"-----{self._indicator_name} SWEEP RESULTS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(f"-----{self._indicator_name} BY TIMEFRAME-----", end="\n"*3)
+		time.sleep(0.1)
+		print(df_values.round(2).to_string())
+		print("\n\n\n-----NUMBER OF OVERBOUGHT AND OVERSOLD STOCKS BY SETTINGS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(df_counts.to_string())
+		time.sleep(0.1)
+		print("-"*20, end="\n"*3)
+
+
+class RSISweepScreener(SweepScreener):
+	"""Relative Strength Index Screener over a range of timeframes and levels
+	"""
+	_indicator_name = "RSI"
+
+	def _latest_values(self, prices, timeframes):
+		from stitap_ta_indicators import rsi_sweep
+
+		return rsi_sweep(prices, timeframes)[:, -1]
+
+	def _input_settings(self):
+		"""Requests user for settings, displays and validates them
+		"""
+		print("\n\n\n-----RSI SWEEP-----", end="\n"*3)
+		time.sleep(0.1)
+		print("TIMEFRAMES SUPPORTED: 2 - 99 DAYS (eg. 7, 14, 21 or 2-30)", end="\n"*3)
+		time.sleep(0.1)
+		print("OVERBOUGHT VALUES SUPPORTED: 70 - 100", end="\n"*3)
+		time.sleep(0.1)
+		print("OVERSOLD VALUES SUPPORTED: 0 - 30", end="\n"*3)
+		time.sleep(0.1)
+
+		self._timeframes = self._validate_list_input("Please enter your desired screening timeframes (in days):", input_type=int, input_range=range(2, 100))
+		time.sleep(0.1)
+		self._overbought_levels = self._validate_list_input("Please enter your desired overbought values (70 - 100):", input_type=int, input_range=range(70, 101))
+		time.sleep(0.1)
+		self._oversold_levels = self._validate_list_input("Please enter your desired oversold values (0 - 30):", input_type=int, input_range=range(0, 31))
+		time.sleep(0.1)
+
+		print("-----SETTINGS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(f"TIMEFRAMES: {self._timeframes}", end="\n"*3)
+		time.sleep(0.1)
+		print(f"OVERBOUGHT AT OR ABOVE: {self._overbought_levels}", end="\n"*3)
+		time.sleep(0.1)
+		print(f"OVERSOLD AT OR BELOW: {self._oversold_levels}", end="\n"*3)
+		time.sleep(0.1)
+
+
+class StochRSISweepScreener(SweepScreener):
+	"""Stochastic Relative Strength Index Screener over a range of timeframes and levels
+	"""
+	_indicator_name = "STOCHRSI"
+
+	def _latest_values(self, prices, timeframes):
+		from stitap_ta_indicators import latest_stoch_rsi_sweep
+
+		return latest_stoch_rsi_sweep(prices, timeframes)
+
+	def _input_settings(self):
+		"""Requests user for settings, displays and validates them
+		"""
+		print("\n\n\n-----STOCHASTIC RSI SWEEP-----", end="\n"*3)
+		time.sleep(0.1)
+		print("TIMEFRAMES SUPPORTED: 2 - 97 DAYS (eg. 7, 14, 21 or 2-30)", end="\n"*3)
+		time.sleep(0.1)
+		print("OVERBOUGHT VALUES SUPPORTED: 0.7 - 1", end="\n"*3)
+		time.sleep(0.1)
+		print("OVERSOLD VALUES SUPPORTED: 0 - 0.3", end="\n"*3)
+		time.sleep(0.1)
+
+		self._timeframes = self._validate_list_input("Please enter your desired screening timeframes (in days):", input_type=int, input_range=range(2, 98))
+		time.sleep(0.1)
+		self._overbought_levels = self._validate_list_input("Please enter your desired overbought values (0.7 - 1):", input_type=float, input_range=range(70, 101))
+		time.sleep(0.1)
+		self._oversold_levels = self._validate_list_input("Please enter your desired oversold values (0 - 0.3):", input_type=float, input_range=range(0, 31))
+		time.sleep(0.1)
+
+		print("-----SETTINGS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(f"TIMEFRAMES: {self._timeframes}", end="\n"*3)
+		time.sleep(0.1)
+		print(f"OVERBOUGHT AT OR ABOVE: {self._overbought_levels}", end="\n"*3)
+		time.sleep(0.1)
+		print(f"OVERSOLD AT OR BELOW: {self._oversold_levels}", end="\n"*3)
+		time.sleep(0.1)
+
+
+class ExpressionScreener(TechnicalAnalysisScreener):
+	"""Screens stocks with a composite screen, eg. RSI(14) < 30 AND MACD BULLISH AND VOLUME_CHANGE(5) > 50
+	"""
+	def __init__(self):
+		"""Initializes expression screener
+		"""
+		super().__init__()
+		self._expression = None
+
+	def _input_settings(self):
+		"""Requests user for settings, displays and validates them
+		"""
+		from stitap_ta_expressions import parse_screen
+
+		print("\n\n\n-----COMPOSITE SCREEN-----", end="\n"*3)
+		time.sleep(0.1)
+		print("CONDITIONS SUPPORTED: RSI(timeframe) / STOCHRSI(timeframe) compared with a level (eg. RSI(14) < 30)",
+			"PRICE_CHANGE(sessions) / VOLUME_CHANGE(sessions) compared with a percentage (eg. VOLUME_CHANGE(5) > 50)",
+			"MACD BULLISH / MACD BEARISH, optionally with spans (eg. MACD(12, 26, 9) BULLISH)",
+			"Join conditions with AND / OR, and group them with brackets", sep="\n", end="\n"*3)
+		time.sleep(0.1)
+
+		while True:
+			try:
+				self._expression = parse_screen(input("Please enter your desired screen:\n\n"))
+				break
+			except ValueError as error:
+				print(f"\n\n{error}. Please try again.", end="\n"*2)
+				time.sleep(0.1)
+
+		print("-----SETTINGS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(f"SCREEN (IN ORDER OF EVALUATION): {self._expression}", end="\n"*3)
+		time.sleep(0.1)
+
+	def _screen(self):
+		"""Screens stocks according to user settings
+		"""
+		import pandas as pd
+		import numpy as np
+		from stitap_ta_expressions import ScreenContext
+
+		print("SCREENING......", end="\n"*3)
+		time.sleep(0.1)
+		print("-"*20, end="\n"*2)
+		time.sleep(0.1)
+
+		context = ScreenContext.from_prepared_data(PrepareTechnicalAnalysis.instance())
+		passed = self._expression.evaluate(context)
+		columns = np.flatnonzero(passed)
+		df_results = pd.DataFrame({str(indicator): indicator.latest(context, columns) for indicator in self._expression.indicators()},
+								  index=pd.Index([context.stock_names[column] for column in columns], name="Company"))
+
+		print("-----COMPOSITE SCREEN RESULTS-----", end="\n"*3)
+		time.sleep(0.1)
+		print(f"{len(columns)} OF {len(context.stock_names)} STOCKS PASSED", end="\n"*3)
+		time.sleep(0.1)
+		print(df_results)
+		time.sleep(0.1)
+		print("-"*20, end="\n"*3)
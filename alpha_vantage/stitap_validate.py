@@ -0,0 +1,271 @@
+"""Data quality checks of the stored bars, run over the whole universe at once before the screeners consume it
+
+Every stock's bars are flattened into one array per column (with the stock's position as a group code), so each
+check is a handful of array operations against the SGX trading calendar rather than a loop over stocks:
+
+	duplicate_dates    dates stored more than once
+	off_calendar       dates SGX does not trade on (weekends and the public holidays of stitap_calendar)
+	missing_sessions   trading sessions missing between the stock's first and last date
+	longest_gap        longest run of consecutive missing sessions
+	bad_prices         zero, negative or missing prices
+	bad_ranges         bars whose high is below their open, low or close, or whose low is above their open or close
+	volume_outliers    volumes further than volume_outlier_sigmas robust standard deviations (of log volumes) from the
+	                   stock's median
+	stale_sessions     trading sessions between the stock's last date and the universe's most common last date (or as_of)
+
+Sessions no stock traded on are taken as market closures missing from the calendar, rather than gaps of every stock.
+Stocks whose counts exceed quarantine_limits are quarantined: left out of the screens instead of ranked on bad data.
+"""
+import numpy as np
+
+from stitap_calendar import sgx_holidays
+try:
+	from alpha_vantage import instrumentation
+except ImportError:
+	# Run as a script from the alpha_vantage folder, without the package installed: imports it from the repo root, so
+	# that every script shares one instrumentation module with run.py
+	import sys
+	from os import path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+	from alpha_vantage import instrumentation
+
+checks = ["duplicate_dates", "off_calendar", "missing_sessions", "longest_gap", "bad_prices", "bad_ranges",
+		  "volume_outliers", "stale_sessions"]
+
+# Largest count of each check a stock may have before it is quarantined (None only flags it)
+quarantine_limits = {"duplicate_dates": 0, "off_calendar": 0, "missing_sessions": 5, "longest_gap": 3, "bad_prices": 0,
+					 "bad_ranges": 0, "volume_outliers": None, "stale_sessions": 2}
+
+price_columns = ["1. open", "2. high", "3. low", "4. close", "5. adjusted close"]
+volume_column = "6. volume"
+
+
+def _days(dates):
+	"""Returns dates as days since the epoch (int64)"""
+	return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def _trading_days(first_day, last_day):
+	"""Returns the SGX trading days between two days since the epoch (inclusive), as stitap_calendar.sgx_trading_days()
+	without building a DatetimeIndex
+	"""
+	days = np.arange(first_day, last_day + 1, dtype=np.int64)
+	# The epoch (1970-01-01) was a Thursday
+	weekdays = days[(days + 3) % 7 < 5]
+	return weekdays[~np.isin(weekdays, _days(sgx_holidays()))]
+
+
+def _group_medians(codes, values, n_groups):
+	"""Returns the median of the values of each group (NaN for empty groups)
+
+	Positional Arguments:
+		codes: group of each value
+		values: finite values
+		n_groups: number of groups
+	"""
+	if not len(values):
+		return np.full(n_groups, np.nan)
+	# One sort of the values offset by their group (much faster than np.lexsort), leaving the groups in order
+	low = values.min()
+	width = values.max() - low + 1
+	values = np.sort(codes * width + (values - low))
+	counts = np.bincount(codes, minlength=n_groups)
+	starts = np.cumsum(counts) - counts
+	values -= np.repeat(np.arange(n_groups) * width - low, counts)
+	lower = np.minimum(starts + (counts - 1) // 2, len(values) - 1)
+	upper = np.minimum(starts + counts // 2, len(values) - 1)
+	return np.where(counts > 0, (values[lower] + values[upper]) / 2, np.nan)
+
+
+def validate_bars(stocks, as_of=None, volume_outlier_sigmas=10.0, limits=None):
+	"""Returns the data quality report of a universe's daily bars, as a dataframe with one row per stock: its sessions,
+	first and last date, the count of each check, and whether it is quarantined
+
+	Positional Arguments:
+		stocks: dictionary of stock name to dataframe of daily bars indexed by date (in either order), with any of
+			price_columns and volume_column
+
+	Keyword Arguments:
+		as_of: date the data should be up to date with (default None, the last date most stocks share)
+		volume_outlier_sigmas: robust standard deviations of log volume beyond which a volume is an outlier (default 10)
+		limits: dictionary of check to the largest count before quarantine, overriding quarantine_limits (default None)
+	"""
+	import pandas as pd
+
+	limits = {**quarantine_limits, **(limits or {})}
+	stock_names = list(stocks)
+	frames = list(stocks.values())
+	n_stocks = len(frames)
+	lengths = np.array([len(frame) for frame in frames], dtype=np.int64)
+	n_rows = int(lengths.sum())
+
+	with instrumentation.span("validate", rows=n_rows):
+		codes = np.repeat(np.arange(n_stocks), lengths)
+		dates = _days(np.concatenate([frame.index.values for frame in frames])) if n_rows else np.empty(0, np.int64)
+		counts = {check: np.zeros(n_stocks, dtype=np.int64) for check in checks}
+
+		# Columns every stock has, flattened into one array each (selected from each stock's values by position, as
+		# selecting the columns of thousands of dataframes would take longer than the checks)
+		layouts = [tuple(frame.columns.values) for frame in frames]
+		names = [name for name in price_columns + [volume_column] if all(name in layout for layout in set(layouts))]
+		positions = {layout: [layout.index(name) for name in names] for layout in set(layouts)}
+		bars = np.concatenate([frame.to_numpy(dtype=float)[:, positions[layout]] for frame, layout in zip(frames, layouts)]) \
+			if n_rows else np.empty((0, len(names)))
+		column = lambda name: bars[:, names.index(name)] if name in names else None
+
+		# Prices and ranges
+		prices = [values for values in map(column, price_columns) if values is not None]
+		if prices:
+			bad_prices = np.zeros(n_rows, dtype=bool)
+			for values in prices:
+				bad_prices |= ~(values > 0)
+			counts["bad_prices"] = np.bincount(codes[bad_prices], minlength=n_stocks)
+		open_, high, low, close = (column(name) for name in price_columns[:4])
+		if all(values is not None for values in (open_, high, low, close)):
+			with np.errstate(invalid="ignore"):
+				bad_ranges = (high < np.fmax(np.fmax(open_, close), low)) | (low > np.fmin(open_, close))
+			counts["bad_ranges"] = np.bincount(codes[bad_ranges], minlength=n_stocks)
+
+		# Volume outliers, against each stock's median and median absolute deviation of log volumes
+		volume = column(volume_column)
+		if volume is not None:
+			finite = np.isfinite(volume) & (volume >= 0)
+			volume_codes = codes[finite]
+			log_volume = np.log1p(volume[finite])
+			median = _group_medians(volume_codes, log_volume, n_stocks)
+			deviation = np.abs(log_volume - median[volume_codes])
+			# Floor of the scale, so that a stock trading the same volume every day has no outliers of a few percent
+			scale = np.fmax(1.4826 * _group_medians(volume_codes, deviation, n_stocks), 0.05)
+			outliers = deviation > volume_outlier_sigmas * scale[volume_codes]
+			counts["volume_outliers"] = np.bincount(volume_codes[outliers], minlength=n_stocks)
+
+		# Calendar checks, against a table of the universe's days: whether each is a session, and the number of sessions
+		# up to it, so that finding a date's session is an index instead of a search
+		listed = lengths > 0
+		ends = np.cumsum(lengths)
+		first_dates = np.zeros(n_stocks, dtype=np.int64)
+		last_dates = np.zeros(n_stocks, dtype=np.int64)
+		as_of_day = None if as_of is None else int(_days(pd.Timestamp(as_of).to_datetime64()))
+		if n_rows:
+			first_day, last_day = dates.min(), dates.max()
+			calendar_end = last_day if as_of_day is None else max(last_day, as_of_day)
+			# Each stock's days since first_day in order, with duplicates next to each other (the codes are already
+			# grouped, so one sort of the days offset by their stock keeps them in place)
+			width = last_day - first_day + 1
+			days = np.sort(codes * width + (dates - first_day)) - codes * width
+			duplicate = np.zeros(n_rows, dtype=bool)
+			duplicate[1:] = (codes[1:] == codes[:-1]) & (days[1:] == days[:-1])
+			counts["duplicate_dates"] = np.bincount(codes[duplicate], minlength=n_stocks)
+			first_dates[listed] = days[(ends - lengths)[listed]]
+			last_dates[listed] = days[ends[listed] - 1]
+
+			is_session = np.zeros(calendar_end - first_day + 1, dtype=bool)
+			is_session[_trading_days(first_day, calendar_end) - first_day] = True
+			if n_stocks > 1:
+				# Sessions no stock traded on are closures missing from the calendar (eg. holidays after 2018)
+				traded = np.zeros(width, dtype=bool)
+				traded[days] = True
+				is_session[:width] &= traded
+			sessions_to = np.cumsum(is_session)
+
+			on_calendar = is_session[days]
+			counts["off_calendar"] = np.bincount(codes[~on_calendar], minlength=n_stocks)
+			sessions = on_calendar & ~duplicate
+			positions = sessions_to[days[sessions]]
+			session_codes = codes[sessions]
+			present = np.bincount(session_codes, minlength=n_stocks)
+			expected = sessions_to[last_dates] - sessions_to[first_dates] + is_session[first_dates]
+			counts["missing_sessions"] = np.where(listed, np.maximum(expected - present, 0), 0)
+			# Sessions missing before each session, within a stock (0 at each stock's first session)
+			gaps = np.zeros(len(positions), dtype=np.int64)
+			gaps[1:] = np.where(session_codes[1:] == session_codes[:-1], np.diff(positions) - 1, 0)
+			with_sessions = present > 0
+			counts["longest_gap"][with_sessions] = np.maximum.reduceat(gaps, (np.cumsum(present) - present)[with_sessions])
+
+			# Staleness, against the last date most stocks share (a stock fetched during a session has a partial bar
+			# more), or the latest session up to as_of
+			if as_of_day is None:
+				last_days, n_last = np.unique(last_dates[listed], return_counts=True)
+				reference = last_days[np.argmax(n_last)]
+			else:
+				reference = max(as_of_day - first_day, 0)
+			counts["stale_sessions"] = np.where(listed, np.maximum(sessions_to[reference] - sessions_to[last_dates], 0), 0)
+			first_dates += first_day
+			last_dates += first_day
+
+		quarantined = ~listed
+		for check, limit in limits.items():
+			if limit is not None:
+				quarantined |= counts[check] > limit
+
+		to_dates = lambda days: pd.to_datetime(np.where(listed, days, np.iinfo(np.int64).min).astype("datetime64[D]"))
+		report = pd.DataFrame({"sessions": lengths, "first_date": to_dates(first_dates), "last_date": to_dates(last_dates),
+							   **counts, "quarantined": quarantined}, index=pd.Index(stock_names, name="stock"))
+	return report
+
+
+def flagged(report):
+	"""Returns the rows of a report with any check counted
+
+	Positional Arguments:
+		report: dataframe returned by validate_bars()
+	"""
+	return report[(report[checks] > 0).any(axis=1) | report["quarantined"]]
+
+
+def quarantined(report):
+	"""Returns the names of the stocks a report quarantines
+
+	Positional Arguments:
+		report: dataframe returned by validate_bars()
+	"""
+	return list(report.index[report["quarantined"]])
+
+
+def quarantine_reasons(report, limits=None):
+	"""Returns the checks each quarantined stock failed, as a dictionary of stock name to a text like
+	"missing_sessions 56, longest_gap 56" ("no bars" for a stock without any)
+
+	Positional Arguments:
+		report: dataframe returned by validate_bars()
+
+	Keyword Arguments:
+		limits: limits the report was validated with, as in validate_bars() (default None)
+	"""
+	limits = {**quarantine_limits, **(limits or {})}
+	reasons = {}
+	for stock_name, row in report[report["quarantined"]].iterrows():
+		failed = [f"{check} {row[check]}" for check, limit in limits.items() if limit is not None and row[check] > limit]
+		reasons[stock_name] = ", ".join(failed) if row["sessions"] else "no bars"
+	return reasons
+
+
+def format_report(report):
+	"""Returns a compact text report: a summary line, then the flagged stocks with the checks they failed
+
+	Positional Arguments:
+		report: dataframe returned by validate_bars()
+	"""
+	rows = flagged(report)
+	summary = f"VALIDATED: {len(report)} STOCKS, {len(rows)} FLAGGED, {int(report['quarantined'].sum())} QUARANTINED"
+	if rows.empty:
+		return summary
+	failed = [check for check in checks if (rows[check] > 0).any()]
+	return summary + "\n\n" + rows[["sessions", "last_date"] + failed + ["quarantined"]].to_string(
+		formatters={"last_date": lambda date: f"{date:%Y-%m-%d}" if date == date else "-"})
+
+
+if __name__ == "__main__":
+	import argparse
+
+	from stitap_adjust import daily_columns
+	from stitap_loader import load_stock_csvs
+	from stitap_ta_screens import sti_stocks
+
+	parser = argparse.ArgumentParser(description="Checks the stored daily data of the STI stocks")
+	parser.add_argument("directory", nargs="?", default="sti_stock_data/original_data/daily",
+						help="directory of the daily csv files (default sti_stock_data/original_data/daily)")
+	parser.add_argument("--as-of", default=None, help="date the data should be up to date with, eg. 2018-07-18 (default the last date most stocks share)")
+	args = parser.parse_args()
+	stocks, _ = load_stock_csvs(sti_stocks, args.directory, daily_columns)
+	print(format_report(validate_bars(stocks, as_of=args.as_of)))
@@ -0,0 +1,199 @@
+""" Benchmarks of the api client stack: url building in _call_api_on_func,
+json parsing in _handle_api_call, the pandas conversion in _output_format and
+the whole decode path, on the recorded payloads of test_data and on synthetic
+full-history payloads of increasing size. Parsing is reported per MB, and
+the peak traced memory of each stage shows its allocations.
+
+Then the requests per second of the client against the local stand-in
+server (test_alpha_vantage.fake_alphavantage), with threads sharing the
+calls at different concurrency levels:
+
+    python -m benchmarks.client --concurrency 1,4,16 --latency 0.01
+
+The in-process server shares the GIL with the client threads; start one with
+python -m test_alpha_vantage.fake_alphavantage and pass --server-url to keep
+them apart.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from unittest import mock
+
+from benchmarks.harness import ROOT, Suite, argument_parser
+
+from alpha_vantage.alphavantage import AlphaVantage
+from alpha_vantage.cryptocurrencies import CryptoCurrencies
+from alpha_vantage.foreignexchange import ForeignExchange
+from alpha_vantage.sectorperformance import SectorPerformances
+from alpha_vantage.techindicators import TechIndicators
+from alpha_vantage.timeseries import TimeSeries
+from test_alpha_vantage.fake_alphavantage import FakeAlphaVantage
+
+TEST_DATA = path.join(ROOT, 'test_alpha_vantage', 'test_data')
+
+# Payload name: client class, method, arguments, output format and either the
+# recorded fixture or the number of bars of a synthetic full daily history
+PAYLOADS = [
+    ('foreign_exchange', ForeignExchange, 'get_currency_exchange_rate',
+     {'from_currency': 'BTC', 'to_currency': 'CNY'}, 'json',
+     'mock_foreign_exchange'),
+    ('batch_quotes', TimeSeries, 'get_batch_stock_quotes',
+     {'symbols': ('MSFT', 'FB', 'AAPL')}, 'pandas', 'mock_batch_quotes'),
+    ('sector', SectorPerformances, 'get_sector', {}, 'pandas',
+     'mock_sector'),
+    ('technical_indicator', TechIndicators, 'get_sma',
+     {'symbol': 'MSFT', 'interval': '15min', 'time_period': 10,
+      'series_type': 'close'}, 'pandas', 'mock_technical_indicator'),
+    ('time_series', TimeSeries, 'get_intraday',
+     {'symbol': 'MSFT', 'interval': '1min', 'outputsize': 'full'}, 'pandas',
+     'mock_time_series'),
+    ('crypto_currencies', CryptoCurrencies, 'get_digital_currency_intraday',
+     {'symbol': 'BTC', 'market': 'CNY'}, 'pandas', 'mock_crypto_currencies'),
+    ('daily_adjusted_1000', TimeSeries, 'get_daily_adjusted',
+     {'symbol': 'D05.SI', 'outputsize': 'full'}, 'pandas', 1000),
+    ('daily_adjusted_5000', TimeSeries, 'get_daily_adjusted',
+     {'symbol': 'D05.SI', 'outputsize': 'full'}, 'pandas', 5000),
+]
+
+
+def load_payload(source):
+    """ Return the body of a recorded fixture, or of a synthetic full daily
+    adjusted history with source bars
+    """
+    if isinstance(source, str):
+        with open(path.join(TEST_DATA, source), 'rb') as payload_file:
+            return payload_file.read()
+    with FakeAlphaVantage(full_size=source) as server:
+        _, _, body = server.respond({
+            'function': 'TIME_SERIES_DAILY_ADJUSTED', 'symbol': 'D05.SI',
+            'outputsize': 'full', 'apikey': 'test'})
+    return body
+
+
+def recorded_response(payload):
+    """ Return a requests response with the payload as its body, as
+    requests.get returns it
+    """
+    import requests
+
+    response = requests.models.Response()
+    response.status_code = 200
+    response._content = payload
+    # As if read already, so that streamed calls iterate over the payload
+    response._content_consumed = True
+    return response
+
+
+def benchmark_payload(suite, name, client_class, method_name, arguments,
+                      output_format, source):
+    """ Run the stages of the client stack on one payload
+    """
+    import json
+
+    if not any(suite.selected('{}/{}'.format(stage, name))
+               for stage in ('url', 'parse', 'format', 'decode')):
+        return
+    payload = load_payload(source)
+    megabytes = len(payload) / 1e6
+    client = client_class(key='test', output_format=output_format)
+    method = getattr(client_class, method_name)
+    call = getattr(client, method_name)
+    parsed = json.loads(payload.decode('utf-8'))
+    response = recorded_response(payload)
+
+    # The undecorated call returns the url instead of calling the api
+    url_client = client_class(key='test', output_format=output_format)
+    url_client._handle_api_call = lambda url: url
+    url = method.__wrapped__(url_client, **arguments)[0]
+    suite.run('url/' + name,
+              lambda: method.__wrapped__(url_client, **arguments))
+
+    with mock.patch('requests.get', return_value=response):
+        for stage, function in (
+                ('parse', lambda: client._handle_api_call(url)),
+                ('decode', lambda: call(**arguments))):
+            result = suite.run('{}/{}'.format(stage, name), function,
+                               units=megabytes, unit_name='MB')
+            if result is not None:
+                result['ms_per_mb'] = result['median_s'] * 1000 / megabytes
+                if 'peak_bytes' in result:
+                    result['peak_per_payload_byte'] = \
+                        result['peak_bytes'] / len(payload)
+
+    # The conversion alone, from the parsed payload
+    format_client = client_class(key='test', output_format=output_format)
+    format_client._handle_api_call = lambda url: parsed
+    suite.run('format/' + name, lambda: getattr(
+        format_client, method_name)(**arguments),
+        units=megabytes, unit_name='MB')
+
+
+def benchmark_server(suite, concurrency, n_requests, latency, outputsize,
+                     output_format, server_url=None):
+    """ Measure the requests per second of the client against the local
+    stand-in server, with concurrency threads sharing n_requests calls
+
+    The server runs in this process (sharing its GIL with the client threads)
+    unless the url of one started separately is given.
+    """
+    benchmark = 'server/{}/{}/c{}'.format(output_format, outputsize,
+                                          concurrency)
+    if not suite.selected(benchmark):
+        return
+    server = None
+    if server_url is None:
+        server = FakeAlphaVantage(latency=latency).start()
+        server_url = server.url
+    try:
+        with mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                               server_url):
+            clients = [TimeSeries(key='test', output_format=output_format)
+                       for _ in range(concurrency)]
+
+            def calls(thread):
+                for number in range(thread, n_requests, concurrency):
+                    clients[thread].get_daily_adjusted(
+                        'S{}.SI'.format(number % 30), outputsize=outputsize)
+
+            def run():
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    list(executor.map(calls, range(concurrency)))
+
+            suite.run(benchmark, run, units=n_requests, unit_name='requests')
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def main(argv=None):
+    parser = argument_parser('Benchmarks the api client stack on recorded '
+                             'payloads and against a local stand-in server')
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help='comma separated numbers of threads calling '
+                             'the server (default 1,4,16)')
+    parser.add_argument('--requests', type=int, default=120,
+                        help='calls per server benchmark (default 120)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the server waits before answering '
+                             '(default 0)')
+    parser.add_argument('--server-url', default=None,
+                        help='query url of a stand-in server started '
+                             'separately, eg. http://127.0.0.1:8900/query? '
+                             '(default one in this process)')
+    parser.add_argument('--outputsize', choices=['compact', 'full'],
+                        default='compact')
+    parser.add_argument('--output-format', choices=['json', 'pandas'],
+                        default='pandas')
+    args = parser.parse_args(argv)
+    suite = Suite('client', args)
+    for payload in PAYLOADS:
+        benchmark_payload(suite, *payload)
+    for concurrency in args.concurrency.split(','):
+        benchmark_server(suite, int(concurrency), args.requests, args.latency,
+                         args.outputsize, args.output_format,
+                         args.server_url)
+    return suite.finish()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
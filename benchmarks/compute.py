@@ -0,0 +1,180 @@
+""" Benchmarks of the screener's compute hot paths: loading the prepared
+data, the data quality checks, the percentage change histories behind the
+wrangled data, wrangling, combining, the RSI/StochRSI/MACD kernels and a
+composite screen.
+
+They run on the bundled data (30 stocks, 100 sessions) and on synthetic
+universes from stitap_synthetic (30/300/3000 stocks of 100/5000 sessions by
+default), each in a temporary copy of the sti_stock_data layout with the
+screener's stock list swapped for the universe's:
+
+    python -m benchmarks.compute --universes bundled,300x5000 --output results.json
+"""
+import contextlib
+import glob
+import io
+import os
+import shutil
+import sys
+import tempfile
+from os import path
+
+from benchmarks.harness import ROOT, Suite, argument_parser
+
+BUNDLED_DATA = path.join(ROOT, 'alpha_vantage', 'sti_stock_data')
+DEFAULT_UNIVERSES = ['bundled', '30x100', '300x100', '3000x100',
+                     '30x5000', '300x5000', '3000x5000']
+SCREEN = 'RSI(14) < 30 AND MACD BULLISH AND VOLUME_CHANGE(5) > 50'
+
+
+def parse_universe(text):
+    """ Return the number of stocks and sessions of a universe, eg.
+    "300x5000" (None for the bundled data)
+    """
+    if text == 'bundled':
+        return None
+    try:
+        n_stocks, n_sessions = (int(number) for number in text.split('x'))
+    except ValueError:
+        raise ValueError('Universe {} is not supported, use "bundled" or '
+                         '<stocks>x<sessions>, eg. 300x5000'.format(text))
+    return n_stocks, n_sessions
+
+
+def write_universe(directory, universe):
+    """ Write a universe's daily data into directory/sti_stock_data, and
+    return its dictionary of stock name to ticker
+
+    Positional Arguments:
+        directory: directory the screener runs from
+        universe: (stocks, sessions) or None for the bundled data
+    """
+    import stitap_synthetic
+    from stitap_calendar import sgx_trading_days
+    from stitap_ta_screens import sti_stocks
+
+    data_directory = path.join(directory, 'sti_stock_data')
+    for layout in ('original_data/daily', 'wrangled_data', 'combined_data'):
+        os.makedirs(path.join(data_directory, layout))
+    if universe is None:
+        for csv_path in glob.glob(path.join(BUNDLED_DATA, 'original_data',
+                                            '*.csv')):
+            shutil.copy(csv_path, path.join(data_directory, 'original_data',
+                                            'daily'))
+        return dict(sti_stocks)
+    n_stocks, n_sessions = universe
+    dates = sgx_trading_days('1980-01-01', '2018-07-18')[-n_sessions:]
+    return stitap_synthetic.write_synthetic_data(
+        n_stocks, dates[0], dates[-1], directory=data_directory,
+        timeframes=('daily',), layouts={'original_data': None},
+        listing_fraction=0, seed=0)
+
+
+@contextlib.contextmanager
+def screener_universe(universe):
+    """ Run the screener on a universe: from a temporary directory holding
+    its data, with the stock lists of run.py and stitap_ta_screens swapped
+    for the universe's and no shared PrepareTechnicalAnalysis instance
+    """
+    import run
+    import stitap_ta_screens
+
+    stock_lists = [run.sti_stocks, stitap_ta_screens.sti_stocks]
+    saved = [dict(stock_list) for stock_list in stock_lists]
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        stocks = write_universe(directory, universe)
+        os.chdir(directory)
+        for stock_list in stock_lists:
+            stock_list.clear()
+            stock_list.update(stocks)
+        stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+        try:
+            yield stocks
+        finally:
+            os.chdir(working_directory)
+            for stock_list, previous in zip(stock_lists, saved):
+                stock_list.clear()
+                stock_list.update(previous)
+            stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+
+
+def quiet(function):
+    """ Return function with its printed progress discarded
+    """
+    def call():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return call
+
+
+def benchmark_universe(suite, name):
+    """ Run every compute benchmark on one universe
+    """
+    import run
+    import stitap_ta_indicators
+    from stitap_loader import load_stock_csvs
+    from stitap_returns import ReturnEngine
+    from stitap_ta_expressions import ScreenContext, parse_screen
+    from stitap_ta_screens import PrepareTechnicalAnalysis
+    from stitap_validate import price_columns, validate_bars
+
+    benchmarks = ['load', 'validate', 'pct_change_history', 'wrangle_data',
+                  'combine_data', 'rsi', 'stoch_rsi', 'macd', 'screen']
+    if not any(suite.selected('{}/{}'.format(name, benchmark))
+               for benchmark in benchmarks):
+        return
+    with screener_universe(parse_universe(name)) as stocks:
+        prepared = quiet(PrepareTechnicalAnalysis.instance)()
+        prices = prepared.adjusted_close_panel.values
+        engine = ReturnEngine.from_prepared_data(prepared)
+        wrangler = run.Wrangler()
+        print('{}: {} stocks, {} sessions'.format(name, len(stocks),
+                                                  len(prices)))
+
+        def pct_change_history():
+            for attribute in ('price', 'volume'):
+                for timeframe in ('daily', 'weekly', 'monthly'):
+                    engine.pct_change_history(timeframe, attribute=attribute)
+
+        def screen():
+            context = ScreenContext.from_prepared_data(prepared)
+            return parse_screen(SCREEN).evaluate(context)
+
+        suite.run(name + '/load', quiet(PrepareTechnicalAnalysis))
+        if suite.selected(name + '/validate'):
+            bars, _ = load_stock_csvs(stocks, 'sti_stock_data/original_data/'
+                                      'daily', price_columns + ['6. volume'])
+            suite.run(name + '/validate', lambda: validate_bars(bars))
+        suite.run(name + '/pct_change_history', pct_change_history)
+        if suite.run(name + '/wrangle_data',
+                     quiet(wrangler.wrangle_data)) is None:
+            # combine_data reads the wrangled data
+            quiet(wrangler.wrangle_data)()
+        suite.run(name + '/combine_data', quiet(wrangler.combine_data))
+        suite.run(name + '/rsi', lambda: stitap_ta_indicators.rsi(prices, 14))
+        suite.run(name + '/stoch_rsi',
+                  lambda: stitap_ta_indicators.stoch_rsi(prices, 14))
+        suite.run(name + '/macd', lambda: stitap_ta_indicators.macd(prices))
+        suite.run(name + '/screen', screen)
+
+
+def main(argv=None):
+    parser = argument_parser('Benchmarks the compute hot paths of the '
+                             'screener on the bundled and synthetic data')
+    parser.add_argument('--universes', default=','.join(DEFAULT_UNIVERSES),
+                        help='comma separated universes, "bundled" or '
+                             '<stocks>x<sessions> (default {})'.format(
+                                 ','.join(DEFAULT_UNIVERSES)))
+    args = parser.parse_args(argv)
+    names = args.universes.split(',')
+    for name in names:
+        parse_universe(name)
+    suite = Suite('compute', args)
+    for name in names:
+        benchmark_universe(suite, name)
+    return suite.finish()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
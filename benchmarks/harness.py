@@ -0,0 +1,229 @@
+""" Shared helpers of the benchmark suites: timing, peak memory, json results
+and comparisons against a stored baseline.
+
+Every benchmark is timed over a few repeats (after a warmup call) and its
+median time is reported, then run once more under tracemalloc for its peak
+traced memory (numpy and pandas buffers included). Results are written as
+json together with the environment they were measured in, so that a run can
+be compared against a baseline saved earlier on the same machine:
+
+    python -m benchmarks.compute --save-baseline
+    python -m benchmarks.compute --threshold 0.2
+
+exits with status 1 when a benchmark got slower (or used more memory) than
+the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+BASELINE_DIRECTORY = path.join(ROOT, 'benchmarks', 'baselines')
+
+# The client is imported as the alpha_vantage package, and the stitap modules
+# are scripts run from the alpha_vantage folder
+for directory in (path.join(ROOT, 'alpha_vantage'), ROOT):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+def measure(function, repeat=5, warmup=1, budget=10.0, units=None,
+            trace_memory=True):
+    """ Time function() and measure its peak traced memory
+
+    Returns a dictionary of the median, minimum and mean times (in seconds),
+    the number of timed calls, the peak traced memory (in bytes) and, when
+    units is given, the units processed per second at the median time.
+
+    Keyword Arguments:
+        repeat: maximum number of timed calls (default 5)
+        warmup: number of untimed calls before them (default 1)
+        budget: seconds after which no more timed calls are started, so that
+            slow benchmarks are timed fewer times; a warmup call slower than
+            this is timed instead of repeated (default 10)
+        units: number of units (eg. bytes or requests) processed by each
+            call (default None)
+        trace_memory: run the function once more under tracemalloc
+            (default True)
+    """
+    times = []
+    for _ in range(warmup):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if elapsed > budget:
+            # Too slow to repeat within the budget, so this call is timed
+            times.append(elapsed)
+            break
+    started = time.perf_counter()
+    while not times or len(times) < repeat and \
+            time.perf_counter() - started <= budget:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    result = {'median_s': statistics.median(times), 'min_s': min(times),
+              'mean_s': statistics.mean(times), 'repeat': len(times)}
+    if units is not None:
+        result['units'] = units
+        result['units_per_s'] = units / result['median_s']
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            function()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def environment():
+    """ Return a description of the machine and libraries results were
+    measured with
+    """
+    versions = {}
+    for module in ('numpy', 'pandas', 'requests', 'pyarrow'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'versions': versions,
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+
+
+def compare(results, baseline, threshold=0.25):
+    """ Return the regressions of results against a baseline, as a list of
+    (benchmark, metric, baseline value, value, ratio) tuples
+
+    A benchmark regresses when its median time or peak memory is more than
+    threshold (a fraction) above the baseline's. Benchmarks missing from
+    either run are skipped.
+
+    Positional Arguments:
+        results: dictionary of benchmark name to result of measure()
+        baseline: dictionary of benchmark name to result of measure()
+
+    Keyword Arguments:
+        threshold: allowed relative increase (default 0.25)
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('median_s', 'peak_bytes'):
+            before, after = baseline[name].get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            if ratio > 1 + threshold:
+                regressions.append((name, metric, before, after, ratio))
+    return regressions
+
+
+def argument_parser(description):
+    """ Return an argument parser with the options shared by every suite
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='maximum number of timed calls (default 5)')
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='seconds of timed calls per benchmark '
+                             '(default 10)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc run of each benchmark')
+    parser.add_argument('--output', default=None,
+                        help='json file to write the results to')
+    parser.add_argument('--baseline', default=None,
+                        help='json results to compare against (default '
+                             'benchmarks/baselines/<suite>.json, if saved)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative slowdown or memory increase '
+                             'against the baseline (default 0.25)')
+    return parser
+
+
+class Suite(object):
+    """ Runs and reports the benchmarks of one suite with the options of
+    argument_parser()
+    """
+
+    def __init__(self, name, args):
+        """
+        Positional Arguments:
+            name: name of the suite, eg. "compute"
+            args: parsed arguments of argument_parser()
+        """
+        self.name = name
+        self.args = args
+        self.results = {}
+
+    def selected(self, benchmark):
+        """ Return whether a benchmark passes the --filter option
+        """
+        return self.args.filter is None or self.args.filter in benchmark
+
+    def run(self, benchmark, function, units=None, unit_name='units'):
+        """ Measure function() if it is selected, print and keep its result
+        """
+        if not self.selected(benchmark):
+            return None
+        result = measure(function, repeat=self.args.repeat,
+                         budget=self.args.budget, units=units,
+                         trace_memory=not self.args.no_memory)
+        self.results[benchmark] = result
+        line = '{:<48} {:>11.3f} ms'.format(benchmark,
+                                             result['median_s'] * 1000)
+        if 'peak_bytes' in result:
+            line += ' {:>11.1f} KiB peak'.format(result['peak_bytes'] / 1024)
+        if units is not None:
+            line += ' {:>12.1f} {}/s'.format(result['units_per_s'], unit_name)
+        print(line)
+        sys.stdout.flush()
+        return result
+
+    def finish(self):
+        """ Write the results, compare them against the baseline and return
+        the exit status (1 if any benchmark regressed)
+        """
+        document = {'suite': self.name, 'environment': environment(),
+                    'results': self.results}
+        if self.args.output:
+            _write_json(self.args.output, document)
+        baseline_path = self.args.baseline or path.join(
+            BASELINE_DIRECTORY, self.name + '.json')
+        if self.args.save_baseline:
+            _write_json(baseline_path, document)
+            print('Saved baseline {}'.format(baseline_path))
+            return 0
+        if not path.exists(baseline_path):
+            return 0
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(self.results, baseline['results'],
+                              self.args.threshold)
+        for name, metric, before, after, ratio in regressions:
+            print('REGRESSION {} {}: {:.6g} -> {:.6g} ({:+.1f}%)'.format(
+                name, metric, before, after, (ratio - 1) * 100))
+        print('{} regressions against {} (threshold {:.0f}%)'.format(
+            len(regressions), baseline_path, self.args.threshold * 100))
+        return 1 if regressions else 0
+
+
+def _write_json(file_path, document):
+    directory = path.dirname(path.abspath(file_path))
+    if not path.isdir(directory):
+        os.makedirs(directory)
+    with open(file_path, 'w') as json_file:
+        json.dump(document, json_file, indent=2, sort_keys=True)
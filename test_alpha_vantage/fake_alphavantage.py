@@ -0,0 +1,456 @@
+""" Local HTTP stand-in for the Alpha Vantage API, for load testing the
+client's api calls, retries and concurrency offline and reproducibly.
+
+It serves the TIME_SERIES_*, BATCH_STOCK_QUOTES, technical indicator,
+DIGITAL_CURRENCY_*, CURRENCY_EXCHANGE_RATE and SECTOR functions, from the
+recorded fixtures in test_data or from synthetic data (deterministic for
+each symbol), with configurable latency, error injection and the "Note"
+responses the real service sends when its call frequency is exceeded.
+
+Point the client at it by patching AlphaVantage._ALPHA_VANTAGE_API_URL:
+
+    with FakeAlphaVantage(latency=0.05, calls_per_minute=5) as server:
+        with mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                               server.url):
+            TimeSeries(key='test').get_daily('MSFT')
+
+or run it on its own: python -m test_alpha_vantage.fake_alphavantage
+"""
+import csv
+import io
+import json
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from os import path
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+RATE_LIMIT_NOTE = ("Thank you for using Alpha Vantage! Our standard API call "
+                   "frequency is 5 calls per minute and 500 calls per day. "
+                   "Please visit https://www.alphavantage.co/premium/ if you "
+                   "would like to target a higher API call frequency.")
+
+# Data key and bar interval (None for intraday, which takes the interval
+# parameter) of each time series function
+TIME_SERIES = {
+    'TIME_SERIES_INTRADAY': (None, None),
+    'TIME_SERIES_DAILY': ('Time Series (Daily)', 'daily'),
+    'TIME_SERIES_DAILY_ADJUSTED': ('Time Series (Daily)', 'daily'),
+    'TIME_SERIES_WEEKLY': ('Weekly Time Series', 'weekly'),
+    'TIME_SERIES_WEEKLY_ADJUSTED': ('Weekly Adjusted Time Series', 'weekly'),
+    'TIME_SERIES_MONTHLY': ('Monthly Time Series', 'monthly'),
+    'TIME_SERIES_MONTHLY_ADJUSTED': ('Monthly Adjusted Time Series',
+                                     'monthly'),
+}
+
+DIGITAL_CURRENCIES = {
+    'DIGITAL_CURRENCY_INTRADAY': ('Time Series (Digital Currency Intraday)',
+                                  '5min'),
+    'DIGITAL_CURRENCY_DAILY': ('Time Series (Digital Currency Daily)',
+                               'daily'),
+    'DIGITAL_CURRENCY_WEEKLY': ('Time Series (Digital Currency Weekly)',
+                                'weekly'),
+    'DIGITAL_CURRENCY_MONTHLY': ('Time Series (Digital Currency Monthly)',
+                                 'monthly'),
+}
+
+TECHNICAL_INDICATORS = [
+    'SMA', 'EMA', 'WMA', 'DEMA', 'TEMA', 'TRIMA', 'KAMA', 'MAMA', 'T3',
+    'MACD', 'MACDEXT', 'STOCH', 'STOCHF', 'RSI', 'STOCHRSI', 'WILLR', 'ADX',
+    'ADXR', 'APO', 'PPO', 'MOM', 'BOP', 'CCI', 'CMO', 'ROC', 'ROCR', 'AROON',
+    'AROONOSC', 'MFI', 'TRIX', 'ULTOSC', 'DX', 'MINUS_DI', 'PLUS_DI',
+    'MINUS_DM', 'PLUS_DM', 'BBANDS', 'MIDPOINT', 'MIDPRICE', 'SAR', 'TRANGE',
+    'ATR', 'NATR', 'AD', 'ADOSC', 'OBV', 'HT_TRENDLINE', 'HT_SINE',
+    'HT_TRENDMODE', 'HT_DCPERIOD', 'HT_DCPHASE', 'HT_PHASOR',
+]
+
+# Recorded response of the functions with a fixture in test_data
+FIXTURES = {
+    'TIME_SERIES_INTRADAY': 'mock_time_series',
+    'BATCH_STOCK_QUOTES': 'mock_batch_quotes',
+    'SMA': 'mock_technical_indicator',
+    'DIGITAL_CURRENCY_INTRADAY': 'mock_crypto_currencies',
+    'CURRENCY_EXCHANGE_RATE': 'mock_foreign_exchange',
+    'SECTOR': 'mock_sector',
+}
+
+_FIXTURES_DIRECTORY = path.join(path.dirname(path.abspath(__file__)),
+                                'test_data')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server answering each request in its own thread (as
+    http.server.ThreadingHTTPServer, which needs Python 3.7)
+    """
+    daemon_threads = True
+
+
+class FakeAlphaVantage(object):
+    """ A local Alpha Vantage API served from a background thread. It can
+    be used as a context manager, which starts and stops it.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0,
+                 error_rate=0, error_statuses=(500, 503),
+                 calls_per_minute=None, calls_per_day=None,
+                 use_fixtures=False, full_size=1000,
+                 end_date='2018-07-19', seed=None, clock=time.monotonic):
+        """ Initialize the server (it only listens once started)
+
+        Keyword Arguments:
+            host: Address to listen on (default '127.0.0.1')
+            port: Port to listen on, 0 for any free port (default 0)
+            latency: Seconds to wait before answering each call (default 0)
+            jitter: Extra random seconds, up to jitter, added to the
+                latency (default 0)
+            error_rate: Fraction of calls answered with an HTTP error
+                (default 0)
+            error_statuses: HTTP statuses of the injected errors (default
+                (500, 503))
+            calls_per_minute: Calls per minute of each api key before "Note"
+                responses, None for no limit (default None)
+            calls_per_day: Calls per day of each api key before "Note"
+                responses, None for no limit (default None)
+            use_fixtures: Serve the recorded fixtures of the functions which
+                have one, instead of synthetic data (default False)
+            full_size: Number of bars of an outputsize=full time series
+                (default 1000)
+            end_date: Date of the most recent bar (default '2018-07-19')
+            seed: Seed of the error injection and jitter (default None)
+            clock: Function returning the time in seconds, used for the rate
+                limits (default time.monotonic)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.calls_per_minute = calls_per_minute
+        self.calls_per_day = calls_per_day
+        self.use_fixtures = use_fixtures
+        self.full_size = full_size
+        self.end_date = datetime.strptime(end_date, '%Y-%m-%d')
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._responses = {}
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0}
+        self._server = _ThreadingHTTPServer((host, port), _handler(self))
+        self._thread = None
+
+    @property
+    def url(self):
+        """ The query url to patch AlphaVantage._ALPHA_VANTAGE_API_URL with
+        """
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/query?'.format(host, port)
+
+    def start(self):
+        """ Start answering calls in a background thread
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='fake-alphavantage')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop answering calls and close the socket
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, query):
+        """ Return the HTTP status, content type and body answering a call,
+        after the configured latency
+
+        Keyword Arguments:
+            query: Dictionary of the query parameters of the call
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            status = self._random.choice(self.error_statuses)
+            limited = self._rate_limited(query.get('apikey'))
+            if failed:
+                self.stats['errors'] += 1
+            elif limited:
+                self.stats['rate_limited'] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return status, 'text/html', b'<html><body>Error</body></html>'
+        if limited:
+            return 200, 'application/json', _dumps({'Note': RATE_LIMIT_NOTE})
+        if not query.get('apikey'):
+            return 200, 'application/json', _dumps({
+                'Error Message': 'the parameter apikey is invalid or '
+                                 'missing. Please claim your free API key on '
+                                 '(https://www.alphavantage.co/support/'
+                                 '#api-key). It should take less than 20 '
+                                 'seconds, and is free permanently.'})
+        key = tuple(sorted((name, value) for name, value in query.items()
+                           if name != 'apikey'))
+        if key not in self._responses:
+            self._responses[key] = self._build(query)
+        return self._responses[key]
+
+    def _rate_limited(self, api_key):
+        """ Record a call of an api key, returning whether it is over the
+        rate limits (calls over the limits are not counted)
+        """
+        if self.calls_per_minute is None and self.calls_per_day is None:
+            return False
+        now = self._clock()
+        calls = self._calls.setdefault(api_key, deque())
+        while calls and calls[0] <= now - 86400:
+            calls.popleft()
+        last_minute = sum(1 for call in calls if call > now - 60)
+        if (self.calls_per_minute is not None and
+                last_minute >= self.calls_per_minute) or \
+                (self.calls_per_day is not None and
+                 len(calls) >= self.calls_per_day):
+            return True
+        calls.append(now)
+        return False
+
+    def _build(self, query):
+        """ Return the HTTP status, content type and body of a call's data
+        """
+        function = query.get('function', '')
+        if self.use_fixtures and function in FIXTURES or \
+                function in ('CURRENCY_EXCHANGE_RATE', 'SECTOR'):
+            with open(path.join(_FIXTURES_DIRECTORY,
+                                FIXTURES[function]), 'rb') as f:
+                return 200, 'application/json', f.read()
+        if function in TIME_SERIES:
+            data = self._time_series(function, query)
+        elif function == 'BATCH_STOCK_QUOTES':
+            data = self._batch_quotes(query)
+        elif function in TECHNICAL_INDICATORS:
+            data = self._technical_indicator(function, query)
+        elif function in DIGITAL_CURRENCIES:
+            data = self._digital_currency(function, query)
+        else:
+            data = {'Error Message': 'Invalid API call. Please retry or '
+                                     'visit the documentation '
+                                     '(https://www.alphavantage.co/'
+                                     'documentation/) for '
+                                     '{}.'.format(function)}
+        if query.get('datatype') == 'csv' and 'Error Message' not in data:
+            return 200, 'application/x-download', _to_csv(data)
+        return 200, 'application/json', _dumps(data)
+
+    def _bars(self, symbol, interval, size):
+        """ Return size synthetic bars of a symbol (most recent first) as
+        (time, open, high, low, close, volume) tuples, the same for every
+        call
+        """
+        generator = random.Random(zlib.crc32(symbol.encode()))
+        times = _bar_times(self.end_date, interval, size)
+        close = generator.uniform(5, 500)
+        bars = []
+        for bar_time in reversed(times):
+            open_ = close
+            close = max(0.01, open_ * (1 + generator.gauss(0, 0.015)))
+            high = max(open_, close) * (1 + abs(generator.gauss(0, 0.005)))
+            low = min(open_, close) * (1 - abs(generator.gauss(0, 0.005)))
+            volume = int(generator.lognormvariate(13, 0.6))
+            bars.append((bar_time, open_, high, low, close, volume))
+        bars.reverse()
+        return bars
+
+    def _time_series(self, function, query):
+        data_key, interval = TIME_SERIES[function]
+        if interval is None:
+            interval = query.get('interval', '15min')
+            data_key = 'Time Series ({})'.format(interval)
+        symbol = query.get('symbol', '')
+        size = self.full_size if query.get('outputsize') == 'full' else 100
+        adjusted = function.endswith('ADJUSTED')
+        series = {}
+        for bar_time, open_, high, low, close, volume in \
+                self._bars(symbol, interval, size):
+            bar = {'1. open': '{:.4f}'.format(open_),
+                   '2. high': '{:.4f}'.format(high),
+                   '3. low': '{:.4f}'.format(low),
+                   '4. close': '{:.4f}'.format(close)}
+            if adjusted:
+                bar['5. adjusted close'] = '{:.4f}'.format(close)
+                bar['6. volume'] = str(volume)
+                bar['7. dividend amount'] = '0.0000'
+                if function == 'TIME_SERIES_DAILY_ADJUSTED':
+                    bar['8. split coefficient'] = '1.0000'
+            else:
+                bar['5. volume'] = str(volume)
+            series[bar_time] = bar
+        meta_data = {'1. Information': '{} prices and volumes'.format(
+                         interval.capitalize()),
+                     '2. Symbol': symbol,
+                     '3. Last Refreshed': next(iter(series)),
+                     '4. Output Size': 'Full size' if size > 100
+                     else 'Compact',
+                     '5. Time Zone': 'US/Eastern'}
+        return {'Meta Data': meta_data, data_key: series}
+
+    def _batch_quotes(self, query):
+        quotes = []
+        for symbol in query.get('symbols', '').split(','):
+            bar_time, _, _, _, close, volume = self._bars(symbol, '1min',
+                                                          1)[0]
+            quotes.append({'1. symbol': symbol,
+                           '2. price': '{:.4f}'.format(close),
+                           '3. volume': str(volume),
+                           '4. timestamp': bar_time})
+        return {'Meta Data': {'1. Information': 'Batch Stock Market Quotes',
+                              '3. Time Zone': 'US/Eastern'},
+                'Stock Quotes': quotes}
+
+    def _technical_indicator(self, function, query):
+        symbol = query.get('symbol', '')
+        interval = query.get('interval', 'daily')
+        period = int(query.get('time_period') or 10)
+        bars = self._bars(symbol, interval, 100 + period)
+        closes = [bar[4] for bar in bars]
+        series = {}
+        for position, bar in enumerate(bars[:100]):
+            window = closes[position:position + period]
+            series[bar[0]] = {function: '{:.4f}'.format(
+                sum(window) / len(window))}
+        meta_data = {'1: Symbol': symbol, '2: Indicator': function,
+                     '3: Last Refreshed': bars[0][0], '4: Interval': interval,
+                     '5: Time Period': period,
+                     '7: Time Zone': 'US/Eastern'}
+        return {'Meta Data': meta_data,
+                'Technical Analysis: {}'.format(function): series}
+
+    def _digital_currency(self, function, query):
+        data_key, interval = DIGITAL_CURRENCIES[function]
+        symbol, market = query.get('symbol', ''), query.get('market', '')
+        series = {}
+        for bar_time, _, _, _, close, volume in \
+                self._bars(symbol + market, interval, 100):
+            series[bar_time] = {
+                '1a. price ({})'.format(market): '{:.8f}'.format(close),
+                '1b. price (USD)': '{:.8f}'.format(close),
+                '2. volume': '{:.8f}'.format(volume / 1e4),
+                '3. market cap (USD)': '{:.8f}'.format(close * volume / 1e4)}
+        meta_data = {'1. Information': 'Prices and Volumes for Digital '
+                                       'Currency',
+                     '2. Digital Currency Code': symbol,
+                     '4. Market Code': market, '8. Time Zone': 'UTC'}
+        return {'Meta Data': meta_data, data_key: series}
+
+
+def _bar_times(end_date, interval, size):
+    """ Return the times of size bars ending at end_date, most recent first
+    (weekdays only for daily bars)
+    """
+    if interval.endswith('min'):
+        step = timedelta(minutes=int(interval[:-3]))
+        end = end_date.replace(hour=16)
+        return [(end - step * bar).strftime('%Y-%m-%d %H:%M:%S')
+                for bar in range(size)]
+    times = []
+    day = end_date
+    while len(times) < size:
+        if interval == 'daily' and day.weekday() < 5 or \
+                interval == 'weekly' and day.weekday() == 4 or \
+                interval == 'monthly' and \
+                (day + timedelta(days=1)).month != day.month:
+            times.append(day.strftime('%Y-%m-%d'))
+        day -= timedelta(days=1)
+    return times
+
+
+def _dumps(data):
+    return json.dumps(data, indent=4).encode()
+
+
+def _to_csv(data):
+    """ Return the series of a response as csv, the way the api sends it
+    """
+    data_key = [key for key in data if key != 'Meta Data'][0]
+    series = data[data_key]
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\r\n')
+    rows = series if isinstance(series, list) else \
+        [dict(timestamp=bar_time, **values)
+         for bar_time, values in series.items()]
+    writer.writerow([column.split('. ')[-1] for column in rows[0]])
+    for row in rows:
+        writer.writerow(row.values())
+    return output.getvalue().encode()
+
+
+def _handler(server):
+    """ Return a request handler class answering calls with a
+    FakeAlphaVantage
+    """
+    class FakeAlphaVantageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {name: values[-1] for name, values in
+                     parse_qs(parts.query).items()}
+            if parts.path != '/query':
+                status, content_type, body = 404, 'text/html', b'Not Found'
+            else:
+                status, content_type, body = server.respond(query)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeAlphaVantageHandler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve a local stand-in for the Alpha Vantage API')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--calls-per-minute', type=int, default=None)
+    parser.add_argument('--calls-per-day', type=int, default=None)
+    parser.add_argument('--fixtures', action='store_true',
+                        help='serve the recorded fixtures where available')
+    args = parser.parse_args()
+    fake = FakeAlphaVantage(port=args.port, latency=args.latency,
+                            jitter=args.jitter, error_rate=args.error_rate,
+                            calls_per_minute=args.calls_per_minute,
+                            calls_per_day=args.calls_per_day,
+                            use_fixtures=args.fixtures)
+    print('Serving the fake Alpha Vantage API on {}'.format(fake.url))
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake._server.server_close()
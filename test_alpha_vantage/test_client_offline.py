@@ -0,0 +1,206 @@
+""" Offline tests of the client against the fake Alpha Vantage server, and
+of its instrumentation, quota counting and streaming decode
+
+The fake server and these features need Python 3, so they are kept apart
+from test_alphavantage.py, which runs on every supported interpreter.
+"""
+from ..alpha_vantage.alphavantage import AlphaVantage
+from ..alpha_vantage.timeseries import TimeSeries
+from ..alpha_vantage import instrumentation
+from ..alpha_vantage.quota import QuotaStore, format_report
+from ..alpha_vantage.jsonstream import TimeSeriesColumns, decode_stream
+from .fake_alphavantage import FakeAlphaVantage
+from pandas import DataFrame as df
+import json
+import unittest
+from os import path
+import requests_mock
+import tempfile
+from unittest import mock
+
+
+def recorded_response_path(name):
+    """ Return the path of a recorded response in the test data folder
+    """
+    return path.join(path.dirname(path.abspath(__file__)), 'test_data', name)
+
+
+class TestClientOffline(unittest.TestCase):
+
+    _API_KEY_TEST = "test"
+
+    def test_fake_server_time_series(self):
+        """ Test that the fake server answers the client with synthetic data
+        """
+        with FakeAlphaVantage() as server, mock.patch.object(
+                AlphaVantage, '_ALPHA_VANTAGE_API_URL', server.url):
+            ts = TimeSeries(key=TestClientOffline._API_KEY_TEST,
+                            output_format='pandas')
+            data, meta_data = ts.get_daily_adjusted('D05.SI',
+                                                    outputsize='full')
+            self.assertEqual(len(data), 1000)
+            self.assertIn('5. adjusted close', data.columns)
+            self.assertEqual(meta_data['2. Symbol'], 'D05.SI')
+            again, _ = ts.get_daily_adjusted('D05.SI', outputsize='full')
+            self.assertTrue(data.equals(again))
+
+    def test_fake_server_rate_limit_and_errors(self):
+        """ Test that the fake server sends rate limit notes and injected
+        errors, which the client retries
+        """
+        with FakeAlphaVantage(calls_per_minute=1) as server, \
+                mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                                  server.url):
+            ts = TimeSeries(key=TestClientOffline._API_KEY_TEST)
+            ts.get_daily('MSFT')
+            response = ts._handle_api_call(
+                server.url + 'function=TIME_SERIES_DAILY&symbol=MSFT'
+                '&apikey=test')
+            self.assertIn('Note', response)
+            self.assertEqual(server.stats['rate_limited'], 1)
+        with FakeAlphaVantage(error_rate=0.5, seed=1) as server, \
+                mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                                  server.url):
+            ts = TimeSeries(key=TestClientOffline._API_KEY_TEST, retries=20)
+            for _ in range(3):
+                data, _ = ts.get_daily('MSFT')
+                self.assertEqual(len(data), 100)
+            self.assertGreater(server.stats['errors'], 0)
+
+    @requests_mock.Mocker()
+    def test_instrumentation(self, mock_request):
+        """ Test that the client's stages are timed and exported while
+        instrumentation is enabled, and not while it is disabled
+        """
+        ts = TimeSeries(key=TestClientOffline._API_KEY_TEST,
+                        output_format='pandas')
+        url = "http://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+        with open(recorded_response_path("mock_time_series")) as f:
+            mock_request.get(url, text=f.read())
+        self.assertIs(instrumentation.span('fetch'),
+                      instrumentation.span('decode'))
+        instrumentation.enable()
+        try:
+            data, _ = ts.get_intraday(
+                "MSFT", interval='1min', outputsize='full')
+            with instrumentation.span('screen', 'Failing'):
+                with self.assertRaises(ValueError):
+                    with instrumentation.span('prepare', rows=3):
+                        raise ValueError('No data')
+            report = instrumentation.report()
+            prometheus = instrumentation._recorder.prometheus()
+        finally:
+            instrumentation.disable()
+        self.assertIsNone(instrumentation.report())
+        stages = {(stage['stage'], stage['detail']): stage
+                  for stage in report['stages']}
+        fetch = stages[('fetch', 'TIME_SERIES_INTRADAY')]
+        self.assertEqual(fetch['calls'], 1)
+        # The pandas output is streamed, so the bytes count as decoded
+        self.assertGreater(stages[('decode', 'TIME_SERIES_INTRADAY')]['bytes'],
+                           0)
+        self.assertEqual(stages[('decode', 'pandas')]['rows'], len(data))
+        self.assertEqual(stages[('prepare', None)]['errors'], 1)
+        self.assertEqual(stages[('prepare', None)]['rows'], 3)
+        self.assertEqual(report['spans'][-2]['parent'], 'screen')
+        self.assertIn('alpha_vantage_stage_calls_total{stage="fetch",'
+                      'detail="TIME_SERIES_INTRADAY"} 1', prometheus)
+
+    def test_quota_store(self):
+        """ Test that the requests of a key are counted by function and
+        outcome, retries and rate limit notes included
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            store = QuotaStore(path.join(directory, 'quota.sqlite'))
+            with FakeAlphaVantage(calls_per_minute=2) as server, \
+                    mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                                      server.url):
+                ts = TimeSeries(key='test_key', quota=store)
+                ts.get_daily('MSFT')
+                ts.get_weekly('MSFT')
+                with self.assertRaises(KeyError):
+                    ts.get_daily('MSFT')
+            with FakeAlphaVantage(error_rate=0.5, seed=1) as server, \
+                    mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                                      server.url):
+                ts = TimeSeries(key='test_key', retries=20, quota=store)
+                ts.get_intraday('MSFT')
+                errors = server.stats['errors']
+            store.record('test_key', 'TIME_SERIES_DAILY', cache_hits=2)
+            usage = {row['function']: row for row in store.usage()}
+            self.assertEqual(usage['TIME_SERIES_DAILY']['requests'], 2)
+            self.assertEqual(usage['TIME_SERIES_DAILY']['rate_limited'], 1)
+            self.assertEqual(usage['TIME_SERIES_DAILY']['cache_hits'], 2)
+            self.assertEqual(usage['TIME_SERIES_WEEKLY']['successes'], 1)
+            intraday = usage['TIME_SERIES_INTRADAY']
+            self.assertEqual(intraday['requests'], errors + 1)
+            self.assertEqual(intraday['retries'], errors)
+            self.assertEqual(intraday['errors'], errors)
+            self.assertEqual(intraday['key'], '..._key')
+            total, = store.usage(by=['key'], key='test_key')
+            self.assertEqual(total['requests'], errors + 4)
+            # (the requests may straddle a minute)
+            self.assertEqual(sum(peak['requests'] for peak in
+                                 store.peak_minutes(n=10)), errors + 4)
+            self.assertEqual(store.usage(function='SECTOR'), [])
+            self.assertIn('limit_used', format_report(
+                store.usage(by=['day']), ['day'], per_day_limit=25))
+            with self.assertRaises(ValueError):
+                store.record('test_key', 'SECTOR', hits=1)
+
+    def test_quota_counting_is_best_effort(self):
+        """ Test that a call whose request cannot be counted (eg. a locked
+        quota store) still returns its data, with a warning
+        """
+        import sqlite3
+        import warnings
+        with tempfile.TemporaryDirectory() as directory:
+            store = QuotaStore(path.join(directory, 'quota.sqlite'))
+            with FakeAlphaVantage() as server, \
+                    mock.patch.object(AlphaVantage, '_ALPHA_VANTAGE_API_URL',
+                                      server.url), \
+                    mock.patch.object(QuotaStore, 'record', side_effect=
+                                      sqlite3.OperationalError(
+                                          'database is locked')), \
+                    warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                ts = TimeSeries(key='test_key', quota=store)
+                data, _ = ts.get_daily('MSFT')
+            self.assertEqual(len(data), 100)
+            self.assertEqual(len(caught), 1)
+            self.assertIn('database is locked', str(caught[0].message))
+
+    def test_decode_stream(self):
+        """ Test that streamed responses decode as json.loads does, with
+        their time series as columns, whatever the chunks
+        """
+        for name in ['mock_time_series', 'mock_crypto_currencies',
+                     'mock_technical_indicator', 'mock_batch_quotes']:
+            with open(recorded_response_path(name), 'rb') as f:
+                payload = f.read()
+            expected = json.loads(payload.decode('utf-8'))
+            for size in [1, 100, len(payload)]:
+                decoded = decode_stream(payload[start:start + size]
+                                        for start in range(0, len(payload),
+                                                           size))
+                self.assertEqual(list(decoded), list(expected))
+                for key, value in decoded.items():
+                    if isinstance(value, TimeSeriesColumns):
+                        # In the document's order, which from_dict sorts
+                        # on older pandas
+                        frame = df.from_dict(expected[key], orient='index',
+                                             dtype=float)
+                        self.assertTrue(value.to_frame().equals(
+                            frame.loc[list(expected[key])]))
+                    else:
+                        self.assertEqual(value, expected[key])
+        series = decode_stream([b'{"S": {"b": {"x": "1", "y": "2"}, ',
+                                b'"a": {"y": "3", "x": "4"}, "c": {"z": "5"}}}']
+                               )['S'].to_frame()
+        self.assertEqual(list(series.index), ['b', 'a', 'c'])
+        self.assertEqual(series.loc['a'].tolist()[:2], [4.0, 3.0])
+        self.assertEqual(series['z'].isnull().sum(), 2)
+        for payload in [b'{"S": {"a": {"x": "1"}}', b'{"S": {"a": {"x": "q"}}}',
+                        b'{"S": {"a": {"x": "1"},}}']:
+            with self.assertRaises(ValueError):
+                decode_stream([payload])
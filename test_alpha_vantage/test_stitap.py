@@ -0,0 +1,637 @@
+import unittest
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+
+import numpy as np
+import pandas as pd
+
+# The stitap modules are scripts run from the alpha_vantage folder
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'alpha_vantage'))
+
+import stitap_ta_indicators
+import stitap_resample
+import stitap_ta_expressions
+import stitap_ranking
+import stitap_returns
+import stitap_backtest
+import stitap_optimize
+import stitap_shared_panel
+import stitap_montecarlo
+import stitap_portfolio
+import stitap_correlation
+import stitap_live
+import stitap_calendar
+import stitap_synthetic
+import stitap_fx
+import stitap_adjust
+import stitap_validate
+
+
+class TestStitap(unittest.TestCase):
+
+    @staticmethod
+    def get_prices(n_sessions=120, n_stocks=4, seed=0):
+        """ Return a random walk price panel (sessions x stocks)
+        """
+        random = np.random.RandomState(seed)
+        returns = random.normal(0, 0.01, size=(n_sessions, n_stocks))
+        return 10 * np.exp(np.cumsum(returns, axis=0))
+
+    @staticmethod
+    def get_synthetic_bars(n_stocks, seed, *loads, **settings):
+        """ Return the bars of synthetic stocks written from 2017-06-01 to 2018-12-31 and loaded back, as one dictionary
+        of stock name to bars per (folder, columns) load, eg. ('backtest_data/daily', ['4. close'])
+        """
+        import tempfile
+        from stitap_loader import load_stock_csvs
+        with tempfile.TemporaryDirectory() as directory:
+            stocks = stitap_synthetic.write_synthetic_data(n_stocks, '2017-06-01', '2018-12-31', directory=directory,
+                                                           max_workers=1, seed=seed, **settings)
+            return [load_stock_csvs(stocks, directory + '/' + folder, columns)[0] for folder, columns in loads]
+
+    @staticmethod
+    def pandas_rsi(prices, timeframe):
+        """ Return the RSI of a price series the way RSIScreener computes it
+        """
+        adjusted_close = pd.DataFrame({'adjusted_close': prices})
+        change = adjusted_close['adjusted_close'].diff(periods=1)
+        gain = change.apply(lambda x: 0 if x < 0 else x)
+        loss = change.apply(lambda x: 0 if x > 0 else -x)
+        mean_gain = gain.rolling(timeframe).mean()
+        mean_loss = loss.rolling(timeframe).mean()
+        adjusted_gain = ((mean_gain.shift(1) * (timeframe - 1)) + gain) / timeframe
+        adjusted_loss = ((mean_loss.shift(1) * (timeframe - 1)) + loss) / timeframe
+        adjusted_gain.iloc[timeframe] = mean_gain.iloc[timeframe]
+        adjusted_loss.iloc[timeframe] = mean_loss.iloc[timeframe]
+        return (100 - (100 / (1 + adjusted_gain / adjusted_loss))).values
+
+    def test_rsi_sweep_matches_screen(self):
+        """ Test that the batched RSI matches the RSI screen for every timeframe
+        """
+        prices = self.get_prices()
+        timeframes = [2, 5, 14, 30]
+        rsi = stitap_ta_indicators.rsi_sweep(prices, timeframes)
+        self.assertEqual(rsi.shape, (4,) + prices.shape)
+        for k, timeframe in enumerate(timeframes):
+            for column in range(prices.shape[1]):
+                np.testing.assert_allclose(rsi[k, :, column],
+                                           self.pandas_rsi(prices[:, column], timeframe))
+
+    def test_rsi_sweep_shorter_history(self):
+        """ Test that a stock padded with NaN values gets the RSI of its own history
+        """
+        prices = self.get_prices()
+        padded = prices.copy()
+        padded[:20, 1] = np.nan
+        rsi = stitap_ta_indicators.rsi(padded, 14)
+        np.testing.assert_allclose(rsi[20:, 1], self.pandas_rsi(prices[20:, 1], 14))
+
+    def test_threshold_signals(self):
+        """ Test that signals are classified for every pair of levels
+        """
+        values = np.array([[75.0, 25.0, 50.0]])
+        signals = stitap_ta_indicators.threshold_signals(values, [70, 80], [30])
+        self.assertEqual(signals.shape, (2, 1, 1, 3))
+        np.testing.assert_array_equal(signals[0, 0, 0], [1, -1, 0])
+        np.testing.assert_array_equal(signals[1, 0, 0], [0, -1, 0])
+
+    def test_resample_daily_weekly(self):
+        """ Test that weekly bars are labelled with the last session of the week and skip public holidays
+        """
+        dates = pd.to_datetime(['2018-03-26', '2018-03-27', '2018-03-28',
+                                '2018-03-29', '2018-03-30', '2018-04-02'])
+        daily = pd.DataFrame({'1. open': [1.0, 2, 3, 4, 5, 6],
+                              '2. high': [2.0, 3, 4, 5, 6, 7],
+                              '3. low': [0.5, 1, 2, 3, 4, 5],
+                              '4. close': [1.5, 2.5, 3.5, 4.5, 5.5, 6.5],
+                              '5. adjusted close': [1.5, 2.5, 3.5, 4.5, 5.5, 6.5],
+                              '6. volume': [10.0, 10, 10, 10, 10, 10],
+                              '7. dividend amount': [0.0, 0, 0.1, 0, 0, 0]},
+                             index=dates)
+        weekly = stitap_resample.resample_daily({'DBS': daily}, 'weekly')['DBS']
+        # 2018-03-30 is Good Friday, so the week ends on Thursday
+        self.assertEqual(list(weekly.index), ['2018-04-02', '2018-03-29'])
+        self.assertEqual(weekly.loc['2018-03-29', '1. open'], 1.0)
+        self.assertEqual(weekly.loc['2018-03-29', '2. high'], 5.0)
+        self.assertEqual(weekly.loc['2018-03-29', '4. close'], 4.5)
+        self.assertEqual(weekly.loc['2018-03-29', '6. volume'], 40.0)
+        self.assertAlmostEqual(weekly.loc['2018-03-29', '7. dividend amount'], 0.1)
+
+    def test_ema_matches_pandas(self):
+        """ Test that the EMA matches pandas' ewm for stocks with a shorter history
+        """
+        prices = self.get_prices()
+        prices[:10, 2] = np.nan
+        ema = stitap_ta_indicators.ema(prices, 12)
+        for column in range(prices.shape[1]):
+            expected = pd.Series(prices[:, column]).ewm(span=12, min_periods=12, adjust=False).mean()
+            np.testing.assert_allclose(ema[:, column], expected.values)
+
+    def test_parse_screen(self):
+        """ Test that screen text is parsed with AND binding tighter than OR, cheapest conditions first
+        """
+        screen = stitap_ta_expressions.parse_screen(
+            'rsi(14) < 30 and macd bullish or volume_change(5) > 50')
+        self.assertEqual(str(screen),
+                         'VOLUME_CHANGE(5) > 50 OR RSI(14) < 30 AND MACD(12, 26, 9) BULLISH')
+        for text in ['RSI(14) <', 'MACD UP', 'FOO(1) > 2', 'RSI(14) = 30']:
+            with self.assertRaises(ValueError):
+                stitap_ta_expressions.parse_screen(text)
+
+    def test_screen_short_circuit(self):
+        """ Test that later conditions are only computed for stocks passing earlier ones
+        """
+        prices = self.get_prices(n_stocks=6)
+        volumes = np.ones_like(prices)
+        volumes[-1, :2] = 2
+        context = stitap_ta_expressions.ScreenContext(prices, volumes, list('ABCDEF'))
+        screen = stitap_ta_expressions.parse_screen('RSI(14) >= 0 AND VOLUME_CHANGE(1) > 50')
+        self.assertEqual(screen.run(context), ['A', 'B'])
+        self.assertEqual(context.computed_stocks[('rsi', 14)], 2)
+
+    def test_ranking_index_matches_nlargest(self):
+        """ Test that top and bottom lookups match nlargest and nsmallest, within sectors too
+        """
+        df = pd.DataFrame({'stock_name_no_spaces': ['DBS', 'UOB', 'SGX', 'OCBC_Bank', 'SIA'],
+                           'price_daily_pct_change': [1.0, -2.0, 1.0, np.nan, 3.0]})
+        ranking = stitap_ranking.RankingIndex(df)
+        for n in [1, 3, 5]:
+            pd.testing.assert_frame_equal(ranking.top('price_daily_pct_change', n),
+                                          df.nlargest(n, 'price_daily_pct_change'))
+            pd.testing.assert_frame_equal(ranking.bottom('price_daily_pct_change', n),
+                                          df.nsmallest(n, 'price_daily_pct_change'))
+        banks = stitap_ranking.sector_subset('Banks')
+        self.assertEqual(list(ranking.top('price_daily_pct_change', 5, subset=banks)['stock_name_no_spaces']),
+                         ['DBS', 'UOB', 'OCBC_Bank'])
+
+    def test_return_engine_matches_pct_change(self):
+        """ Test that percentage changes over any period and end date match pandas' pct_change
+        """
+        prices = self.get_prices(n_sessions=30, n_stocks=2)
+        prices[:10, 1] = np.nan
+        dates = pd.bdate_range('2018-01-01', periods=30)
+        engine = stitap_returns.ReturnEngine(prices, prices * 1000, {'DBS': dates, 'UOB': dates[10:]})
+        expected = pd.DataFrame(prices, index=dates).pct_change(periods=7) * 100
+        np.testing.assert_allclose(engine.pct_change(7), expected.iloc[-1].values)
+        np.testing.assert_allclose(engine.pct_change(7, end=dates[20]), expected.iloc[20].values)
+        np.testing.assert_allclose(engine.pct_change_history('weekly', attribute='volume'),
+                                   (pd.DataFrame(prices).pct_change(periods=5) * 100).values)
+        self.assertEqual(engine.n_sessions, 30)
+        # UOB's history starts on the 11th session
+        self.assertTrue(np.isnan(engine.pct_change(7, end=dates[15])[1]))
+        with self.assertRaises(ValueError):
+            engine.pct_change(0)
+
+    def test_screen_history_sessions(self):
+        """ Test that screens needing more sessions than a compact fetch fetch the full history once, then extend it
+        """
+        import os
+        import tempfile
+        from unittest import mock
+        import run
+
+        class FakeTimeSeries:
+            def __init__(self, bars):
+                self.bars = bars
+                self.outputsizes = []
+
+            def get_daily_adjusted(self, symbol, outputsize):
+                self.outputsizes.append(outputsize)
+                return (self.bars.iloc[:100] if outputsize == 'compact' else self.bars).copy(), None
+
+        daily, = self.get_synthetic_bars(1, 12, ('backtest_data/daily', stitap_adjust.daily_columns))
+        bars = next(iter(daily.values()))
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(directory + '/sti_stock_data/original_data/daily')
+            os.chdir(directory)
+            try:
+                for sessions, outputsizes in ((100, ['compact']), (251, ['full']), (251, ['compact'])):
+                    with mock.patch.object(run, 'TimeSeries', lambda **kwargs: FakeTimeSeries(bars)):
+                        initializer = run.ScreenInitializer(sessions=sessions)
+                    initializer._fetch_store('DBS', 'D05.SI')
+                    self.assertEqual(initializer._ts.outputsizes, outputsizes)
+                # The last stored session is found in the latest bars, and the day after it is not
+                self.assertTrue(initializer.has_session(bars.index[0].date()))
+                self.assertFalse(initializer.has_session((bars.index[0] + pd.Timedelta(days=1)).date()))
+                stored = pd.read_csv('sti_stock_data/original_data/daily/DBS.csv', index_col=0)
+            finally:
+                os.chdir(working_directory)
+        self.assertEqual(len(stored), len(bars))
+
+    def test_macd_screener_crossovers(self):
+        """ Test that MACDScreener reports the MACD line crossing above its signal line as bullish, as the composite
+        screens do
+        """
+        import io
+        from contextlib import redirect_stdout
+        from unittest import mock
+        import stitap_ta_screens
+        prices = self.get_prices(n_sessions=60, n_stocks=200, seed=4)
+        bullish, bearish = stitap_ta_indicators.crossovers(*stitap_ta_indicators.macd(prices))
+        self.assertTrue(bullish[-1].any() and bearish[-1].any())
+        screener = stitap_ta_screens.MACDScreener.__new__(stitap_ta_screens.MACDScreener)
+        screener._sti_stocks_adjusted_close = {column: pd.DataFrame({'adjusted_close': prices[:, column]})
+                                               for column in range(prices.shape[1])}
+        output = io.StringIO()
+        with mock.patch.object(stitap_ta_screens.time, 'sleep'), redirect_stdout(output):
+            screener._screen()
+        output = output.getvalue()
+        self.assertEqual({column for column in range(prices.shape[1]) if f'MACD BULLISH CROSSOVER DETECTED: {column}\n' in output},
+                         set(np.flatnonzero(bullish[-1])))
+        self.assertEqual({column for column in range(prices.shape[1]) if f'MACD BEARISH CROSSOVER DETECTED: {column}\n' in output},
+                         set(np.flatnonzero(bearish[-1])))
+
+    def test_stoch_rsi_matches_pandas(self):
+        """ Test that the StochRSI of every session matches rolling max and min of the RSI
+        """
+        prices = self.get_prices()
+        rsi = pd.Series(self.pandas_rsi(prices[:, 0], 14))
+        expected = (rsi - rsi.rolling(14).min()) / (rsi.rolling(14).max() - rsi.rolling(14).min())
+        np.testing.assert_allclose(stitap_ta_indicators.stoch_rsi(prices, 14)[:, 0], expected.values)
+
+    def test_backtest_positions_and_costs(self):
+        """ Test that positions are held from the session after an entry until an exit, net of fees and slippage
+        """
+        entries = np.array([[False], [True], [False], [True], [False], [False]])
+        exits = np.array([[False], [False], [False], [False], [True], [False]])
+        np.testing.assert_array_equal(stitap_backtest.positions_from_signals(entries, exits)[:, 0],
+                                      [0, 1, 1, 1, 0, 0])
+        prices = np.array([[10.0], [10], [11], [12.1], [12.1], [6]])
+        result = stitap_backtest.run_backtest(prices, entries, exits, fees_bps=10, slippage_bps=10)
+        np.testing.assert_allclose(result.returns[:, 0], [0, -0.002, 0.1, 0.1, -0.002, 0])
+        self.assertEqual(result.stock_summary()['trades'].iloc[0], 1)
+        self.assertAlmostEqual(result.portfolio_summary()['total_return_pct'],
+                               (0.998 * 1.1 * 1.1 * 0.998 - 1) * 100)
+
+    def test_walk_forward_splits(self):
+        """ Test that test windows follow their train windows and cover the end of the history
+        """
+        splits = stitap_optimize.walk_forward_splits(100, n_splits=4)
+        self.assertEqual(splits[0], (slice(0, 20), slice(20, 40)))
+        self.assertEqual(splits[-1], (slice(0, 80), slice(80, 100)))
+        self.assertEqual(stitap_optimize.walk_forward_splits(100, n_splits=4, train_sessions=30)[-1][0], slice(50, 80))
+        with self.assertRaises(ValueError):
+            stitap_optimize.walk_forward_splits(3, n_splits=4)
+
+    def test_optimize_matches_backtest(self):
+        """ Test that the optimizer's workers summarize the same backtests as the backtest engine
+        """
+        prices = self.get_prices(n_sessions=300, n_stocks=3)
+        parameter_sets = stitap_optimize.parameter_grid(
+            'RSI', {'timeframe': [7, 14], 'overbought_level': [70], 'oversold_level': [30, 80]})
+        self.assertEqual(len(parameter_sets), 2)
+        results = stitap_optimize.optimize(prices, 'RSI', parameter_sets, n_splits=2, max_workers=1)
+        self.assertEqual(len(results), 4)
+        row = results[(results['timeframe'] == 14) & (results['split'] == 1)].iloc[0]
+        expected = stitap_backtest.backtest(prices, 'RSI', timeframe=14).portfolio_summary(slice(200, 300))
+        self.assertAlmostEqual(row['test_total_return_pct'], expected['total_return_pct'])
+
+    def test_shared_panel_attach(self):
+        """ Test that workers attach to a published panel without copying it, for both backends
+        """
+        prices = self.get_prices(n_stocks=3)
+        for backend in ['shared_memory', 'memmap']:
+            with stitap_shared_panel.SharedPanel(prices, columns=list('ABC'), backend=backend) as shared_prices:
+                descriptor = shared_prices.descriptor
+                self.assertEqual(descriptor.columns, ('A', 'B', 'C'))
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    np.testing.assert_array_equal(executor.submit(stitap_shared_panel.attach, descriptor).result(), prices)
+                attached = stitap_shared_panel.attach(descriptor)
+                self.assertFalse(attached.flags.writeable)
+                shared_prices.array[0, 0] = -1
+                self.assertEqual(attached[0, 0], -1)
+                del attached
+                stitap_shared_panel.detach(descriptor)
+
+    def test_block_bootstrap_indices(self):
+        """ Test that resampled histories are made of blocks of consecutive sessions
+        """
+        sessions = stitap_montecarlo.block_bootstrap_indices(10, 50, 4, np.random.default_rng(0))
+        self.assertEqual(sessions.shape, (50, 10))
+        self.assertTrue((sessions.max() < 10) and (sessions.min() >= 0))
+        np.testing.assert_array_equal(np.diff(sessions[:, :4], axis=1), 1)
+
+    def test_bootstrap_backtest_whole_history(self):
+        """ Test that resampling the whole history as one block reproduces the actual backtest
+        """
+        prices = self.get_prices(n_sessions=80, n_stocks=3)
+        prices[:10, 2] = np.nan
+        actual, resamples = stitap_montecarlo.bootstrap_backtest(prices, 'RSI', n_resamples=5, block_length=80,
+                                                                 seed=0, max_cells=500, timeframe=5)
+        self.assertEqual(len(resamples), 5)
+        expected = stitap_backtest.backtest(prices, 'RSI', timeframe=5).portfolio_summary()
+        self.assertAlmostEqual(actual['total_return_pct'], expected['total_return_pct'])
+        np.testing.assert_allclose(resamples['total_return_pct'], expected['total_return_pct'])
+        intervals = stitap_montecarlo.confidence_intervals(resamples, actual)
+        self.assertAlmostEqual(intervals.loc['trades', 'median'], expected['trades'])
+        # Resampling the strategy's returns as one block reproduces them too, without re-running the strategy
+        actual, resamples = stitap_montecarlo.bootstrap_strategy_returns(prices, 'RSI', n_resamples=5, block_length=80,
+                                                                         seed=0, max_cells=200, timeframe=5)
+        self.assertEqual(len(resamples), 5)
+        self.assertAlmostEqual(actual['sharpe_ratio'], expected['sharpe_ratio'])
+        np.testing.assert_allclose(resamples['max_drawdown_pct'], expected['max_drawdown_pct'])
+
+    def test_portfolio_rebalancing(self):
+        """ Test that daily equal weight rebalances earn the mean return and that costs are paid on turnover
+        """
+        prices = self.get_prices(n_sessions=60, n_stocks=3)
+        dates = pd.bdate_range('2018-01-01', periods=60)
+        selection = np.ones(prices.shape, dtype=bool)
+        result = stitap_portfolio.simulate_portfolio(prices, selection, dates, schedule='daily', fees_bps=0, slippage_bps=0)
+        np.testing.assert_allclose(result.returns[1:], (prices[1:] / prices[:-1] - 1).mean(axis=1))
+        np.testing.assert_allclose(result.weights[5], 1 / 3)
+
+        result = stitap_portfolio.simulate_portfolio(prices, selection, dates, schedule='monthly', fees_bps=10, slippage_bps=0)
+        rebalances = stitap_portfolio.rebalance_sessions(dates, 'monthly')
+        self.assertEqual(list(dates[rebalances].month), [1, 2, 3])
+        self.assertTrue((result.turnover[~rebalances] == 0).all())
+        self.assertAlmostEqual(result.to_frame()['costs'].iloc[np.flatnonzero(rebalances)[0]], 100000 * 0.001)
+        self.assertTrue((result.shares[:np.flatnonzero(rebalances)[0]] == 0).all())
+
+    def test_rolling_correlation_matches_pandas(self):
+        """ Test that incremental correlations match pandas over every window and cluster co-moving stocks
+        """
+        prices = self.get_prices(n_sessions=90, n_stocks=4)
+        prices[:, 1] = prices[:, 0] * np.exp(self.get_prices(n_sessions=90, n_stocks=1, seed=1)[:, 0] / 1000)
+        prices[:40, 3] = np.nan
+        rolling = stitap_correlation.RollingCorrelation.from_prices(prices[:30], window=20)
+        for session in range(30, 90):
+            rolling.update(prices[session])
+            returns = pd.DataFrame(prices[:session + 1]).pct_change(fill_method=None).iloc[-20:]
+            np.testing.assert_allclose(rolling.correlation(), returns.corr().values, atol=1e-10)
+            np.testing.assert_allclose(rolling.covariance(), returns.cov().values, atol=1e-12)
+        clusters = stitap_correlation.cluster_stocks(rolling.correlation(), min_correlation=0.9)
+        self.assertEqual(clusters[0], [0, 1])
+        self.assertEqual(len(stitap_correlation.cluster_stocks(rolling.correlation(), n_clusters=2)), 2)
+
+    def test_live_screen_incremental(self):
+        """ Test that polled bars are processed once and that live indicators match the vectorized ones
+        """
+        closes = self.get_prices(n_sessions=150, n_stocks=1)[:, 0]
+        times = np.datetime64('2018-07-19 09:00', 's') + np.arange(150) * np.timedelta64(300, 's')
+        feed = stitap_live.ReplayFeed({'A': (times, closes, np.ones(150))}, bars_per_fetch=7, compact_size=20)
+        clock = [0.0]
+        live = stitap_live.LiveScreen(feed, {'a': 'A'}, calls_per_minute=6, emit_history=True,
+                                      clock=lambda: clock[0], sleep=lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+        events = []
+        for _ in range(25):
+            events += live.poll_round()
+        self.assertEqual(live.n_processed, 150)
+        self.assertAlmostEqual(clock[0], 24 * 10)
+        state = live.states['a']
+        self.assertAlmostEqual(state.rsi, stitap_ta_indicators.rsi(closes[:, None], 14)[-1, 0])
+        macd_line, signal_line = stitap_ta_indicators.macd(closes[:, None])
+        np.testing.assert_allclose(state.macd, (macd_line[-1, 0], signal_line[-1, 0]))
+        bullish, _ = stitap_ta_indicators.crossovers(macd_line, signal_line)
+        self.assertEqual(sum(event.event == 'MACD BULLISH' for event in events), bullish.sum())
+
+    def test_next_sgx_close(self):
+        """ Test that scheduled refreshes skip weekends and public holidays
+        """
+        from datetime import datetime, timedelta, timezone
+        before_holiday = datetime(2018, 8, 8, 18, 0, tzinfo=stitap_calendar.sgx_timezone)
+        self.assertEqual(stitap_calendar.next_sgx_close(before_holiday),
+                         datetime(2018, 8, 10, 17, 30, tzinfo=stitap_calendar.sgx_timezone))
+        friday_evening = datetime(2018, 8, 10, 12, 0, tzinfo=timezone.utc)
+        self.assertEqual(stitap_calendar.next_sgx_close(friday_evening),
+                         datetime(2018, 8, 13, 17, 30, tzinfo=stitap_calendar.sgx_timezone))
+        # Holidays of other years are skipped when the scheduled refresh finds no session
+        import stitap_daemon
+        from datetime import date
+        holiday_close = datetime(2019, 8, 9, 17, 30, tzinfo=stitap_calendar.sgx_timezone)
+        self.assertEqual(stitap_calendar.next_sgx_close(holiday_close - timedelta(hours=1)), holiday_close)
+        service = stitap_daemon.ScreenService(has_session=lambda day: day != date(2019, 8, 9))
+        refreshes = []
+        service.refresh = lambda: refreshes.append(True)
+        self.assertFalse(service.scheduled_refresh(holiday_close))
+        self.assertTrue(service.scheduled_refresh(holiday_close + timedelta(days=3)))
+        self.assertEqual(len(refreshes), 1)
+
+    def test_screen_service(self):
+        """ Test that the screen service answers screens, rankings and its status, and rejects bad requests
+        """
+        import os
+        import tempfile
+        import stitap_daemon
+        import stitap_ta_screens
+        saved_stocks = dict(stitap_ta_screens.sti_stocks)
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            stocks = stitap_synthetic.write_synthetic_data(5, '2018-01-01', '2018-07-18', directory=directory + '/sti_stock_data',
+                                                           timeframes=('daily',), layouts={'original_data': None},
+                                                           max_workers=1, seed=5, listing_fraction=0)
+            os.chdir(directory)
+            stitap_ta_screens.sti_stocks.clear()
+            stitap_ta_screens.sti_stocks.update(stocks)
+            stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+            try:
+                service = stitap_daemon.ScreenService()
+                service.load()
+                loads = stitap_ta_screens.PrepareTechnicalAnalysis.instance().loads
+                service.load()
+                # A reload reads the data once more, unless it was reloaded since the state was built
+                self.assertEqual(service.state.loads, loads + 1)
+                stitap_ta_screens.PrepareTechnicalAnalysis.instance(refresh=True)
+                service.load()
+                self.assertEqual(service.state.loads, loads + 2)
+            finally:
+                os.chdir(working_directory)
+                stitap_ta_screens.sti_stocks.clear()
+                stitap_ta_screens.sti_stocks.update(saved_stocks)
+                stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+
+        status, body = service.handle('GET', '/status')
+        self.assertEqual((status, body['stocks'], body['latest_date']), (200, 5, '2018-07-18'))
+        status, body = service.handle('GET', '/screen?q=RSI(14)%20%3E%200')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['stock_name'] for row in body['passed']], list(stocks))
+        self.assertTrue(all(0 < row['RSI(14)'] < 100 for row in body['passed']))
+        status, body = service.handle('GET', '/top?attribute=volume&timeframe=weekly&n=2')
+        self.assertEqual((status, len(body['top']), len(body['bottom'])), (200, 2, 2))
+        # Rankings name stocks as screens do
+        self.assertTrue(set(row['stock_name'] for row in body['top'] + body['bottom']) <= set(stocks))
+        self.assertEqual(service.handle('GET', '/top?timeframe=5')[0], 200)
+        for url in ['/screen', '/screen?q=RSI(14)%20%3C', '/top?attribute=turnover', '/top?sector=Nowhere',
+                    '/top?timeframe=yearly']:
+            status, body = service.handle('GET', url)
+            self.assertEqual(status, 400, url)
+            self.assertIn('error', body)
+        self.assertEqual(service.handle('GET', '/unknown')[0], 404)
+        self.assertEqual(service.handle('POST', '/screen?q=RSI(14)%20%3C%2030')[0], 404)
+
+    def test_synthetic_data_layouts(self):
+        """ Test that synthetic data is written in the initializers' layouts, back-adjusted and resampled like real data
+        """
+        daily, compact, weekly = self.get_synthetic_bars(6, 7, ('backtest_data/daily', stitap_synthetic.daily_columns),
+                                                         ('original_data/daily', ['4. close']),
+                                                         ('backtest_data/weekly', list(stitap_resample.resample_aggregations)),
+                                                         chunk_size=4, splits_per_year=2)
+        resampled = stitap_resample.resample_daily(daily, 'weekly')
+        for stock_name, bars in daily.items():
+            self.assertTrue(bars.index.is_monotonic_decreasing)
+            self.assertFalse(bars.index.isin(stitap_calendar.sgx_holidays()).any())
+            self.assertEqual(len(compact[stock_name]), 100)
+            self.assertTrue((bars['2. high'] >= bars[['1. open', '4. close']].max(axis=1)).all())
+            # Adjusted closes are back-adjusted for every later dividend and split
+            chronological = bars.iloc[::-1]
+            adjustments = (1 - chronological['7. dividend amount'] / chronological['4. close'].shift(1).fillna(1)) \
+                / chronological['8. split coefficient']
+            later = adjustments[::-1].cumprod()[::-1].shift(-1).fillna(1)
+            np.testing.assert_allclose(chronological['5. adjusted close'], chronological['4. close'] * later, atol=1e-4)
+            np.testing.assert_allclose(weekly[stock_name].to_numpy(), resampled[stock_name].to_numpy(float), rtol=1e-4)
+        self.assertGreater(sum((bars['8. split coefficient'] != 1).sum() for bars in daily.values()), 0)
+
+    def test_data_validation(self):
+        """ Test that gaps, duplicate dates, bad bars, volume outliers and stale data are counted and quarantined
+        """
+        daily, = self.get_synthetic_bars(8, 3, ('backtest_data/daily', stitap_validate.price_columns + ['6. volume']),
+                                         listing_fraction=0)
+        report = stitap_validate.validate_bars(daily)
+        self.assertEqual(report[stitap_validate.checks].to_numpy().sum(), 0)
+        self.assertEqual(stitap_validate.quarantined(report), [])
+        self.assertEqual(stitap_validate.format_report(report), 'VALIDATED: 8 STOCKS, 0 FLAGGED, 0 QUARANTINED')
+
+        names = list(daily)
+        daily[names[0]] = pd.concat([daily[names[0]], daily[names[0]].iloc[[10, 20]]])
+        daily[names[1]] = daily[names[1]].drop(daily[names[1]].index[50:55])
+        daily[names[2]] = daily[names[2]].copy()
+        daily[names[2]].iloc[30, 0] = 0.0
+        daily[names[2]].iloc[40, 2] = daily[names[2]].iloc[40, 1] * 2
+        daily[names[3]] = daily[names[3]].copy()
+        daily[names[3]].iloc[60, 5] *= 1e6
+        daily[names[4]] = daily[names[4]].iloc[3:]
+        daily[names[5]] = daily[names[5]].rename(index={daily[names[5]].index[70]: pd.Timestamp('2018-06-02')})
+        daily[names[6]] = daily[names[6]].iloc[:0]
+        report = stitap_validate.validate_bars(daily)
+        self.assertEqual(report.loc[names[0], 'duplicate_dates'], 2)
+        self.assertEqual(report.loc[names[1], ['missing_sessions', 'longest_gap']].tolist(), [5, 5])
+        self.assertEqual(report.loc[names[2], ['bad_prices', 'bad_ranges']].tolist(), [1, 2])
+        self.assertEqual(report.loc[names[3], 'volume_outliers'], 1)
+        self.assertEqual(report.loc[names[4], 'stale_sessions'], 3)
+        self.assertEqual(report.loc[names[5], ['off_calendar', 'missing_sessions']].tolist(), [1, 1])
+        self.assertEqual(report.loc[names[6], 'sessions'], 0)
+        self.assertEqual(report.loc[names[7], stitap_validate.checks].sum(), 0)
+        self.assertEqual(stitap_validate.quarantined(report), [names[0], names[1], names[2], names[4], names[5], names[6]])
+        self.assertEqual(list(stitap_validate.flagged(report).index), names[:7])
+        reasons = stitap_validate.quarantine_reasons(report)
+        self.assertEqual(list(reasons), stitap_validate.quarantined(report))
+        self.assertEqual(reasons[names[1]], 'longest_gap 5')
+        self.assertEqual(reasons[names[2]], 'bad_prices 1, bad_ranges 2')
+        self.assertEqual(reasons[names[6]], 'no bars')
+        # Limits are overridable, eg. to only flag stale data
+        report = stitap_validate.validate_bars(daily, limits={'stale_sessions': None})
+        self.assertNotIn(names[4], stitap_validate.quarantined(report))
+        # Data not up to date with as_of is stale
+        as_of = daily[names[7]].index.max() + pd.Timedelta(days=7)
+        report = stitap_validate.validate_bars({names[7]: daily[names[7]]}, as_of=as_of)
+        self.assertEqual(report.loc[names[7], 'stale_sessions'], 5)
+
+    def test_adjusted_close_reconstruction(self):
+        """ Test that adjusted closes are rebuilt from the closes, dividends and splits, and stored histories extended
+        """
+        daily, = self.get_synthetic_bars(3, 11, ('backtest_data/daily', stitap_adjust.daily_columns), splits_per_year=2)
+        bars = next(iter(daily.values()))
+        np.testing.assert_allclose(stitap_adjust.adjust_bars(bars)['5. adjusted close'], bars['5. adjusted close'],
+                                   atol=1e-4)
+        # A dividend going ex in the recently fetched sessions changes every earlier adjusted close
+        recent = bars.iloc[:100].copy()
+        recent.iloc[10, recent.columns.get_loc('7. dividend amount')] += 0.05
+        stored = bars.iloc[50:]
+        full = pd.concat([recent, bars.iloc[100:]])
+        extended = stitap_adjust.extend_history(stored, recent)
+        self.assertEqual(list(extended.index), list(bars.index))
+        np.testing.assert_allclose(extended['5. adjusted close'], stitap_adjust.adjust_bars(full)['5. adjusted close'])
+        self.assertLess(extended['5. adjusted close'].iloc[-1], bars['5. adjusted close'].iloc[-1])
+        # Recent sessions which do not overlap or disagree with the stored ones need the full history
+        self.assertIsNone(stitap_adjust.extend_history(bars.iloc[150:], recent))
+        revised = recent.copy()
+        revised.iloc[60, revised.columns.get_loc('4. close')] *= 1.1
+        self.assertIsNone(stitap_adjust.extend_history(stored, revised))
+        # Total return index: reinvesting a dividend of half the previous close doubles the holding
+        index = stitap_adjust.total_return_index([10.0, 10.0, 5.0, 5.0], [0.0, 0.0, 5.0, 0.0], [1.0, 1.0, 1.0, 1.0])
+        np.testing.assert_allclose(index, [1.0, 1.0, 1.0, 1.0])
+        index = stitap_adjust.total_return_index([10.0, 10.0, 5.0, 5.0], [0.0, 0.0, 0.0, 0.0], [1.0, 1.0, 2.0, 1.0])
+        np.testing.assert_allclose(index, [1.0, 1.0, 1.0, 1.0])
+
+    def test_fx_conversion(self):
+        """ Test that each currency pair is fetched once within the time to live, and only the columns of stocks
+        quoted in that currency are converted
+        """
+        from datetime import timedelta
+
+        class FakeForeignExchange:
+            key = "test"
+            quota = None
+
+            def __init__(self):
+                self.calls = []
+
+            def get_currency_exchange_rate(self, from_currency, to_currency):
+                self.calls.append((from_currency, to_currency))
+                return {"5. Exchange Rate": "1.3500"}, None
+
+        self.assertEqual(stitap_fx.stock_currency("HPH Trust USD"), "USD")
+        self.assertEqual(stitap_fx.stock_currency("Golden Agri-Res"), "SGD")
+        self.assertEqual(stitap_fx.currency_groups(["DBS", "JSH USD", "UOB", "JMH USD"]), {"SGD": [0, 2], "USD": [1, 3]})
+        foreign_exchange = FakeForeignExchange()
+        fx_rates = stitap_fx.FXRates(foreign_exchange)
+        panel = pd.DataFrame([[10.0, 20.0, 30.0], [11.0, 22.0, np.nan]], columns=["DBS", "JSH USD", "JMH USD"])
+        converted = fx_rates.convert_panel(panel)
+        fx_rates.convert_panel(panel)
+        self.assertEqual(foreign_exchange.calls, [("USD", "SGD")])
+        np.testing.assert_allclose(converted.values, [[10.0, 27.0, 40.5], [11.0, 29.7, np.nan]])
+        self.assertEqual(panel.iloc[0, 1], 20.0)
+        converted = fx_rates.convert_panel(panel, currencies={"DBS": "USD", "JSH USD": "SGD"})
+        np.testing.assert_allclose(converted.iloc[0].values, [13.5, 20.0, 40.5])
+        stitap_fx.FXRates(foreign_exchange, ttl=timedelta(0)).convert_panel(panel)
+        self.assertEqual(len(foreign_exchange.calls), 2)
+        self.assertEqual(fx_rates.stock_rates(["DBS", "JSH USD", "JMH USD"]), {"JSH USD": 1.35, "JMH USD": 1.35})
+
+    def test_prepare_fx_conversion(self):
+        """ Test that the prepared adjusted closes and their panel are converted alike, and kept as quoted when the
+        exchange rates cannot be fetched
+        """
+        import os
+        import tempfile
+        import stitap_ta_screens
+
+        class FakeFXRates:
+            def __init__(self, rates):
+                self.rates = rates
+
+            def stock_rates(self, stock_names):
+                if self.rates is None:
+                    raise ValueError("Thank you for using Alpha Vantage!")
+                return self.rates
+
+        saved_stocks = dict(stitap_ta_screens.sti_stocks)
+        working_directory = os.getcwd()
+        prepared = {}
+        with tempfile.TemporaryDirectory() as directory:
+            stocks = stitap_synthetic.write_synthetic_data(3, '2018-01-01', '2018-03-30', directory=directory + '/sti_stock_data',
+                                                           timeframes=('daily',), layouts={'original_data': None},
+                                                           max_workers=1, seed=6, listing_fraction=0)
+            os.chdir(directory)
+            stitap_ta_screens.sti_stocks.clear()
+            stitap_ta_screens.sti_stocks.update(stocks)
+            try:
+                for name, rates in (('quoted', None), ('converted', {'Synthetic 00002': 2.0})):
+                    stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+                    stitap_ta_screens.PrepareTechnicalAnalysis.fx_rates = FakeFXRates(rates)
+                    prepared[name] = stitap_ta_screens.PrepareTechnicalAnalysis.instance()
+            finally:
+                os.chdir(working_directory)
+                stitap_ta_screens.sti_stocks.clear()
+                stitap_ta_screens.sti_stocks.update(saved_stocks)
+                stitap_ta_screens.PrepareTechnicalAnalysis._instance = None
+                stitap_ta_screens.PrepareTechnicalAnalysis.fx_rates = None
+
+        quoted, converted = prepared['quoted'], prepared['converted']
+        self.assertEqual(list(quoted.sti_stocks_adjusted_close), list(stocks))
+        for stock_name, rate in (('Synthetic 00001', 1.0), ('Synthetic 00002', 2.0)):
+            np.testing.assert_allclose(converted.sti_stocks_adjusted_close[stock_name].values,
+                                       quoted.sti_stocks_adjusted_close[stock_name].values * rate)
+            np.testing.assert_allclose(converted.adjusted_close_panel[stock_name].values,
+                                       quoted.adjusted_close_panel[stock_name].values * rate)